@@ -29,9 +29,13 @@ from datetime import datetime, timedelta
 # Import salt testing libs
 from salttesting.unit import TestCase
 from salttesting.helpers import RedirectStdStreams
+from salttesting.cgroups import join_cgroup_from_env
 from salttesting.runtests import RUNTIME_VARS
 from salttesting.mixins import AdaptedConfigurationTestCaseMixIn, SaltClientTestCaseMixIn
 
+# Import 3rd-party libs
+import six
+
 # Try to import salt: needed for __salt_system_encoding__ reference
 try:
     current_module_names = sys.modules.keys()
@@ -71,6 +75,155 @@ SCRIPT_TEMPLATES = {
 log = logging.getLogger(__name__)
 
 
+def iter_job_returns(client, jids, timeout=25):
+    '''
+    Iterate over the job returns fired on the master event bus for any of the
+    provided ``jids``, yielding ``(jid, minion_id, return_data)`` tuples as
+    they arrive.
+
+    The iteration stops once ``timeout`` seconds have passed. It's up to the
+    caller to stop consuming the generator sooner, once it got all the
+    returns it's interested in.
+    '''
+    jids = set(jids)
+    stop_at = time.time() + timeout
+    while jids:
+        wait = stop_at - time.time()
+        if wait <= 0:
+            break
+        event = client.event.get_event(wait=min(wait, 1), tag='salt/job/', full=True)
+        if not event:
+            continue
+        # Job return tags look like salt/job/<jid>/ret/<minion_id>
+        tag_parts = event['tag'].split('/')
+        if len(tag_parts) < 5 or tag_parts[3] != 'ret' or tag_parts[2] not in jids:
+            continue
+        data = event['data']
+        yield tag_parts[2], data.get('id', tag_parts[4]), data.get('return')
+
+
+class PendingFunctionCall(object):
+    '''
+    A salt function published by :meth:`ModuleCase.run_function_async` whose
+    return is yet to be collected.
+    '''
+
+    def __init__(self, testcase, client, function, minion_tgt, jid, timeout):
+        self.testcase = testcase
+        self.client = client
+        self.function = function
+        self.minion_tgt = minion_tgt
+        self.jid = jid
+        self.timeout = timeout
+        self.stop_at = time.time() + timeout
+        # Same format as the LocalClient.cmd() return, {minion_id: return}
+        self.returns = {}
+        self.done = False
+
+    def result(self):
+        '''
+        Wait for, and return, this call's conditioned return
+        '''
+        return self.testcase.gather_functions(self)[0]
+
+    def __repr__(self):
+        return '<{0} {1} on {2!r} jid={3}>'.format(
+            self.__class__.__name__, self.function, self.minion_tgt, self.jid
+        )
+
+
+class StateLockManager(object):
+    '''
+    Find and kill the stalled state jobs which hold a minion's state lock.
+
+    All the stalled jobs found are looked up and killed in batches, ie, the
+    ``saltutil.find_job`` and ``saltutil.kill_job`` calls are all published
+    at once and their returns collected concurrently from the event bus,
+    instead of one full round-trip per call and per job.
+    '''
+
+    def __init__(self, testcase, minion_tgt='minion', timeout=25):
+        self.testcase = testcase
+        self.minion_tgt = minion_tgt
+        self.timeout = timeout
+
+    @staticmethod
+    def find_stalled_jids(ret):
+        '''
+        Return the jids, in order, of the running state functions which were
+        reported on ``ret``
+        '''
+        jids = []
+        if not isinstance(ret, list):
+            return jids
+        for item in ret:
+            if not isinstance(item, six.string_types):
+                # We don't know how to handle this
+                continue
+            match = STATE_FUNCTION_RUNNING_RE.match(item)
+            if not match:
+                # We don't know how to handle this
+                continue
+            jid = match.group('jid')
+            if jid not in jids:
+                jids.append(jid)
+        return jids
+
+    def run_batch(self, function, jids):
+        '''
+        Run ``function`` for each of the passed jids concurrently and return a
+        dictionary mapping each jid to it's return
+        '''
+        calls = [
+            self.testcase.run_function_async(
+                function, [jid], minion_tgt=self.minion_tgt, timeout=self.timeout
+            ) for jid in jids
+        ]
+        return dict(zip(jids, self.testcase.gather_functions(*calls)))
+
+    def release(self, jids, wait=False, wait_timeout=30):
+        '''
+        Kill the stalled jobs and return a list of
+        ``(jid, job_data, kill_return)`` tuples.
+
+        If ``wait`` is ``True``, only return after the jobs are gone, or
+        ``wait_timeout`` seconds have passed.
+        '''
+        job_data = self.run_batch('saltutil.find_job', jids)
+        job_kill = self.run_batch('saltutil.kill_job', jids)
+        if wait and not self.wait_for_release(jids, timeout=wait_timeout):
+            log.warning(
+                'The state lock held by the jobs %s on %r was not released after %s seconds',
+                ', '.join(jids), self.minion_tgt, wait_timeout
+            )
+        return [(jid, job_data[jid], job_kill[jid]) for jid in jids]
+
+    def wait_for_release(self, jids, timeout=30):
+        '''
+        Wait for the stalled jobs to go away.
+
+        A stalled job which still manages to return is seen on the event bus
+        right away, the remaining ones get confirmed gone with a single
+        ``saltutil.find_job`` batch each second.
+        '''
+        pending = set(jids)
+        stop_at = time.time() + timeout
+        client = self.testcase.async_client
+        while pending:
+            remaining = stop_at - time.time()
+            if remaining <= 0:
+                break
+            for jid, minion_id, _ in iter_job_returns(client, pending, min(remaining, 1)):
+                if minion_id == self.minion_tgt:
+                    pending.discard(jid)
+                    if not pending:
+                        break
+            if pending:
+                still_running = self.run_batch('saltutil.find_job', sorted(pending))
+                pending = set([jid for (jid, data) in six.iteritems(still_running) if data])
+        return not pending
+
+
 class ShellTestCase(TestCase, AdaptedConfigurationTestCaseMixIn):
     '''
     Execute a test for a shell command
@@ -272,6 +425,8 @@ class ShellTestCase(TestCase, AdaptedConfigurationTestCaseMixIn):
             def detach_from_parent_group():
                 # detach from parent group (no more inherited signals!)
                 os.setpgrp()
+                # join the tests suite scripts cgroup, if any
+                join_cgroup_from_env()
 
             popen_kwargs['preexec_fn'] = detach_from_parent_group
 
@@ -417,6 +572,10 @@ class ModuleCase(TestCase, SaltClientTestCaseMixIn):
     Execute a module function
     '''
 
+    # Set this to True to wait for the minion's state lock to be released
+    # after killing a stalled state job
+    _wait_for_state_lock_release_ = False
+
     def minion_run(self, _function, *args, **kw):
         '''
         Run a single salt function on the 'minion' target and condition
@@ -430,9 +589,6 @@ class ModuleCase(TestCase, SaltClientTestCaseMixIn):
         Run a single salt function and condition the return down to match the
         behavior of the raw function call
         '''
-        know_to_return_none = (
-            'file.chown', 'file.chgrp', 'ssh.recv_known_host'
-        )
         if 'f_arg' in kwargs:
             kwargs['arg'] = kwargs.pop('f_arg')
         if 'f_timeout' in kwargs:
@@ -440,7 +596,112 @@ class ModuleCase(TestCase, SaltClientTestCaseMixIn):
         orig = self.client.cmd(
             minion_tgt, function, arg, timeout=timeout, kwarg=kwargs
         )
+        return self._condition_function_return(function, minion_tgt, orig)
+
+    @property
+    def async_client(self):
+        '''
+        The :class:`LocalClient<salt:salt.client.LocalClient>` used to publish
+        :meth:`run_function_async` calls.
+
+        Unlike :attr:`client`, the same instance is kept for the whole test
+        since it's event bus subscription is what collects the returns.
+        '''
+        client = getattr(self, '_async_client', None)
+        if client is None:
+            client = self._async_client = self.client
+
+            def release_async_client():
+                if hasattr(client, 'destroy'):
+                    client.destroy()
+                self._async_client = None
+            self.addCleanup(release_async_client)
+        return client
+
+    def run_function_async(self, function, arg=(), minion_tgt='minion',
+                           timeout=25, **kwargs):
+        '''
+        Publish a single salt function without waiting for it's return.
+
+        A :class:`PendingFunctionCall` is returned. Pass several of them to
+        :meth:`gather_functions` to collect their returns concurrently, which
+        means waiting as long as the slowest return instead of the sum of all
+        of them.
+
+        .. code-block:: python
+
+            class MultiMinionTest(ModuleCase):
+                def test_ping(self):
+                    calls = [
+                        self.run_function_async('test.ping', minion_tgt=tgt)
+                        for tgt in ('minion', 'sub_minion')
+                    ]
+                    for ret in self.gather_functions(*calls):
+                        self.assertTrue(ret)
+        '''
+        if 'f_arg' in kwargs:
+            kwargs['arg'] = kwargs.pop('f_arg')
+        if 'f_timeout' in kwargs:
+            kwargs['timeout'] = kwargs.pop('f_timeout')
+        client = self.async_client
+        # listen=True makes sure we're subscribed to the event bus before the
+        # job is published, otherwise, fast returns could be missed
+        pub_data = client.run_job(
+            minion_tgt, function, arg, kwarg=kwargs, listen=True
+        )
+        if not pub_data or not pub_data.get('jid'):
+            self.skipTest(
+                'WARNING(SHOULD NOT HAPPEN #1935): Failed to publish \'{0}\' '
+                'to the minion \'{1}\'. Publish data: {2}'.format(
+                    function, minion_tgt, pub_data
+                )
+            )
+        return PendingFunctionCall(
+            self, client, function, minion_tgt, pub_data['jid'], timeout
+        )
 
+    def gather_functions(self, *calls):
+        '''
+        Wait for the returns of the provided :class:`PendingFunctionCall`'s
+        and return a list with their conditioned returns, in the same order,
+        just like :meth:`run_function` would have returned them.
+        '''
+        pending = {}
+        for call in calls:
+            if not call.done:
+                pending.setdefault(call.client, {})[call.jid] = call
+
+        for client, client_calls in six.iteritems(pending):
+            timeout = max([call.stop_at for call in client_calls.values()]) - time.time()
+            for jid, minion_id, ret in iter_job_returns(client, list(client_calls), timeout):
+                call = client_calls.get(jid)
+                if call is None:
+                    # Already collected, ie, a second return through a syndic
+                    continue
+                if minion_id != call.minion_tgt:
+                    continue
+                call.returns[minion_id] = ret
+                call.done = True
+                client_calls.pop(jid)
+                if not client_calls:
+                    break
+            for call in client_calls.values():
+                # Whatever is left timed out
+                call.done = True
+
+        return [
+            self._condition_function_return(call.function, call.minion_tgt, call.returns)
+            for call in calls
+        ]
+
+    def _condition_function_return(self, function, minion_tgt, orig):
+        '''
+        Condition the return of a ``LocalClient.cmd()`` like call down to
+        match the behavior of the raw function call
+        '''
+        know_to_return_none = (
+            'file.chown', 'file.chgrp', 'ssh.recv_known_host'
+        )
         if minion_tgt not in orig:
             self.skipTest(
                 'WARNING(SHOULD NOT HAPPEN #1935): Failed to get a reply '
@@ -458,7 +719,7 @@ class ModuleCase(TestCase, SaltClientTestCaseMixIn):
 
         # Try to match stalled state functions
         orig[minion_tgt] = self._check_state_return(
-            orig[minion_tgt], func=function
+            orig[minion_tgt], func=function, minion_tgt=minion_tgt
         )
 
         return orig[minion_tgt]
@@ -470,43 +731,29 @@ class ModuleCase(TestCase, SaltClientTestCaseMixIn):
         ret = self.run_function('state.single', [function], **kwargs)
         return self._check_state_return(ret)
 
-    def _check_state_return(self, ret, func='state.single'):
+    def _check_state_return(self, ret, func='state.single', minion_tgt='minion'):
         if isinstance(ret, dict):
             # This is the supposed return format for state calls
             return ret
 
-        # Late import
-        import salt._compat
-
-        if isinstance(ret, list):
-            jids = []
-            # These are usually errors
-            for item in ret[:]:
-                if not isinstance(item, salt._compat.string_types):
-                    # We don't know how to handle this
-                    continue
-                match = STATE_FUNCTION_RUNNING_RE.match(item)
-                if not match:
-                    # We don't know how to handle this
-                    continue
-                jid = match.group('jid')
-                if jid in jids:
-                    continue
-
-                jids.append(jid)
+        # These are usually errors
+        lock_manager = StateLockManager(self, minion_tgt=minion_tgt)
+        jids = lock_manager.find_stalled_jids(ret)
+        if not jids:
+            return ret
 
-                job_data = self.run_function(
-                    'saltutil.find_job', [jid]
-                )
-                job_kill = self.run_function('saltutil.kill_job', [jid])
-                msg = (
-                    'A running state.single was found causing a state lock. '
-                    'Job details: {0!r}  Killing Job Returned: {1!r}'.format(
-                        job_data, job_kill
-                    )
+        released = lock_manager.release(
+            jids, wait=self._wait_for_state_lock_release_
+        )
+        for jid, job_data, job_kill in released:
+            msg = (
+                'A running state.single was found causing a state lock. '
+                'Job details: {0!r}  Killing Job Returned: {1!r}'.format(
+                    job_data, job_kill
                 )
-                ret.append('[TEST SUITE ENFORCED]{0}'
-                           '[/TEST SUITE ENFORCED]'.format(msg))
+            )
+            ret.append('[TEST SUITE ENFORCED]{0}'
+                       '[/TEST SUITE ENFORCED]'.format(msg))
         return ret
 
 
@@ -534,10 +781,82 @@ class SSHCase(ShellTestCase):
     '''
     Execute a command via salt-ssh
     '''
+
+    # Set this to True to drive salt's SSHClient from within the tests process
+    # instead of calling the salt-ssh script for every function call
+    _ssh_in_process_ = False
+
+    # How long, in seconds, the shared SSH master connection is kept open
+    # once idle
+    _ssh_control_persist_ = 60
+
     def _arg_str(self, function, arg):
         return '{0} {1}'.format(function, ' '.join(arg))
 
+    @property
+    def ssh_client(self):
+        '''
+        Return a :class:`SSHClient<salt:salt.client.ssh.client.SSHClient>`
+        shared by all the tests of the class
+        '''
+        client = self.__class__.__dict__.get('_ssh_client_')
+        if client is None:
+            # Late import
+            import salt.client.ssh.client
+            client = salt.client.ssh.client.SSHClient(
+                c_path=self.get_config_file_path('master')
+            )
+            setattr(self.__class__, '_ssh_client_', client)
+        return client
+
+    @classmethod
+    def tearDownClass(cls):
+        # Release the shared SSHClient, if any
+        if '_ssh_client_' in cls.__dict__:
+            delattr(cls, '_ssh_client_')
+        super(SSHCase, cls).tearDownClass()
+
+    def get_ssh_options(self):
+        '''
+        Return the SSH options which make all calls share a single, persistent,
+        ControlMaster connection to the tests SSH daemon
+        '''
+        return [
+            'ControlMaster=auto',
+            'ControlPath={0}'.format(os.path.join(RUNTIME_VARS.TMP, 'ssh-cm-%r@%h:%p')),
+            'ControlPersist={0}'.format(self._ssh_control_persist_),
+        ]
+
+    def run_ssh_in_process(self, function, arg=(), timeout=25, **kwargs):
+        '''
+        Execute a salt-ssh function call without spawning the salt-ssh script
+        and return the same data structure ``salt-ssh --out=json`` would.
+        '''
+        return self.ssh_client.cmd(
+            'localhost',
+            function,
+            arg=arg,
+            timeout=timeout,
+            kwarg=kwargs or None,
+            roster_file=os.path.join(RUNTIME_VARS.TMP_CONF_DIR, 'roster'),
+            ssh_priv=os.path.join(RUNTIME_VARS.TMP_CONF_DIR, 'key_test'),
+            ignore_host_keys=True,
+            ssh_options=self.get_ssh_options()
+        )
+
     def run_function(self, function, arg=(), timeout=25, **kwargs):
+        if self._ssh_in_process_:
+            try:
+                ret = self.run_ssh_in_process(function, arg, timeout=timeout, **kwargs)['localhost']
+            except Exception as exc:  # pylint: disable=broad-except
+                log.error('Failed to run %s through salt-ssh: %s', function, exc, exc_info=True)
+                return '{0}: {1}'.format(exc.__class__.__name__, exc)
+            if isinstance(ret, dict) and 'return' in ret and ('retcode' in ret or 'jid' in ret):
+                # SSHClient returns the whole job data, the CLI just the
+                # function return
+                return ret['return']
+            return ret
+
         ret = self.run_ssh(self._arg_str(function, arg))
         try:
             return json.loads(ret)['localhost']
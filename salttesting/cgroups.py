@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    salttesting.cgroups
+    ~~~~~~~~~~~~~~~~~~~
+
+    Tests suite processes containment using a cgroup v2 subtree.
+
+    The tests suite process, the salt daemons and the scripts executed by the
+    tests are each placed in their own leaf of a dedicated cgroup, ie::
+
+        <current cgroup>/salt-runtests-<pid>/
+            runner/
+            daemons/
+            scripts/
+
+    Tearing down a leaf is then a single write to it's ``cgroup.kill`` file,
+    which also takes care of any daemonized grandchildren. The subtree also
+    provides the CPU and memory accounting of the several tests suite
+    phases.
+
+    When cgroups v2 are not available, or not writable by the tests suite,
+    the processes started in each leaf are tracked and terminated using
+    :mod:`psutil` and the accounting falls back to :func:`resource.getrusage`.
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import time
+import logging
+from contextlib import contextmanager
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+# Import salt testing libs
+from salttesting import helpers
+
+# Import 3rd-party libs
+import psutil
+
+log = logging.getLogger(__name__)
+
+# Where the cgroup v2 hierarchy is usually mounted. On hybrid setups it's
+# mounted under ``unified/``, see :func:`get_cgroup_mountpoint`.
+CGROUP_MOUNTPOINT = '/sys/fs/cgroup'
+
+# Child processes, ie, the ones started by ``ShellCase.run_script``, move
+# themselves to the cgroup in this environment variable
+CGROUP_ENV_VAR = 'SALT_RUNTESTS_CGROUP'
+
+LEAVES = ('runner', 'daemons', 'scripts')
+
+
+def _read(path):
+    with open(path) as rfh:
+        return rfh.read()
+
+
+def _write(path, data):
+    with open(path, 'w') as wfh:
+        wfh.write(data)
+
+
+def get_cgroup_mountpoint():
+    '''
+    Return where the cgroup v2 hierarchy is mounted or ``None`` if it's not
+    '''
+    try:
+        mounts = _read('/proc/self/mounts')
+    except (IOError, OSError):
+        return None
+    mountpoint = None
+    for line in mounts.splitlines():
+        parts = line.split()
+        if len(parts) > 2 and parts[2] == 'cgroup2':
+            mountpoint = parts[1]
+            if mountpoint == CGROUP_MOUNTPOINT:
+                break
+    return mountpoint
+
+
+def get_process_cgroup(pid='self'):
+    '''
+    Return the absolute path to the cgroup v2 of the provided process or
+    ``None`` if not available
+    '''
+    mountpoint = get_cgroup_mountpoint()
+    if mountpoint is None:
+        return None
+    try:
+        contents = _read('/proc/{0}/cgroup'.format(pid))
+    except (IOError, OSError):
+        return None
+    for line in contents.splitlines():
+        if line.startswith('0::'):
+            return os.path.join(mountpoint, line[3:].lstrip('/'))
+    return None
+
+
+def join_cgroup(path, pid=None):
+    '''
+    Move a process, by default the current one, to the cgroup at ``path``
+    '''
+    _write(os.path.join(path, 'cgroup.procs'), str(pid or os.getpid()))
+
+
+def join_cgroup_from_env():
+    '''
+    Move the current process to the cgroup defined in the environment, if
+    any. Meant to be called from a ``subprocess.Popen`` ``preexec_fn``.
+    '''
+    path = os.environ.get(CGROUP_ENV_VAR)
+    if not path:
+        return
+    try:
+        join_cgroup(path)
+    except (IOError, OSError):
+        # Don't prevent the process from running
+        pass
+
+
+class TestsContainment(object):
+    '''
+    Contain the tests suite processes in a cgroup v2 subtree
+
+    .. code-block:: python
+
+        containment = TestsContainment()
+        containment.setup()
+        containment.mark_phase('setup')
+        containment.export_leaf('scripts')
+        with containment.spawning('daemons'):
+            start_daemons()
+        containment.mark_phase('tests')
+        run_tests()
+        containment.mark_phase(None)
+        containment.terminate('daemons')
+        containment.kill('daemons')
+        containment.teardown()
+    '''
+
+    def __init__(self, name=None):
+        self.name = name or 'salt-runtests-{0}'.format(os.getpid())
+        self.path = None
+        self.available = False
+        self.phases = []
+        self.__original_cgroup = None
+        self.__current_phase = None
+        # Local fallback, {leaf: {(pid, create_time): psutil.Process}}
+        self.__spawned = dict([(leaf, {}) for leaf in LEAVES])
+
+    def setup(self):
+        '''
+        Create the cgroup subtree and move the tests suite process into it.
+        Returns ``True`` if cgroups are used, ``False`` if the local fallback
+        is used.
+        '''
+        self.__original_cgroup = get_process_cgroup()
+        if self.__original_cgroup is None:
+            log.info('cgroups v2 are not available, using the local processes containment fallback')
+            return False
+
+        path = os.path.join(self.__original_cgroup, self.name)
+        try:
+            os.mkdir(path)
+            for leaf in LEAVES:
+                os.mkdir(os.path.join(path, leaf))
+            try:
+                # Accounting is best effort
+                _write(os.path.join(path, 'cgroup.subtree_control'), '+cpu +memory')
+            except (IOError, OSError):
+                pass
+            join_cgroup(os.path.join(path, 'runner'))
+        except (IOError, OSError) as exc:
+            log.warning(
+                'Unable to setup the tests cgroup at %s, using the local processes '
+                'containment fallback: %s', path, exc
+            )
+            self.__remove_tree(path)
+            return False
+
+        self.path = path
+        self.available = True
+        log.info('Tests suite processes are contained in the cgroup at %s', path)
+        return True
+
+    def get_leaf_path(self, leaf):
+        if not self.available:
+            return None
+        return os.path.join(self.path, leaf)
+
+    @contextmanager
+    def spawning(self, leaf):
+        '''
+        Every process started within this context, by the tests suite
+        process, is placed in ``leaf``.
+        '''
+        if self.available:
+            join_cgroup(self.get_leaf_path(leaf))
+            try:
+                yield
+            finally:
+                join_cgroup(self.get_leaf_path('runner'))
+            return
+
+        before = set(self.__get_children())
+        try:
+            yield
+        finally:
+            for key, process in self.__get_children().items():
+                if key not in before:
+                    self.__spawned[leaf][key] = process
+
+    def export_leaf(self, leaf):
+        '''
+        Make the processes started from now on, which call
+        :func:`join_cgroup_from_env`, join ``leaf``
+        '''
+        if self.available:
+            os.environ[CGROUP_ENV_VAR] = self.get_leaf_path(leaf)
+
+    def get_pids(self, leaf):
+        '''
+        Return the PIDs in ``leaf``
+        '''
+        if self.available:
+            try:
+                return [int(pid) for pid in _read(os.path.join(self.get_leaf_path(leaf), 'cgroup.procs')).split()]
+            except (IOError, OSError):
+                return []
+        return [key[0] for (key, process) in self.__spawned[leaf].items() if process.is_running()]
+
+    def terminate(self, leaf, timeout=10):
+        '''
+        Send ``SIGTERM`` to every process in ``leaf`` and wait, up to
+        ``timeout`` seconds, for them to exit, giving them the chance to run
+        their clean up, ie, saving their code coverage data.
+        Returns ``True`` if no process is left in ``leaf``.
+        '''
+        if leaf == 'runner':
+            raise RuntimeError('Refusing to terminate the tests suite process cgroup')
+
+        if self.available:
+            processes = []
+            for pid in self.get_pids(leaf):
+                try:
+                    processes.append(psutil.Process(pid))
+                except psutil.NoSuchProcess:
+                    continue
+        else:
+            processes = []
+            for process in self.__spawned[leaf].values():
+                if not process.is_running():
+                    continue
+                processes.append(process)
+                processes.extend(helpers.collect_child_processes(process.pid))
+
+        if not processes:
+            return True
+        log.info('Terminating the processes in %s: %s', leaf, processes)
+        for process in processes:
+            try:
+                process.terminate()
+            except psutil.NoSuchProcess:
+                continue
+        gone, alive = psutil.wait_procs(processes, timeout=timeout)
+        return not alive
+
+    def kill(self, leaf, timeout=5):
+        '''
+        Kill every process in ``leaf``, including daemonized grandchildren.
+        Call :meth:`terminate` first to let them exit gracefully.
+        '''
+        if leaf == 'runner':
+            raise RuntimeError('Refusing to kill the tests suite process cgroup')
+
+        if self.available:
+            kill_path = os.path.join(self.get_leaf_path(leaf), 'cgroup.kill')
+            if os.path.isfile(kill_path):
+                if not self.get_pids(leaf):
+                    return
+                log.info('Killing every process in the %s cgroup', leaf)
+                _write(kill_path, '1')
+                stop_at = time.time() + timeout
+                while self.get_pids(leaf) and time.time() < stop_at:
+                    time.sleep(0.05)
+                return
+            # Kernels older than 5.14 lack cgroup.kill
+            processes = []
+            for pid in self.get_pids(leaf):
+                try:
+                    processes.append(psutil.Process(pid))
+                except psutil.NoSuchProcess:
+                    continue
+        else:
+            processes = []
+            for process in self.__spawned[leaf].values():
+                if not process.is_running():
+                    continue
+                processes.append(process)
+                processes.extend(helpers.collect_child_processes(process.pid))
+            self.__spawned[leaf] = {}
+
+        if processes:
+            log.info('Killing the processes in %s: %s', leaf, processes)
+            helpers.terminate_process_list(processes, kill=True)
+
+    def teardown(self):
+        '''
+        Kill every process in the subtree, except the tests suite process,
+        and remove it.
+        '''
+        for leaf in LEAVES[1:]:
+            if not self.terminate(leaf):
+                self.kill(leaf)
+        if not self.available:
+            return
+        os.environ.pop(CGROUP_ENV_VAR, None)
+        try:
+            join_cgroup(self.__original_cgroup)
+        except (IOError, OSError) as exc:
+            log.warning('Unable to move back to the %s cgroup: %s', self.__original_cgroup, exc)
+            return
+        self.__remove_tree(self.path)
+        self.available = False
+
+    def mark_phase(self, name):
+        '''
+        Finish the current accounting phase, if any, and start a new one
+        named ``name``, unless ``None``
+        '''
+        usage = self.get_usage()
+        if self.__current_phase is not None:
+            phase_name, start_usage = self.__current_phase
+            memory_peak_growth = None
+            if usage['lifetime_memory_peak'] is not None and start_usage['lifetime_memory_peak'] is not None:
+                memory_peak_growth = usage['lifetime_memory_peak'] - start_usage['lifetime_memory_peak']
+            self.phases.append((
+                phase_name,
+                {
+                    'wall_time': usage['wall_time'] - start_usage['wall_time'],
+                    'cpu_time': usage['cpu_time'] - start_usage['cpu_time'],
+                    # How much the phase raised the peak. It's 0 when the
+                    # phase never used more memory than a previous one.
+                    'memory_peak_growth': memory_peak_growth,
+                    'lifetime_memory_peak': usage['lifetime_memory_peak'],
+                }
+            ))
+        self.__current_phase = None if name is None else (name, usage)
+
+    def get_usage(self):
+        '''
+        Return the CPU time, in seconds, and the peak memory, in bytes, used by
+        the contained processes. Both the cgroup ``memory.peak`` and
+        ``ru_maxrss`` are the peak since the processes started, not since the
+        current phase did.
+        '''
+        usage = {'wall_time': time.time(), 'cpu_time': 0.0, 'lifetime_memory_peak': None}
+        if self.available:
+            try:
+                for line in _read(os.path.join(self.path, 'cpu.stat')).splitlines():
+                    key, value = line.split()
+                    if key == 'usage_usec':
+                        usage['cpu_time'] = int(value) / 1000000.0
+                        break
+            except (IOError, OSError):
+                pass
+            for fname in ('memory.peak', 'memory.current'):
+                try:
+                    usage['lifetime_memory_peak'] = int(_read(os.path.join(self.path, fname)).strip())
+                    break
+                except (IOError, OSError, ValueError):
+                    continue
+        elif HAS_RESOURCE:
+            self_usage = resource.getrusage(resource.RUSAGE_SELF)
+            children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            usage['cpu_time'] = sum([
+                self_usage.ru_utime, self_usage.ru_stime,
+                children_usage.ru_utime, children_usage.ru_stime
+            ])
+            # Linux reports kilobytes
+            usage['lifetime_memory_peak'] = max(self_usage.ru_maxrss, children_usage.ru_maxrss) * 1024
+        return usage
+
+    def __get_children(self):
+        children = {}
+        for process in helpers.collect_child_processes(os.getpid()):
+            try:
+                children[(process.pid, process.create_time())] = process
+            except psutil.NoSuchProcess:
+                continue
+        return children
+
+    def __remove_tree(self, path):
+        for leaf in LEAVES:
+            try:
+                os.rmdir(os.path.join(path, leaf))
+            except OSError:
+                pass
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
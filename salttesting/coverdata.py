@@ -0,0 +1,900 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    salttesting.coverdata
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Code coverage data files handling.
+
+    Each process measured writes it's own data file, named after the worker,
+    see :data:`salttesting.reporters.WORKER_ID_ENV_VAR`, or the host, and
+    the process ID, ie,
+    ``.coverage.<worker>.<pid>.<random>``. This allows the
+    :class:`CoverageDataCombiner` to tell which data files are complete,
+    because the process which wrote them is gone, and combine those, in
+    batches, while the tests are still running. What's left is combined, in
+    parallel, when the tests suite finishes.
+
+    With coverage>=5.0, the :class:`CoverageContextSwitcher` records which
+    test executed each line, as the coverage context. The resulting test
+    impact map, each test's covered lines, is saved between runs and allows
+    selecting only the tests which cover the lines changed by a diff.
+
+    :class:`LineHitOnceCoverage` is a lower overhead alternative to coverage's
+    tracer, for long running tests suites, which stops monitoring each line
+    once it's been executed. It only measures line coverage.
+
+    The XML and HTML reports can be written concurrently, each by it's own
+    process loading the combined data, see :func:`write_reports`, or by a
+    detached worker, see :func:`start_background_reports`, so the tests
+    suite exit code isn't held back by them.
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import re
+import sys
+import glob
+import gzip
+import json
+import time
+import bisect
+import fnmatch
+import random
+import socket
+import tempfile
+import traceback
+import subprocess
+import logging
+import threading
+import multiprocessing
+
+# Import salt testing libs
+from salttesting.unit import TestResultObserver
+from salttesting.reporters import WORKER_ID_ENV_VAR
+
+# Import 3rd-party libs
+import six
+try:
+    import coverage
+    HAS_COVERAGE = True
+    COVERAGE_VERSION = tuple([
+        int(part) for part in re.search(r'([0-9.]+)', coverage.__version__).group(0).split('.') if part
+    ])
+    Coverage = getattr(coverage, 'Coverage', None) or coverage.coverage
+except ImportError:
+    HAS_COVERAGE = False
+    COVERAGE_VERSION = ()
+    Coverage = None
+
+log = logging.getLogger(__name__)
+
+# Combining explicit data files, instead of whole directories, needs
+# coverage>=4.2
+SUPPORTS_COMBINE_FILES = COVERAGE_VERSION >= (4, 2)
+
+# Suffix prefix of the data files which combine other data files
+COMBINED_SUFFIX_PREFIX = 'combined-'
+
+# Dynamic coverage contexts need coverage>=5.0
+SUPPORTS_CONTEXTS = COVERAGE_VERSION >= (5, 0)
+
+# Writing the data files of LineHitOnceCoverage needs coverage>=5.0
+SUPPORTS_LINE_HIT_ONCE = COVERAGE_VERSION >= (5, 0)
+
+# Python>=3.12
+HAS_SYS_MONITORING = hasattr(sys, 'monitoring')
+
+# Written by the background reports worker when it's done, next to the data
+# file, unless told otherwise. It doesn't match the data files glob.
+REPORTS_MARKER_NAME = '.coverage-reports-done'
+
+# The ID of the running test. Inherited by forked processes, which then
+# attribute their coverage data to it.
+CURRENT_TEST_CONTEXT = None
+
+TEST_IMPACT_MAP_VERSION = 1
+
+
+def _get_worker_name():
+    '''
+    Return the name, shared by all of the worker processes, which prefixes
+    the data files suffix
+    '''
+    return re.sub(r'[^A-Za-z0-9_-]', '_', os.environ.get(WORKER_ID_ENV_VAR) or socket.gethostname())
+
+
+def get_data_suffix():
+    '''
+    Return the data file suffix for the current process
+    '''
+    return '{0}.{1}.{2:06d}'.format(_get_worker_name(), os.getpid(), random.randint(0, 999999))
+
+
+def get_process_coverage_options(coverage_options):
+    '''
+    Return a copy of the coverage options, passed by the tests suite to the
+    processes it starts, with the process data file suffix
+    '''
+    coverage_options = coverage_options.copy()
+    if coverage_options.get('data_suffix') is True:
+        coverage_options['data_suffix'] = get_data_suffix()
+    return coverage_options
+
+
+def create_coverage(coverage_options):
+    '''
+    Return a coverage instance for the coverage options passed by the tests
+    suite. With ``line_hit_once``, only lines are measured, by a
+    :class:`LineHitOnceCoverage` where ``sys.monitoring`` is available.
+    '''
+    coverage_options = coverage_options.copy()
+    if coverage_options.pop('line_hit_once', False):
+        coverage_options['branch'] = False
+        if HAS_SYS_MONITORING:
+            return LineHitOnceCoverage(**coverage_options)
+        # Coverage's C tracer, measuring lines only, is cheaper than
+        # disarming a python sys.settrace tracer after each hit
+    return Coverage(**coverage_options)
+
+
+def start_process_coverage(coverage_options):
+    '''
+    Create and start the coverage instance of a process started by the tests
+    suite
+    '''
+    coverage_object = create_coverage(get_process_coverage_options(coverage_options))
+    coverage_object.start()
+    switch_process_context(coverage_object)
+    return coverage_object
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        # EPERM means it exists but it's not ours
+        return exc.errno == 1
+    return True
+
+
+def is_data_file_complete(path, data_file):
+    '''
+    Return ``True`` if the process which writes the data file at ``path`` is
+    gone. Data files from other workers, or not named by this module, are
+    never considered complete.
+    '''
+    suffix = os.path.basename(path)[len(os.path.basename(data_file)) + 1:]
+    if suffix.startswith(COMBINED_SUFFIX_PREFIX):
+        return True
+    parts = suffix.split('.')
+    if len(parts) != 3:
+        return False
+    if parts[0] != _get_worker_name():
+        return False
+    try:
+        pid = int(parts[1])
+    except ValueError:
+        return False
+    return not _pid_exists(pid)
+
+
+def find_data_files(data_file):
+    '''
+    Return the suffixed data files of ``data_file``
+    '''
+    return sorted([
+        path for path in glob.glob('{0}.*'.format(data_file))
+        # Skip sqlite's temporary files
+        if not path.endswith(('-journal', '-wal', '-shm'))
+    ])
+
+
+def combine_data_files(args):
+    '''
+    Combine the data files ``paths`` into a new data file at ``output``.
+    Takes a single ``(output, paths)`` tuple to be usable with
+    :meth:`multiprocessing.pool.Pool.map`.
+    '''
+    output, paths = args
+    code_coverage = Coverage(data_file=output, config_file=False)
+    code_coverage.combine(data_paths=paths)
+    code_coverage.save()
+    return output
+
+
+class CoverageDataCombiner(object):
+    '''
+    Combine the data files of the measured processes in the background, as
+    they finish, and in parallel once the tests suite finishes.
+
+    .. code-block:: python
+
+        combiner = CoverageDataCombiner('.coverage', interval=60)
+        combiner.start()
+        ...
+        combiner.stop()
+        combiner.combine(code_coverage)
+    '''
+
+    def __init__(self, data_file, interval=60, processes=None, batch_size=200):
+        self.data_file = os.path.abspath(data_file)
+        self.interval = interval
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.__counter = 0
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def _get_output_path(self):
+        self.__counter += 1
+        return '{0}.{1}{2}.{3}.{4}'.format(
+            self.data_file, COMBINED_SUFFIX_PREFIX, os.getpid(), self.__counter, random.randint(0, 999999)
+        )
+
+    def start(self):
+        if not SUPPORTS_COMBINE_FILES or not self.interval:
+            return
+        self.__thread = threading.Thread(target=self.__run, name='CoverageDataCombiner')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__stopped.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def __run(self):
+        # Don't measure, nor slow down, the combining
+        sys.settrace(None)
+        while not self.__stopped.is_set():
+            self.__stopped.wait(self.interval)
+            if self.__stopped.is_set():
+                break
+            self.combine_complete()
+
+    def combine_complete(self):
+        '''
+        Combine the complete data files, along with the data files previously
+        combined, into a new data file
+        '''
+        combined, complete = [], []
+        for path in find_data_files(self.data_file):
+            if not is_data_file_complete(path, self.data_file):
+                continue
+            if os.path.basename(path)[len(os.path.basename(self.data_file)) + 1:].startswith(COMBINED_SUFFIX_PREFIX):
+                combined.append(path)
+            else:
+                complete.append(path)
+        if not complete:
+            return
+        paths = combined + complete[:self.batch_size]
+        try:
+            combine_data_files((self._get_output_path(), paths))
+        except Exception as exc:  # pylint: disable=broad-except
+            log.warning('Failed to combine the coverage data files: %s', exc)
+            return
+        log.debug('Combined %d coverage data files', len(paths))
+
+    def combine(self, code_coverage, parallel=True):
+        '''
+        Combine every data file into ``code_coverage``'s data. With
+        ``parallel``, they're first combined in ``processes`` groups, in
+        parallel.
+        '''
+        if not SUPPORTS_COMBINE_FILES:
+            code_coverage.combine()
+            return
+
+        paths = find_data_files(self.data_file)
+        if not isinstance(code_coverage, LineHitOnceCoverage):
+            # The current process data file is code_coverage's own, it can't
+            # be combined into itself
+            own_suffix_part = '.{0}.'.format(os.getpid())
+            paths = [
+                path for path in paths
+                if own_suffix_part not in os.path.basename(path)[len(os.path.basename(self.data_file)):]
+            ]
+        if not paths:
+            return
+        if parallel and self.processes > 1 and len(paths) > self.processes * 2:
+            chunks = [(self._get_output_path(), paths[idx::self.processes]) for idx in range(self.processes)]
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                paths = pool.map(combine_data_files, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        code_coverage.combine(data_paths=paths)
+
+
+# ----- Test Impact Map --------------------------------------------------------------------------------------------->
+class CoverageContextSwitcher(TestResultObserver):
+    '''
+    Switch the coverage context to the ID of each test as it runs
+    '''
+
+    def __init__(self, code_coverage):
+        self.code_coverage = code_coverage
+
+    def start_test(self, test):
+        global CURRENT_TEST_CONTEXT  # pylint: disable=global-statement
+        CURRENT_TEST_CONTEXT = test.id()
+        self.code_coverage.switch_context(CURRENT_TEST_CONTEXT)
+
+    def stop_test(self, test, outcome, reason=None):
+        global CURRENT_TEST_CONTEXT  # pylint: disable=global-statement
+        CURRENT_TEST_CONTEXT = None
+        self.code_coverage.switch_context('')
+
+
+def switch_process_context(coverage_object):
+    '''
+    Attribute the coverage data of a process, forked while a test runs, to
+    that test
+    '''
+    if SUPPORTS_CONTEXTS and CURRENT_TEST_CONTEXT:
+        coverage_object.switch_context(CURRENT_TEST_CONTEXT)
+
+
+def _to_ranges(lines):
+    ranges = []
+    for lineno in sorted(lines):
+        if ranges and lineno == ranges[-1][1] + 1:
+            ranges[-1][1] = lineno
+        else:
+            ranges.append([lineno, lineno])
+    return ranges
+
+
+def get_test_impact_map_root(path):
+    '''
+    Return the directory the test impact map paths are relative to, the root
+    of the git repository ``path`` belongs to, the same ``git diff`` paths
+    are relative to, or ``path`` itself if not in one
+    '''
+    path = os.path.abspath(path)
+    try:
+        proc = subprocess.Popen(
+            ['git', 'rev-parse', '--show-toplevel'],
+            cwd=path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        stdout, _ = proc.communicate()
+    except (IOError, OSError):
+        return path
+    if proc.returncode != 0 or not stdout.strip():
+        return path
+    return os.path.abspath(stdout.strip().decode('utf-8') if six.PY3 else stdout.strip())
+
+
+def build_test_impact_map(coverage_data, root):
+    '''
+    Return ``{test_id: {path: [[first_line, last_line], ...]}}`` from the
+    coverage contexts in ``coverage_data``. The paths are relative to
+    ``root``, see :func:`get_test_impact_map_root`, and files outside of it
+    are left out.
+    '''
+    tests = {}
+    for filename in coverage_data.measured_files():
+        relpath = os.path.relpath(filename, root)
+        if relpath.startswith(os.pardir):
+            continue
+        for lineno, contexts in six.iteritems(coverage_data.contexts_by_lineno(filename)):
+            if lineno < 1:
+                # Branch coverage's code object entry and exit
+                continue
+            for context in contexts:
+                if context:
+                    tests.setdefault(context, {}).setdefault(relpath, []).append(lineno)
+    for files in tests.values():
+        for relpath, lines in six.iteritems(files):
+            files[relpath] = _to_ranges(lines)
+    return tests
+
+
+def _open_map(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 'b')
+    return open(path, mode)
+
+
+def load_test_impact_map(path):
+    '''
+    Load a test impact map, gzip compressed if ``path`` ends with ``.gz``
+    '''
+    with _open_map(path, 'r') as rfh:
+        contents = json.loads(rfh.read().decode('utf-8') if path.endswith('.gz') else rfh.read())
+    if contents.get('version') != TEST_IMPACT_MAP_VERSION:
+        raise ValueError('Unsupported test impact map version: {0}'.format(contents.get('version')))
+    return contents['tests']
+
+
+def write_test_impact_map(path, tests, merge=True):
+    '''
+    Write the test impact map, gzip compressed if ``path`` ends with
+    ``.gz``. With ``merge``, the entries of the tests not in ``tests`` are
+    kept from the existing map, if any.
+    '''
+    if merge and os.path.isfile(path):
+        try:
+            existing = load_test_impact_map(path)
+        except (IOError, OSError, ValueError) as exc:
+            log.warning('Not merging the existing test impact map at %s: %s', path, exc)
+        else:
+            existing.update(tests)
+            tests = existing
+    dirname = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    contents = json.dumps({'version': TEST_IMPACT_MAP_VERSION, 'tests': tests}, separators=(',', ':'))
+    with _open_map(path, 'w') as wfh:
+        wfh.write(contents.encode('utf-8') if path.endswith('.gz') else contents)
+
+
+def parse_diff(diff):
+    '''
+    Return ``{path: set(lines)}`` from a unified diff, ie, ``git diff``'s
+    output. The paths and lines are those of the base revision files, like
+    the ones in the test impact map. Removed and modified lines are marked,
+    added lines mark the lines around where they were inserted. The files
+    changed without line numbers, ie, deleted or binary files, get an empty
+    set, meaning the whole file.
+    '''
+    changed = {}
+    path = old_path = None
+    # Lines left in the current hunk, on the base and on the new file
+    old_left = new_left = 0
+    hunk_re = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+    git_header_re = re.compile(r'^diff --git a/(.+) b/(.+)$')
+    for line in diff.splitlines():
+        if old_left or new_left:
+            # Inside a hunk, where even '--- ' can be a removed line
+            marker = line[:1]
+            if marker == '-':
+                changed[path].add(old_lineno)
+                removed = True
+                old_lineno += 1
+                old_left -= 1
+                continue
+            if marker == '+':
+                if not removed:
+                    # A pure insertion, between two base lines
+                    changed[path].update(
+                        lineno for lineno in (old_lineno - 1, old_lineno) if lineno > 0
+                    )
+                new_left -= 1
+                continue
+            if marker == ' ':
+                removed = False
+                old_lineno += 1
+                old_left -= 1
+                new_left -= 1
+                continue
+            if marker == '\\':
+                # No newline at end of file
+                continue
+            old_left = new_left = 0
+        match = git_header_re.match(line)
+        if match is not None:
+            # Deleted and binary files have no hunks, renamed files are
+            # changed on both paths
+            path = old_path = None
+            for changed_path in set(match.groups()):
+                changed.setdefault(changed_path, set())
+            continue
+        if line.startswith('--- '):
+            old_path = _get_diff_path(line)
+            continue
+        if line.startswith('+++ '):
+            new_path = _get_diff_path(line)
+            path = None
+            if old_path is None:
+                # A new file, whatever covers it is not in the map yet
+                if new_path is not None:
+                    changed.setdefault(new_path, set())
+            elif new_path is None:
+                # A deleted file, changed as a whole
+                changed.setdefault(old_path, set())
+            else:
+                path = old_path
+            continue
+        if path is None:
+            continue
+        match = hunk_re.match(line)
+        if match is None:
+            continue
+        old_lineno = int(match.group(1))
+        old_left = 1 if match.group(2) is None else int(match.group(2))
+        new_left = 1 if match.group(3) is None else int(match.group(3))
+        if not old_left:
+            # Pure insertion hunks start at the base line before the insertion
+            old_lineno += 1
+        removed = False
+        changed.setdefault(path, set())
+    return changed
+
+
+def _get_diff_path(line):
+    '''
+    Return the path from a ``---`` or ``+++`` diff line, ``None`` for
+    ``/dev/null``
+    '''
+    path = line[4:].split('\t')[0].strip()
+    if path == '/dev/null':
+        return None
+    if path.startswith(('a/', 'b/')):
+        path = path[2:]
+    return path
+
+
+def select_impacted_tests(tests, changed):
+    '''
+    Return the IDs of the tests, in the ``tests`` impact map, which cover
+    any of the ``changed`` lines, see :func:`parse_diff`. An empty set of
+    lines means the whole file.
+    '''
+    impacted = set()
+    for test_id, files in six.iteritems(tests):
+        for path, lines in six.iteritems(changed):
+            ranges = files.get(path)
+            if not ranges:
+                continue
+            if not lines:
+                impacted.add(test_id)
+                break
+            starts = [first for (first, last) in ranges]
+            for lineno in lines:
+                idx = bisect.bisect_right(starts, lineno) - 1
+                if idx >= 0 and ranges[idx][1] >= lineno:
+                    impacted.add(test_id)
+                    break
+            if test_id in impacted:
+                break
+    return impacted
+
+
+def get_unmapped_paths(tests, changed):
+    '''
+    Return the ``changed`` paths which no test in the ``tests`` impact map
+    covers, ie, new files, fixtures or any other file which isn't python
+    code. Which tests those changes impact is not known.
+    '''
+    unmapped = set(changed)
+    for files in six.itervalues(tests):
+        unmapped.difference_update(files)
+        if not unmapped:
+            break
+    return sorted(unmapped)
+# <---- Test Impact Map ----------------------------------------------------------------------------------------------
+
+
+# ----- Coverage Reports -------------------------------------------------------------------------------------------->
+def get_combined_data_file(code_coverage):
+    '''
+    Return the path to the data file holding ``code_coverage``'s, already
+    combined, data, from where the reports are loaded
+    '''
+    data = code_coverage.get_data()
+    if COVERAGE_VERSION >= (5, 0):
+        # Written as it's collected, or combined, to the SQLite database
+        return os.path.abspath(data.data_filename())
+    data_file = os.path.abspath(code_coverage.config.data_file)
+    data.write_file(data_file)
+    return data_file
+
+
+def _get_reports_coverage_options(coverage_options):
+    coverage_options = dict(coverage_options)
+    # The reports are always written from the explicitly passed data file
+    for key in ('data_file', 'data_suffix', 'line_hit_once'):
+        coverage_options.pop(key, None)
+    return coverage_options
+
+
+def _write_report(args):
+    '''
+    Write a single report, ``kind`` being ``xml`` or ``html``, of the
+    coverage data at ``data_file``. Takes a single
+    ``(data_file, coverage_options, kind, output)`` tuple to be usable with
+    :meth:`multiprocessing.pool.Pool.apply_async`.
+    '''
+    data_file, coverage_options, kind, output = args
+    code_coverage = Coverage(data_file=data_file, **coverage_options)
+    code_coverage.load()
+    if kind == 'xml':
+        code_coverage.xml_report(outfile=output)
+    else:
+        code_coverage.html_report(directory=output)
+    return output
+
+
+def write_reports(data_file, coverage_options, xml_output=None, html_output=None, parallel=False):
+    '''
+    Write the XML and/or HTML reports of the combined coverage data at
+    ``data_file``. With ``parallel``, each report is written by it's own
+    process.
+
+    Returns a list of the errors, if any.
+    '''
+    coverage_options = _get_reports_coverage_options(coverage_options)
+    jobs = [
+        (data_file, coverage_options, kind, output)
+        for (kind, output) in (('xml', xml_output), ('html', html_output)) if output is not None
+    ]
+    errors = []
+    if parallel and len(jobs) > 1:
+        pool = multiprocessing.Pool(len(jobs))
+        try:
+            results = [(job[2], pool.apply_async(_write_report, (job,))) for job in jobs]
+            for kind, result in results:
+                try:
+                    result.get()
+                except Exception as exc:  # pylint: disable=broad-except
+                    errors.append('Failed to write the {0} report: {1}'.format(kind.upper(), exc))
+        finally:
+            pool.close()
+            pool.join()
+        return errors
+    for job in jobs:
+        try:
+            _write_report(job)
+        except Exception:  # pylint: disable=broad-except
+            errors.append('Failed to write the {0} report: {1}'.format(job[2].upper(), traceback.format_exc()))
+    return errors
+
+
+def get_reports_marker_file(data_file):
+    return os.path.join(os.path.dirname(os.path.abspath(data_file)), REPORTS_MARKER_NAME)
+
+
+def start_background_reports(data_file, coverage_options, xml_output=None, html_output=None,
+                             parallel=False, marker_file=None):
+    '''
+    Write the reports, see :func:`write_reports`, from a detached worker
+    process, which outlives the tests suite. When done, the worker writes,
+    atomically, ``marker_file``, a JSON document with the ``xml`` and
+    ``html`` outputs paths, the ``errors`` and the ``duration``.
+
+    Returns the marker file path.
+    '''
+    if marker_file is None:
+        marker_file = get_reports_marker_file(data_file)
+    marker_file = os.path.abspath(marker_file)
+    if os.path.exists(marker_file):
+        # Don't let the previous run's marker be mistaken by this one's
+        os.unlink(marker_file)
+    spec = {
+        'data_file': os.path.abspath(data_file),
+        'coverage_options': _get_reports_coverage_options(coverage_options),
+        'xml_output': xml_output and os.path.abspath(xml_output),
+        'html_output': html_output and os.path.abspath(html_output),
+        'parallel': parallel,
+        'marker_file': marker_file,
+    }
+    env = os.environ.copy()
+    # salttesting might only be importable through this process sys.path
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+        [path for path in env.get('PYTHONPATH', '').split(os.pathsep) if path]
+    )
+    with open(os.devnull, 'r+') as devnull:
+        subprocess.Popen(
+            [
+                sys.executable, '-c',
+                'import sys; from salttesting.coverdata import run_background_reports; '
+                'run_background_reports(sys.argv[1])',
+                json.dumps(spec)
+            ],
+            stdin=devnull,
+            stdout=devnull,
+            stderr=devnull,
+            close_fds=True,
+            env=env,
+            # Detach from the tests suite session, ie, Jenkins' process group
+            preexec_fn=os.setsid
+        )
+    return marker_file
+
+
+def run_background_reports(spec):
+    '''
+    The entry point of the worker started by :func:`start_background_reports`
+    '''
+    spec = json.loads(spec)
+    start = time.time()
+    try:
+        errors = write_reports(
+            spec['data_file'],
+            spec['coverage_options'],
+            xml_output=spec['xml_output'],
+            html_output=spec['html_output'],
+            parallel=spec['parallel']
+        )
+    except Exception:  # pylint: disable=broad-except
+        errors = [traceback.format_exc()]
+    marker_file = spec['marker_file']
+    handle, temp_path = tempfile.mkstemp(prefix=os.path.basename(marker_file), dir=os.path.dirname(marker_file))
+    with os.fdopen(handle, 'w') as wfh:
+        json.dump(
+            {
+                'xml': spec['xml_output'],
+                'html': spec['html_output'],
+                'errors': errors,
+                'duration': time.time() - start
+            },
+            wfh
+        )
+    os.rename(temp_path, marker_file)
+# <---- Coverage Reports ---------------------------------------------------------------------------------------------
+
+
+# ----- Line Hit Once Coverage -------------------------------------------------------------------------------------->
+# The sys.monitoring tool IDs LineHitOnceCoverage may use, in order of
+# preference. DEBUGGER_ID, COVERAGE_ID and PROFILER_ID are left to the
+# debuggers, coverage.py and profilers.
+LINE_HIT_ONCE_TOOL_IDS = (3, 4, 5)
+LINE_HIT_ONCE_TOOL_NAME = 'salttesting'
+
+# The started LineHitOnceCoverage, if any. Forked processes inherit it,
+# along with it's sys.monitoring tool ID.
+_STARTED_LINE_HIT_ONCE = None
+
+
+class LineHitOnceCoverage(object):
+    '''
+    Measure line coverage using ``sys.monitoring``, Python>=3.12, disabling
+    each line's monitoring event as soon as the line executes, so, unlike
+    ``sys.settrace`` based tracers, lines in hot loops are only paid for once.
+
+    The data is saved in coverage's format. Combining and reporting is done
+    by a regular, never started, coverage instance, to which any unknown
+    attribute is delegated. Branch coverage is not measured.
+    '''
+
+    def __init__(self, data_file=None, data_suffix=None, source=None, include=None, omit=None,
+                 cover_pylib=False, branch=False, **kwargs):
+        if data_file is not None:
+            # On coverage>=5.0, None means not storing the data at all
+            kwargs['data_file'] = data_file
+        # Combines the data files and generates the reports
+        self._reporter = Coverage(
+            source=source, include=include, omit=omit, cover_pylib=cover_pylib, branch=False, **kwargs
+        )
+        self.data_file = os.path.abspath(self._reporter.config.data_file)
+        self.data_suffix = data_suffix
+        self.source = [os.path.join(os.path.realpath(path), '') for path in source or ()]
+        self.include = include or ()
+        self.omit = omit or ()
+        self.lines = {}
+        self.tool_id = None
+        self.__dispositions = {}
+        self.__monitored = []
+        self.__started = False
+
+    def __getattr__(self, name):
+        return getattr(self._reporter, name)
+
+    def _should_trace(self, filename):
+        try:
+            return self.__dispositions[filename]
+        except KeyError:
+            pass
+        disposition = filename.endswith('.py')
+        if disposition:
+            path = os.path.realpath(filename)
+            if self.source:
+                disposition = path.startswith(tuple(self.source))
+            elif self.include:
+                disposition = any([fnmatch.fnmatch(path, pattern) for pattern in self.include])
+            if disposition and self.omit:
+                disposition = not any([fnmatch.fnmatch(path, pattern) for pattern in self.omit])
+        self.__dispositions[filename] = disposition
+        return disposition
+
+    def _on_py_start(self, code, instruction_offset):
+        monitoring = sys.monitoring  # pylint: disable=no-member
+        if self._should_trace(code.co_filename):
+            monitoring.set_local_events(self.tool_id, code, monitoring.events.LINE)
+            self.__monitored.append(code)
+        # Each code object only needs to be checked once
+        return monitoring.DISABLE
+
+    def _on_line(self, code, line_number):
+        try:
+            self.lines[code.co_filename].add(line_number)
+        except KeyError:
+            self.lines[code.co_filename] = set([line_number])
+        return sys.monitoring.DISABLE  # pylint: disable=no-member
+
+    def _get_free_tool_id(self):
+        monitoring = sys.monitoring  # pylint: disable=no-member
+        for tool_id in LINE_HIT_ONCE_TOOL_IDS:
+            if monitoring.get_tool(tool_id) is None:
+                return tool_id
+        raise RuntimeError(
+            'Unable to measure the line coverage, the sys.monitoring tool IDs {0} are all in use: {1}'.format(
+                ', '.join([str(tool_id) for tool_id in LINE_HIT_ONCE_TOOL_IDS]),
+                ', '.join([str(monitoring.get_tool(tool_id)) for tool_id in LINE_HIT_ONCE_TOOL_IDS])
+            )
+        )
+
+    def _take_over(self, inherited):
+        '''
+        Take over the tool ID, and the monitored code objects, of the
+        instance inherited from the process which forked this one
+        '''
+        monitoring = sys.monitoring  # pylint: disable=no-member
+        self.tool_id = inherited.tool_id
+        self.__dispositions.update(inherited.__dispositions)
+        # The lines executed by the forking process have their event
+        # disabled. Re-arming the events of the code objects monitored, and
+        # only of those, enables them again, without touching the events of
+        # the other sys.monitoring tools.
+        for code in inherited.__monitored:
+            monitoring.set_local_events(self.tool_id, code, 0)
+            monitoring.set_local_events(self.tool_id, code, monitoring.events.LINE)
+            self.__monitored.append(code)
+
+    def start(self):
+        global _STARTED_LINE_HIT_ONCE  # pylint: disable=global-statement
+        if self.__started:
+            return
+        monitoring = sys.monitoring  # pylint: disable=no-member
+        inherited = _STARTED_LINE_HIT_ONCE
+        if inherited is not None and inherited is not self and \
+                monitoring.get_tool(inherited.tool_id) == LINE_HIT_ONCE_TOOL_NAME:
+            # Forked while the forking process was measuring
+            self._take_over(inherited)
+        else:
+            self.tool_id = self._get_free_tool_id()
+            monitoring.use_tool_id(self.tool_id, LINE_HIT_ONCE_TOOL_NAME)
+        monitoring.register_callback(self.tool_id, monitoring.events.PY_START, self._on_py_start)
+        monitoring.register_callback(self.tool_id, monitoring.events.LINE, self._on_line)
+        monitoring.set_events(self.tool_id, monitoring.events.PY_START)
+        _STARTED_LINE_HIT_ONCE = self
+        self.__started = True
+
+    def stop(self):
+        global _STARTED_LINE_HIT_ONCE  # pylint: disable=global-statement
+        if not self.__started:
+            return
+        self.__started = False
+        if _STARTED_LINE_HIT_ONCE is self:
+            _STARTED_LINE_HIT_ONCE = None
+        monitoring = sys.monitoring  # pylint: disable=no-member
+        monitoring.set_events(self.tool_id, 0)
+        for code in self.__monitored:
+            monitoring.set_local_events(self.tool_id, code, 0)
+        self.__monitored = []
+        monitoring.register_callback(self.tool_id, monitoring.events.PY_START, None)
+        monitoring.register_callback(self.tool_id, monitoring.events.LINE, None)
+        monitoring.free_tool_id(self.tool_id)
+        self.tool_id = None
+
+    def switch_context(self, new_context):
+        # Lines are only recorded once, contexts are meaningless
+        pass
+
+    def save(self):
+        '''
+        Write the measured lines to the data file, suffixed as configured
+        '''
+        suffix = self.data_suffix
+        if suffix is True:
+            suffix = get_data_suffix()
+        data = coverage.CoverageData(basename=self.data_file, suffix=suffix or None)
+        if not suffix:
+            # Replace, don't add to, the data of a previous run
+            data.erase()
+        data.add_lines(dict([(filename, sorted(lines)) for (filename, lines) in six.iteritems(self.lines) if lines]))
+        data.write()
+# <---- Line Hit Once Coverage ---------------------------------------------------------------------------------------
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    salttesting.dockerpool
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Run the tests suite split in shards, in parallel, across a pool of warm
+    Docker containers.
+
+    The containers of a :class:`WarmContainerPool` are labeled after the
+    image and the source code directory mounted in them and are kept
+    running, idle, between tests suite runs, so the next run only pays for
+    a ``docker exec``. Creating and removing containers happens in
+    background threads, a shard starts as soon as a container is ready.
+
+    A container only ever runs a single shard. The tests suite runs with
+    ``--run-destructive`` inside the containers, so each container used is
+    removed, and a fresh one started in it's place, for the next run. Before
+    running a shard, the container is claimed, atomically, so concurrent
+    runs never share a container. The claim records it's owner, containers
+    claimed by runs which are gone are removed.
+
+    The containers are kept idle by overriding the image's entrypoint. The
+    shards are instead run through it, ie, the ``salttest`` images
+    ``start-me-up.sh`` script, passing the tests suite command line as a
+    single argument, just like ``--docked`` does with ``docker run``.
+
+    Each shard runs the tests suite with ``--shard INDEX/COUNT``, see
+    :func:`shard_tests`, and streams it's output and it's results, see
+    :class:`salttesting.reporters.JSONLinesReporter`, back to the host as
+    they happen.
+'''
+
+# Import python libs
+from __future__ import absolute_import, print_function
+import os
+import sys
+import json
+import time
+import errno
+import random
+import shutil
+import socket
+import hashlib
+import logging
+import threading
+import subprocess
+
+# Import salt testing libs
+from salttesting.unit import TestSuite
+from salttesting.reporters import WORKER_ID_ENV_VAR, _iter_tests
+
+# Import 3rd-party libs
+import six
+from six.moves import queue  # pylint: disable=import-error
+
+log = logging.getLogger(__name__)
+
+# Label of the pool containers, it's value identifies the pool
+POOL_LABEL = 'salttesting.pool'
+
+# Where the source code is mounted inside the containers
+SOURCE_MOUNTPOINT = '/salt-source'
+
+# Where the shards results streams are written, relative to the source code
+# directory, so they're reachable from the host
+RESULTS_DIRNAME = '.docked-results'
+
+# Created, inside a container, by the tests suite run which claims it.
+# Creating a directory fails if it already exists.
+CLAIM_PATH = '/tmp/.salttesting-claimed'
+# Written inside CLAIM_PATH, a JSON document with the claiming ``host``,
+# ``pid`` and ``time``
+CLAIM_OWNER_FILE = 'owner'
+# Claims older than this many seconds are stale even if their owner can't be
+# checked, ie, it runs on another host
+CLAIM_MAX_AGE = 24 * 60 * 60
+
+
+def parse_shard(shard):
+    '''
+    Parse an ``INDEX/COUNT`` shard specification, ``INDEX`` starting at 1,
+    into a ``(index, count)`` tuple. Raises :exc:`ValueError` if invalid.
+    '''
+    try:
+        index, count = [int(part) for part in shard.split('/')]
+    except (AttributeError, ValueError):
+        raise ValueError('{0!r} is not a INDEX/COUNT shard'.format(shard))
+    if not 1 <= index <= count:
+        raise ValueError('The shard index must be between 1 and {0}'.format(count))
+    return index, count
+
+
+def shard_tests(tests, index, count):
+    '''
+    Return a tests suite with the ``index`` shard, of ``count``, of
+    ``tests``. The tests of the same test case class are kept together, so
+    that class setups run on a single shard. The classes are distributed
+    round-robin, in their discovery order, which is the same on every shard.
+    '''
+    classes = []
+    tests_by_class = {}
+    for test in _iter_tests(tests):
+        key = (test.__class__.__module__, test.__class__.__name__)
+        if key not in tests_by_class:
+            classes.append(key)
+            tests_by_class[key] = []
+        tests_by_class[key].append(test)
+    suite = TestSuite()
+    for position, key in enumerate(classes):
+        if position % count == index - 1:
+            suite.addTests(tests_by_class[key])
+    return suite
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        # EPERM means it exists but it's not ours
+        return exc.errno == errno.EPERM
+    return True
+
+
+def get_claim_owner():
+    '''
+    Return the claim owner information of this process
+    '''
+    return {'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time()}
+
+
+def is_stale_claim(owner, now=None):
+    '''
+    Return ``True`` if the claim ``owner``, see :func:`get_claim_owner`, is
+    a tests suite run which is gone, or, when that can't be checked, if the
+    claim is older than :data:`CLAIM_MAX_AGE`
+    '''
+    if now is None:
+        now = time.time()
+    try:
+        if now - float(owner['time']) > CLAIM_MAX_AGE:
+            return True
+        if owner['host'] == socket.gethostname():
+            return not _pid_exists(int(owner['pid']))
+    except (KeyError, TypeError, ValueError):
+        # Not our format, it's not ours to remove
+        return False
+    return False
+
+
+def _run_docker(docker_binary, *args):
+    '''
+    Run a docker command and return it's exit code and stripped output
+    '''
+    proc = subprocess.Popen(
+        [docker_binary] + list(args),
+        env=os.environ.copy(),
+        close_fds=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    )
+    output = proc.communicate()[0]
+    if six.PY3:
+        output = output.decode(sys.getdefaultencoding(), 'replace')
+    return proc.returncode, output.strip()
+
+
+class WarmContainerPool(object):
+    '''
+    A pool of idle containers, per image and source code directory, kept
+    running between tests suite runs.
+
+    .. code-block:: python
+
+        pool = WarmContainerPool('salttest/ubuntu-16.04', 4, '/path/to/salt')
+        pool.start()
+        # The image's entrypoint, to run the shards through
+        pool.entrypoint
+        container = pool.acquire()
+        ...
+        # Replaced by a fresh container
+        pool.release(container)
+        pool.teardown()
+    '''
+
+    def __init__(self, image, size, source_code_basedir, docker_binary='/usr/bin/docker'):
+        self.image = image
+        self.size = size
+        self.source_code_basedir = os.path.abspath(source_code_basedir)
+        self.docker_binary = docker_binary
+        self.pool_id = hashlib.sha1(
+            '{0}:{1}'.format(image, self.source_code_basedir).encode('utf-8')
+        ).hexdigest()[:12]
+        self.containers = []
+        self.entrypoint = []
+        self.__ready = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__threads = []
+        self.__tearing_down = False
+
+    def _in_background(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self.__threads.append(thread)
+        return thread
+
+    def find_warm_containers(self):
+        '''
+        Return the names of the running containers of this pool
+        '''
+        returncode, output = _run_docker(
+            self.docker_binary, 'ps',
+            '--filter', 'label={0}={1}'.format(POOL_LABEL, self.pool_id),
+            '--filter', 'status=running',
+            '--format', '{{.Names}}'
+        )
+        if returncode != 0:
+            log.warning('Failed to list the warm containers: %s', output)
+            return []
+        return output.split()
+
+    def get_entrypoint(self):
+        '''
+        Return the image's entrypoint, as a list, empty if it has none
+        '''
+        returncode, output = _run_docker(
+            self.docker_binary, 'inspect', '--type=image', '--format', '{{json .Config.Entrypoint}}', self.image
+        )
+        if returncode != 0:
+            raise RuntimeError('Failed to inspect the {0} image: {1}'.format(self.image, output))
+        try:
+            entrypoint = json.loads(output)
+        except ValueError:
+            raise RuntimeError('Unexpected {0} image entrypoint: {1}'.format(self.image, output))
+        if isinstance(entrypoint, six.string_types):
+            entrypoint = [entrypoint]
+        return entrypoint or []
+
+    def _create_container(self):
+        name = 'salttesting-{0}-{1:06x}'.format(self.pool_id, random.randint(0, 0xffffff))
+        returncode, output = _run_docker(
+            self.docker_binary, 'run',
+            '--detach',
+            # Keeps the container idle, and running, until removed. The
+            # shards run through the image's entrypoint instead.
+            '--interactive',
+            '--entrypoint', 'cat',
+            '--label', '{0}={1}'.format(POOL_LABEL, self.pool_id),
+            '--name', name,
+            '--volume', '{0}:{1}'.format(self.source_code_basedir, SOURCE_MOUNTPOINT),
+            '--workdir', SOURCE_MOUNTPOINT,
+            '--env', 'SHELL=/bin/sh',
+            self.image
+        )
+        if returncode != 0:
+            log.error('Failed to start a %s container: %s', self.image, output)
+            self.__ready.put(None)
+            return
+        log.info('Started the warm %s container %s', self.image, name)
+        with self.__lock:
+            self.containers.append(name)
+        self.__ready.put(name)
+
+    def start(self):
+        '''
+        Make ``size`` containers available, reusing the already running ones
+        and starting the missing ones in the background
+        '''
+        self.entrypoint = self.get_entrypoint()
+        warm = self.find_warm_containers()[:self.size]
+        for name in warm:
+            with self.__lock:
+                self.containers.append(name)
+            self.__ready.put(name)
+        for _ in range(self.size - len(warm)):
+            self._in_background(self._create_container)
+        return len(warm)
+
+    def _claim(self, name):
+        '''
+        Claim the container ``name`` for this tests suite run. Returns
+        ``False`` if it's already claimed, by a concurrent run, or unusable.
+        '''
+        owner_path = '{0}/{1}'.format(CLAIM_PATH, CLAIM_OWNER_FILE)
+        returncode, output = _run_docker(
+            self.docker_binary, 'exec', name,
+            'sh', '-c', 'mkdir "$1" && printf "%s" "$2" > "$3"', 'sh',
+            CLAIM_PATH, json.dumps(get_claim_owner()), owner_path
+        )
+        if returncode == 0:
+            return True
+        log.info('Not using the container %s, already claimed or unusable: %s', name, output)
+        returncode, output = _run_docker(self.docker_binary, 'exec', name, 'cat', owner_path)
+        try:
+            owner = json.loads(output) if returncode == 0 else None
+        except ValueError:
+            owner = None
+        if owner is not None and is_stale_claim(owner):
+            # Left behind by a run which is gone, the container would
+            # otherwise never be used, nor removed, again
+            log.info('Removing the container %s, claimed by a run which is gone: %s', name, owner)
+            self._in_background(self._remove_containers, [name])
+        return False
+
+    def acquire(self):
+        '''
+        Claim, and return the name of, an idle container, as soon as one is
+        ready, or ``None`` if it failed to start
+        '''
+        while True:
+            name = self.__ready.get()
+            if name is None or self._claim(name):
+                return name
+            # Someone else's, or removed if stale, start another one
+            with self.__lock:
+                if name in self.containers:
+                    self.containers.remove(name)
+            self._in_background(self._create_container)
+
+    def release(self, name):
+        '''
+        Remove the container ``name``, which ran a shard and whose state is
+        unknown, in the background and start a fresh one in it's place
+        '''
+        with self.__lock:
+            if name not in self.containers:
+                # Already discarded
+                return
+            self.containers.remove(name)
+            replace = not self.__tearing_down
+        self._in_background(self._remove_containers, [name])
+        if replace:
+            self._in_background(self._create_container)
+
+    def discard(self, *names):
+        '''
+        Remove the containers ``names`` right away, ie, to stop whatever is
+        running in them
+        '''
+        with self.__lock:
+            for name in names:
+                if name in self.containers:
+                    self.containers.remove(name)
+        self._remove_containers(list(names))
+
+    def _remove_containers(self, names):
+        if not names:
+            return
+        returncode, output = _run_docker(self.docker_binary, 'rm', '--force', *names)
+        if returncode != 0:
+            log.warning('Failed to remove the containers %s: %s', ', '.join(names), output)
+
+    def teardown(self, remove=False, timeout=60):
+        '''
+        Wait for the background work to finish and, with ``remove``, remove
+        every container of the pool
+        '''
+        with self.__lock:
+            self.__tearing_down = remove
+        stop_at = time.time() + timeout
+        for thread in self.__threads:
+            thread.join(max(stop_at - time.time(), 0))
+        self.__threads = [thread for thread in self.__threads if thread.is_alive()]
+        if remove:
+            # Including the ones started by the threads joined above
+            with self.__lock:
+                names, self.containers = self.containers, []
+            self._remove_containers(names)
+
+
+class ShardsRunner(object):
+    '''
+    Run ``calling_args``, the tests suite command line, in ``count`` shards
+    across the containers of ``pool``.
+
+    Each shard's output is printed, prefixed by the shard, as it arrives.
+    The shards results streams are merged into ``results_stream``, if
+    passed, while they're written.
+    '''
+
+    def __init__(self, pool, calling_args, count, results_stream=None, environ=None, stream=None):
+        self.pool = pool
+        self.calling_args = list(calling_args)
+        self.count = count
+        self.results_stream = results_stream
+        self.environ = environ or {}
+        self.stream = stream if stream is not None else sys.stdout
+        self.run_id = '{0}-{1}'.format(int(time.time()), os.getpid())
+        self.results_dir = os.path.join(pool.source_code_basedir, RESULTS_DIRNAME, self.run_id)
+        # {shard index: (container, exit code)}
+        self.results = {}
+        # {outcome: count}
+        self.outcomes = {}
+        self.__lock = threading.Lock()
+        # {shard index: (container, process)}
+        self.__processes = {}
+        self.__interrupted = False
+        self.__offsets = {}
+        self.__results_fh = None
+
+    def _write(self, line):
+        with self.__lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def _get_shard_command(self, index, container):
+        command = [self.pool.docker_binary, 'exec', '--interactive']
+        environ = dict(self.environ)
+        environ[WORKER_ID_ENV_VAR] = '{0}-shard-{1}'.format(container, index)
+        for key, value in sorted(environ.items()):
+            command.extend(['--env', '{0}={1}'.format(key, value)])
+        command.append(container)
+        calling_args = self.calling_args + [
+            '--shard', '{0}/{1}'.format(index, self.count),
+            '--results-stream', '{0}/{1}/{2}/shard-{3}.jsonl'.format(
+                SOURCE_MOUNTPOINT, RESULTS_DIRNAME, self.run_id, index
+            )
+        ]
+        if self.pool.entrypoint:
+            # Like 'docker run' does, the entrypoint script gets the tests
+            # suite command line as a single string
+            command.extend(self.pool.entrypoint)
+            command.append(' '.join(calling_args))
+        else:
+            command.extend(calling_args)
+        return command
+
+    def _run_shard(self, index):
+        container = self.pool.acquire()
+        if container is None:
+            self._write(' * [shard {0}/{1}] No container available\n'.format(index, self.count))
+            self.results[index] = (None, -1)
+            return
+        if self.__interrupted:
+            self.pool.discard(container)
+            self.results[index] = (container, -1)
+            return
+        self._write(' * [shard {0}/{1}] Running in {2}\n'.format(index, self.count, container))
+        with open(os.devnull) as devnull:
+            proc = subprocess.Popen(
+                self._get_shard_command(index, container),
+                env=os.environ.copy(),
+                close_fds=True,
+                stdin=devnull,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT
+            )
+        self.__processes[index] = (container, proc)
+        prefix = '[{0}/{1}] '.format(index, self.count)
+        for line in iter(proc.stdout.readline, b''):
+            if six.PY3:
+                line = line.decode(sys.getdefaultencoding(), 'replace')
+            self._write(prefix + line.rstrip('\r\n') + '\n')
+        proc.wait()
+        self.results[index] = (container, proc.returncode)
+        self.pool.release(container)
+
+    def collect_results(self):
+        '''
+        Merge the new complete lines of the shards results streams into
+        ``results_stream`` and count the outcomes
+        '''
+        if not os.path.isdir(self.results_dir):
+            return
+        for fname in sorted(os.listdir(self.results_dir)):
+            path = os.path.join(self.results_dir, fname)
+            offset = self.__offsets.get(path, 0)
+            try:
+                with open(path) as rfh:
+                    rfh.seek(offset)
+                    data = rfh.read()
+            except (IOError, OSError):
+                continue
+            # Leave incomplete lines for the next time
+            data = data[:data.rfind('\n') + 1]
+            if not data:
+                continue
+            self.__offsets[path] = offset + len(data)
+            for line in data.splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('event') == 'stop':
+                    self.outcomes[record.get('outcome')] = self.outcomes.get(record.get('outcome'), 0) + 1
+                if self.__results_fh is not None:
+                    self.__results_fh.write(line + '\n')
+            if self.__results_fh is not None:
+                self.__results_fh.flush()
+
+    def run(self, poll_interval=0.5):
+        '''
+        Run the shards and return the tests suite exit code, non zero if any
+        shard failed
+        '''
+        if not os.path.isdir(self.results_dir):
+            os.makedirs(self.results_dir)
+        if self.results_stream:
+            self.__results_fh = open(self.results_stream, 'a')
+        threads = []
+        for index in range(1, self.count + 1):
+            thread = threading.Thread(target=self._run_shard, args=(index,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        try:
+            while threads:
+                # Joining with a timeout keeps the main thread interruptible
+                threads[0].join(poll_interval)
+                threads = [thread for thread in threads if thread.is_alive()]
+                self.collect_results()
+        except KeyboardInterrupt:
+            self._write(' * Caught CTRL-C, stopping the shards...\n')
+            self.terminate()
+            for thread in threads:
+                thread.join(15)
+        finally:
+            self.collect_results()
+            if self.__results_fh is not None:
+                self.__results_fh.close()
+            shutil.rmtree(self.results_dir, ignore_errors=True)
+            try:
+                # Only if no other run is using it
+                os.rmdir(os.path.dirname(self.results_dir))
+            except OSError:
+                pass
+        if self.__interrupted or len(self.results) < self.count:
+            return 1
+        if [returncode for (container, returncode) in self.results.values() if returncode != 0]:
+            return 1
+        return 0
+
+    def terminate(self):
+        '''
+        Stop the running shards. Terminating ``docker exec`` leaves the tests
+        suite running in the container, the containers are removed instead.
+        '''
+        self.__interrupted = True
+        running = [(container, proc) for (container, proc) in list(self.__processes.values()) if proc.poll() is None]
+        self.pool.discard(*[container for (container, proc) in running])
+        for container, proc in running:
+            if proc.poll() is None:
+                proc.terminate()
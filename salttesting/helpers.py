@@ -26,7 +26,7 @@ from functools import wraps
 
 # Import Salt Testing libs
 from salttesting import __version_info__
-from salttesting.unit import skip, _id
+from salttesting.unit import skip, _id, TestResultObserver
 
 # Import 3rd-party libs
 import six
@@ -247,33 +247,89 @@ class TestsLoggingHandler(object):
             # (...)               Do what ever you wish here
             handler.messages    # here are the emitted log messages
 
+    The records of loggers not in ``names``, nor children of those, if
+    passed, are ignored. With ``lazy=True`` the log records are stored as
+    they are and only formatted when ``messages`` is read:
+
+    .. code-block:: python
+
+        with TestsLoggingHandler(level=logging.INFO, lazy=True, names=('salt.minion',)) as handler:
+            # (...)
+            handler.messages
+
+    Since lazy records are formatted later, a mutable object passed as a log
+    message argument is formatted as it is at that later time.
     '''
-    def __init__(self, level=0, format='%(levelname)s:%(message)s'):
+    def __init__(self, level=0, format='%(levelname)s:%(message)s', lazy=False, names=None):
         self.level = level
         self.format = format
+        self.lazy = lazy
+        self.names = tuple(names) if names else None
         self.activated = False
         self.prev_logging_level = None
 
     def activate(self):
+        names = self.names
+
+        def is_wanted(record):
+            if names is None:
+                return True
+            name = record.name
+            for prefix in names:
+                if name == prefix or name.startswith(prefix + '.'):
+                    return True
+            return False
+
         class Handler(logging.Handler):
             def __init__(self, level):
                 logging.Handler.__init__(self, level)
                 self.messages = []
 
             def emit(self, record):
-                self.messages.append(self.format(record))
+                if is_wanted(record):
+                    self.messages.append(self.format(record))
 
-        self.handler = Handler(self.level)
+        class LazyHandler(logging.Handler):
+            def __init__(self, level):
+                logging.Handler.__init__(self, level)
+                self.records = []
+                self.__messages = []
+
+            def handle(self, record):
+                # Appending is atomic, no need to lock
+                if not is_wanted(record):
+                    return False
+                if self.filters and not self.filter(record):
+                    return False
+                self.records.append(record)
+                return True
+
+            def emit(self, record):
+                self.handle(record)
+
+            @property
+            def messages(self):
+                # Only format the records stored since last time
+                for record in self.records[len(self.__messages):]:
+                    self.__messages.append(self.format(record))
+                return self.__messages
+
+            @messages.setter
+            def messages(self, value):
+                self.records = list(value)
+                self.__messages = []
+
+        self.handler = (LazyHandler if self.lazy else Handler)(self.level)
         formatter = logging.Formatter(self.format)
         self.handler.setFormatter(formatter)
         logging.root.addHandler(self.handler)
         self.activated = True
-        # Make sure we're running with the lowest logging level with our
+        # Make sure we're running with the lowest logging level needed by our
         # tests logging handler
         current_logging_level = logging.root.getEffectiveLevel()
-        if current_logging_level > logging.DEBUG:
+        if current_logging_level > max(self.level, logging.DEBUG):
             self.prev_logging_level = current_logging_level
-            logging.root.setLevel(0)
+            logging.root.setLevel(self.level)
 
     def deactivate(self):
         if not self.activated:
@@ -1116,48 +1172,81 @@ def collect_child_processes(pid):
     return children[::-1]  # return a reversed list of the children
 
 
+def _get_process_group(pid):
+    '''
+    Return the process group ID of the provided pid or ``None`` where not
+    available
+    '''
+    if not hasattr(os, 'getpgid'):
+        return None
+    try:
+        return os.getpgid(pid)
+    except OSError:
+        return None
+
+
 def _terminate_process_list(process_list, kill=False, slow_stop=False):
+    '''
+    Signal all the processes in ``process_list`` in a single pass and, when
+    ``slow_stop`` is ``True``, wait for all of them at once.
+
+    Processes which lead their own process group, other than ours, get the
+    whole group signalled at once.
+    '''
+    own_process_group = _get_process_group(os.getpid())
+    signalled_process_groups = set()
+    signalled = []
     for process in process_list[:][::-1]:  # Iterate over a reversed copy of the list
-        if not psutil.pid_exists(process.pid):
-            process_list.remove(process)
-            continue
         try:
             if not kill and process.status() == psutil.STATUS_ZOMBIE:
                 # Zombie processes will exit once child processes also exit
                 continue
-            try:
-                cmdline = process.cmdline()
-            except psutil.AccessDenied:
-                # OSX is more restrictive about the above information
-                cmdline = None
-            if not cmdline:
-                try:
-                    cmdline = process.as_dict()
-                except Exception:
-                    cmdline = 'UNKNOWN PROCESS'
-            if kill:
+            # The cmdline is cached by terminate_process_list
+            cmdline = getattr(process, '_cmdline', None) or process
+            process_group = _get_process_group(process.pid)
+            if process_group is not None and process_group in signalled_process_groups:
+                # Already signalled along with it's process group
+                signalled.append(process)
+                continue
+            if process_group == process.pid and process_group != own_process_group:
+                log.info(
+                    '%s process group(%s): %s', 'Killing' if kill else 'Terminating', process_group, cmdline
+                )
+                os.killpg(process_group, signal.SIGKILL if kill else SIGTERM)
+                signalled_process_groups.add(process_group)
+            elif kill:
                 log.info('Killing process(%s): %s', process.pid, cmdline)
                 process.kill()
             else:
                 log.info('Terminating process(%s): %s', process.pid, cmdline)
-                try:
-                    if slow_stop:
-                        # Allow coverage data to be written down to disk
-                        process.send_signal(SIGTERM)
-                        try:
-                            process.wait(2)
-                        except psutil.TimeoutExpired:
-                            if psutil.pid_exists(process.pid):
-                                continue
-                    else:
-                        process.terminate()
-                except OSError as exc:
-                    if exc.errno not in (errno.ESRCH, errno.EACCES):
-                        raise
-            if not psutil.pid_exists(process.pid):
-                process_list.remove(process)
+                if slow_stop:
+                    process.send_signal(SIGTERM)
+                else:
+                    process.terminate()
+            signalled.append(process)
         except psutil.NoSuchProcess:
             process_list.remove(process)
+        except OSError as exc:
+            if exc.errno not in (errno.ESRCH, errno.EACCES):
+                raise
+
+    if slow_stop and not kill and signalled:
+        # Allow coverage data to be written down to disk. All the processes
+        # share the same deadline, we wait, at most, for the slowest one.
+        psutil.wait_procs(signalled, timeout=2)
+
+    for process in process_list[:]:
+        if not process.is_running():
+            process_list.remove(process)
+
+
+def _wait_process_list(process_list, timeout, callback=None):
+    '''
+    Wait, at most ``timeout`` seconds, for all the processes in
+    ``process_list`` to exit, removing the ones which did from the list
+    '''
+    _, alive = psutil.wait_procs(process_list, timeout=timeout, callback=callback)
+    process_list[:] = alive
 
 
 def terminate_process_list(process_list, kill=False, slow_stop=False):
@@ -1182,19 +1271,19 @@ def terminate_process_list(process_list, kill=False, slow_stop=False):
                 cmdline = '<could not be retrived; dead process: {0}>'.format(proc)
         proc._cmdline = cmdline
     _terminate_process_list(process_list, kill=kill, slow_stop=slow_stop)
-    psutil.wait_procs(process_list, timeout=15, callback=on_process_terminated)
+    _wait_process_list(process_list, timeout=15, callback=on_process_terminated)
 
     if process_list:
         # If there's still processes to be terminated, retry and kill them if slow_stop is False
         log.info('Terminating process list. 2nd step. kill: %s, slow stop: %s', slow_stop is False, slow_stop)
         _terminate_process_list(process_list, kill=slow_stop is False, slow_stop=slow_stop)
-        psutil.wait_procs(process_list, timeout=10, callback=on_process_terminated)
+        _wait_process_list(process_list, timeout=10, callback=on_process_terminated)
 
     if process_list:
         # If there's still processes to be terminated, just kill them, no slow stopping now
         log.info('Terminating process list. 3rd step. kill: True, slow stop: False')
         _terminate_process_list(process_list, kill=True, slow_stop=False)
-        psutil.wait_procs(process_list, timeout=5, callback=on_process_terminated)
+        _wait_process_list(process_list, timeout=5, callback=on_process_terminated)
 
     if process_list:
         # In there's still processes to be terminated, log a warning about it
@@ -1253,3 +1342,79 @@ def terminate_process_pid(pid, only_children=False):
     if only_children:
         return terminate_process(children=children, kill_children=True, slow_stop=True)
     return terminate_process(pid=pid, process=process, children=children, kill_children=True, slow_stop=True)
+
+
+class ChildProcessLeakTracker(TestResultObserver):
+    '''
+    Tests result observer which attributes the child processes left running
+    after a test to the test which started them, and, optionally, terminates
+    them right away so they don't slow down the tests which follow.
+
+    Only processes started by the tests suite process itself, or by other
+    processes started during the test, are attributed to the test. Processes
+    started by the, long running, salt daemons are their business.
+    '''
+
+    def __init__(self, pid=None, reap=False):
+        self.pid = pid or os.getpid()
+        self.reap = reap
+        # [(test id, [{'pid': ..., 'cmdline': ..., 'reaped': ...}, ...]), ...]
+        self.leaks = []
+        self.__known = None
+
+    def _snapshot(self):
+        '''
+        Return a dictionary, keyed by ``(pid, create_time)``, so that reused
+        PIDs are not mistaken for the same process, of the running
+        descendants of the tracked process
+        '''
+        snapshot = {}
+        for process in collect_child_processes(self.pid):
+            try:
+                if process.status() == psutil.STATUS_ZOMBIE:
+                    continue
+                snapshot[(process.pid, process.create_time())] = process
+            except psutil.NoSuchProcess:
+                continue
+        return snapshot
+
+    def start_test(self, test):
+        self.__known = self._snapshot()
+
+    def stop_test(self, test, outcome, reason=None):
+        known, self.__known = self.__known, None
+        if known is None:
+            return
+        current = self._snapshot()
+        new_pids = set([pid for (pid, create_time) in current if (pid, create_time) not in known])
+        leaked = []
+        for key, process in six.iteritems(current):
+            if key in known:
+                continue
+            try:
+                ppid = process.ppid()
+            except psutil.NoSuchProcess:
+                continue
+            if ppid != self.pid and ppid not in new_pids:
+                continue
+            leaked.append(process)
+
+        if not leaked:
+            return
+
+        entries = []
+        for process in leaked:
+            try:
+                cmdline = ' '.join(process.cmdline()) or process.name()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                cmdline = '<could not be retrieved>'
+            entries.append({'pid': process.pid, 'cmdline': cmdline, 'reaped': False})
+        log.warning(
+            'Test %s left %s child process(es) running: %s',
+            test.id(), len(entries), [entry['pid'] for entry in entries]
+        )
+        if self.reap:
+            terminate_process_list(leaked, kill=False, slow_stop=False)
+            for entry in entries:
+                entry['reaped'] = not psutil.pid_exists(entry['pid'])
+        self.leaks.append((test.id(), entries))
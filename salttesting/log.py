@@ -0,0 +1,614 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    salttesting.log
+    ~~~~~~~~~~~~~~~
+
+    Non blocking, and per test indexed, tests suite logging.
+
+    The tests suite logs everything, at the debug level, to the tests logfile.
+    Instead of writing each record to the file, under the handler lock, on the
+    thread which logged it, :class:`QueueHandler` only enqueues the records
+    and a :class:`QueueLogWriter` thread writes them, in batches, to the
+    actual handlers.
+
+    .. code-block:: python
+
+        filehandler = get_file_handler('/tmp/salt-runtests.log')
+        filehandler.setFormatter(formatter)
+        queuehandler, writer = setup_queued_logging((filehandler,))
+        logging.root.addHandler(queuehandler)
+        ...
+        writer.stop()
+
+    The indexed file handlers record where each test's log segment, from
+    the ``>>>>> START >>>>>`` to the ``<<<<< END <<<<<<<`` line, starts and
+    ends in the log file. The index is kept in memory and written, one JSON
+    record per line, to a ``.index`` file next to the log file.
+
+    The :class:`DaemonLogsTailer` re-logs, on the tests suite log, the lines
+    written to the salt daemons log files, tagged with the ID of the test
+    running at the time.
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import re
+import copy
+import gzip
+import json
+import atexit
+import logging
+import logging.handlers
+import threading
+import multiprocessing.util
+from collections import deque
+
+# Import salt testing libs
+from salttesting.unit import TestResultObserver
+
+# Import 3rd-party libs
+import six
+
+# How many records the writer thread handles before flushing the handlers
+BATCH_SIZE = 512
+# How long, in seconds, the writer thread sleeps when there's nothing to
+# write
+POLL_INTERVAL = 0.05
+
+# The debug messages logged by the test results classes when each test starts
+# and stops
+TEST_START_MARKER = '>>>>> START >>>>> '
+TEST_END_MARKER = '<<<<< END <<<<<<< '
+
+
+class _BatchedFlushMixIn(object):
+    '''
+    The regular stream handlers flush the stream after each record, the
+    flushing is instead done by :class:`QueueLogWriter` after each batch.
+    '''
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super(_BatchedFlushMixIn, self).flush()
+
+    def close(self):
+        self.flush_batch()
+        super(_BatchedFlushMixIn, self).close()
+
+    def _open(self):
+        if not getattr(self, 'compress', False):
+            return super(_BatchedFlushMixIn, self)._open()
+        if six.PY2:
+            return gzip.open(self.baseFilename, self.mode + 'b')
+        return gzip.open(self.baseFilename, self.mode + 't', encoding=self.encoding)
+
+
+class BatchedFileHandler(_BatchedFlushMixIn, logging.FileHandler):
+    '''
+    File handler, optionally gzip compressed, which is only flushed by
+    :class:`QueueLogWriter`
+    '''
+
+    def __init__(self, filename, mode='a', encoding=None, compress=False):
+        self.compress = compress
+        logging.FileHandler.__init__(self, filename, mode=mode, encoding=encoding)
+
+
+class BatchedRotatingFileHandler(_BatchedFlushMixIn, logging.handlers.RotatingFileHandler):
+    '''
+    Rotating file handler which is only flushed by :class:`QueueLogWriter`
+    '''
+
+
+class _TestsLogIndexMixIn(object):
+    '''
+    Index where each test's log segment starts and ends in the log file
+    '''
+
+    def _setup_index(self):
+        self.index = {}
+        self.index_path = self.baseFilename + '.index'
+        self.__starts = {}
+        self.__index_stream = open(self.index_path, 'w')
+
+    def emit(self, record):
+        msg = record.msg
+        if not isinstance(msg, six.string_types) or msg[:5] not in ('>>>>>', '<<<<<'):
+            # Cheap check, not a marker
+            super(_TestsLogIndexMixIn, self).emit(record)
+            return
+        message = record.getMessage()
+        if self.stream is None:
+            self.stream = self._open()
+        if message.startswith(TEST_START_MARKER):
+            self.__starts[message[len(TEST_START_MARKER):]] = self.stream.tell()
+            super(_TestsLogIndexMixIn, self).emit(record)
+        elif message.startswith(TEST_END_MARKER):
+            super(_TestsLogIndexMixIn, self).emit(record)
+            test_id = message[len(TEST_END_MARKER):]
+            start = self.__starts.pop(test_id, None)
+            if start is not None:
+                self._add_index_entry(test_id, start, self.stream.tell())
+        else:
+            super(_TestsLogIndexMixIn, self).emit(record)
+
+    def _add_index_entry(self, test_id, start, end):
+        self.index.setdefault(test_id, []).append((start, end))
+        self.__index_stream.write(json.dumps({'id': test_id, 'start': start, 'end': end}) + '\n')
+        self.__index_stream.flush()
+
+    def read_segment(self, test_id):
+        '''
+        Return the log segment of the last run of ``test_id``, or ``None`` if
+        it's not indexed
+        '''
+        if test_id not in self.index:
+            return None
+        start, end = self.index[test_id][-1]
+        self.acquire()
+        try:
+            getattr(self, 'flush_batch', self.flush)()
+        finally:
+            self.release()
+        opener = gzip.open if getattr(self, 'compress', False) else open
+        with opener(self.baseFilename, 'rb') as rfh:
+            rfh.seek(start)
+            return rfh.read(end - start).decode('utf-8', 'replace')
+
+    def close(self):
+        if not self.__index_stream.closed:
+            self.__index_stream.close()
+        super(_TestsLogIndexMixIn, self).close()
+
+
+class IndexedFileHandler(_TestsLogIndexMixIn, logging.FileHandler):
+    '''
+    File handler which indexes each test's log segment
+    '''
+
+    def __init__(self, filename, mode='a', encoding=None):
+        logging.FileHandler.__init__(self, filename, mode=mode, encoding=encoding)
+        self._setup_index()
+
+
+class BatchedIndexedFileHandler(_TestsLogIndexMixIn, BatchedFileHandler):
+    '''
+    :class:`BatchedFileHandler` which indexes each test's log segment
+    '''
+
+    def __init__(self, filename, mode='a', encoding=None, compress=False):
+        BatchedFileHandler.__init__(self, filename, mode=mode, encoding=encoding, compress=compress)
+        self._setup_index()
+
+
+def load_log_index(index_path):
+    '''
+    Load a log index file. Returns a dictionary mapping each test ID to the
+    list of ``(start, end)`` offsets of it's log segments.
+    '''
+    index = {}
+    with open(index_path) as rfh:
+        for line in rfh:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Truncated line, ie, the tests run was interrupted
+                continue
+            index.setdefault(entry['id'], []).append((entry['start'], entry['end']))
+    return index
+
+
+def get_file_handler(filename, mode='w', max_bytes=0, backup_count=0, compress=False, index=False):
+    '''
+    Return the file handler to pass to :func:`setup_queued_logging`.
+
+    ``max_bytes`` and ``backup_count`` have the same meaning as on
+    :class:`logging.handlers.RotatingFileHandler`. ``compress`` gzip
+    compresses the log file. ``index`` indexes each test's log segment.
+    Neither compressed nor indexed log files can be rotated.
+    '''
+    if max_bytes and compress:
+        raise ValueError('Compressed log files can not be rotated')
+    if max_bytes and index:
+        raise ValueError('Indexed log files can not be rotated')
+    if mode == 'w':
+        # Always append, so that the writes of forked processes, which log
+        # to the same file, don't overwrite each other
+        if os.path.isfile(filename):
+            os.unlink(filename)
+        mode = 'a'
+    if index:
+        return BatchedIndexedFileHandler(filename, mode=mode, compress=compress)
+    if max_bytes:
+        return BatchedRotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count)
+    return BatchedFileHandler(filename, mode=mode, compress=compress)
+
+
+class QueueHandler(logging.Handler):
+    '''
+    Enqueue the log records to be handled by a :class:`QueueLogWriter`.
+
+    The queue is a :class:`collections.deque`, appending to it is atomic and
+    takes no lock. The message is interpolated, on a copy of the record,
+    when enqueued, the log content is the same even if the arguments are
+    changed afterwards. Records logged on forked processes, where the writer
+    thread doesn't run, are handled, and flushed, in place.
+
+    A forked process gets new handler locks, the writer thread might have
+    held the inherited ones, and drops whatever the writer had buffered, but
+    not yet flushed, so that it isn't written twice.
+    '''
+
+    def __init__(self, records, handlers, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.records = records
+        self.handlers = handlers
+        self.pid = os.getpid()
+
+    def createLock(self):  # pylint: disable=C0103
+        self.lock = None
+
+    def handle(self, record):
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def reinit_after_fork(self):
+        '''
+        Make the handlers usable on a forked process. Called by
+        :mod:`multiprocessing` on the processes it forks and by :meth:`emit`
+        for any other forked process.
+        '''
+        if os.getpid() == self.pid:
+            return
+        self.pid = os.getpid()
+        for handler in self.handlers:
+            _reinit_handler_after_fork(handler)
+
+    def emit(self, record):
+        if os.getpid() != self.pid:
+            self.reinit_after_fork()
+            # Forked processes might exit, ie, os._exit(), without ever
+            # flushing the handlers
+            _handle_record(self.handlers, record)
+            _flush_handlers(self.handlers)
+            return
+        try:
+            # Other handlers, or filters, get the record untouched
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            self.records.append(record)
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+
+def _reinit_handler_after_fork(handler):
+    '''
+    Replace ``handler``'s lock, and, for file handlers, reopen the file,
+    discarding the buffered data inherited from the parent process
+    '''
+    handler.createLock()
+    stream = getattr(handler, 'stream', None)
+    if stream is None or not isinstance(handler, logging.FileHandler):
+        return
+    try:
+        fileno = stream.fileno()
+    except (AttributeError, ValueError, IOError, OSError):
+        return
+    # Never truncate what the parent process wrote
+    mode, handler.mode = handler.mode, 'a'
+    try:
+        handler.stream = handler._open()
+    finally:
+        handler.mode = mode
+    # The inherited stream now writes it's buffer, whenever it's flushed or
+    # collected, to /dev/null
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, fileno)
+    finally:
+        os.close(devnull)
+
+
+def _handle_record(handlers, record):
+    for handler in handlers:
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+
+def _flush_handlers(handlers):
+    for handler in handlers:
+        try:
+            if hasattr(handler, 'flush_batch'):
+                handler.flush_batch()
+            else:
+                handler.flush()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+
+class _DrainMarker(object):
+    '''
+    Enqueued by :meth:`QueueLogWriter.drain`, set once every record before
+    it is written
+    '''
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.set = self.event.set
+        self.wait = self.event.wait
+
+
+class QueueLogWriter(threading.Thread):
+    '''
+    Thread which writes the log records enqueued by :class:`QueueHandler`
+    to the actual handlers, flushing them after each batch
+    '''
+
+    def __init__(self, records, handlers, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL):
+        threading.Thread.__init__(self, name='QueueLogWriter')
+        self.daemon = True
+        self.records = records
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.pid = os.getpid()
+        self.__stopped = threading.Event()
+        # Held while a batch is written and until it's flushed
+        self.batch_lock = threading.Lock()
+        self.__fork_locked = False
+
+    def _flush(self):
+        _flush_handlers(self.handlers)
+
+    def _write_batch(self):
+        handled = 0
+        drained = []
+        with self.batch_lock:
+            while handled < self.batch_size:
+                try:
+                    record = self.records.popleft()
+                except IndexError:
+                    break
+                handled += 1
+                if isinstance(record, _DrainMarker):
+                    drained.append(record)
+                    continue
+                _handle_record(self.handlers, record)
+            if handled:
+                self._flush()
+        for marker in drained:
+            marker.set()
+        return handled
+
+    def before_fork(self):
+        '''
+        Wait for the batch being written, if any, to be flushed and hold off
+        the next one. A forked process would otherwise inherit, and write
+        again, whatever is buffered by the handlers.
+        '''
+        if os.getpid() == self.pid:
+            self.batch_lock.acquire()
+            self.__fork_locked = True
+
+    def after_fork(self):
+        if self.__fork_locked:
+            self.__fork_locked = False
+            self.batch_lock.release()
+
+    def drain(self, timeout=10):
+        '''
+        Wait until every record enqueued so far is written
+        '''
+        if os.getpid() != self.pid or not self.is_alive():
+            return
+        marker = _DrainMarker()
+        self.records.append(marker)
+        marker.wait(timeout)
+
+    def run(self):
+        while not self.__stopped.is_set():
+            if not self._write_batch():
+                self.__stopped.wait(self.poll_interval)
+        # Write whatever is still enqueued
+        while self._write_batch():
+            pass
+
+    def stop(self, timeout=None):
+        '''
+        Write every enqueued record and stop the thread
+        '''
+        if os.getpid() != self.pid or not self.is_alive():
+            return
+        self.__stopped.set()
+        self.join(timeout)
+
+
+def setup_queued_logging(handlers, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL):
+    '''
+    Start a :class:`QueueLogWriter` thread, writing to ``handlers``, and
+    return it, along with the :class:`QueueHandler` to add to the logging
+    system. The writer is stopped at exit, if not stopped before.
+    '''
+    handlers = tuple(handlers)
+    records = deque()
+    queuehandler = QueueHandler(
+        records,
+        handlers,
+        # Don't even enqueue what no handler would handle
+        level=min([handler.level for handler in handlers] or [logging.NOTSET])
+    )
+    writer = QueueLogWriter(records, handlers, batch_size=batch_size, poll_interval=poll_interval)
+    writer.start()
+    atexit.register(writer.stop)
+    multiprocessing.util.register_after_fork(queuehandler, QueueHandler.reinit_after_fork)
+    if hasattr(os, 'register_at_fork'):
+        # Python >= 3.7, also avoids forking in the middle of a batch
+        os.register_at_fork(
+            before=writer.before_fork,
+            after_in_parent=writer.after_fork,
+            after_in_child=writer.after_fork
+        )
+    return queuehandler, writer
+
+
+# The salt daemons log lines start with a timestamp, ie,
+# ``2017-03-01 10:00:00,123``
+DAEMON_LOG_TIMESTAMP_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})(?:[,.](\d{1,6}))?')
+DAEMON_LOG_MIN_TIMESTAMP = ('', '', 0)
+
+
+def _get_daemon_log_timestamp(line):
+    '''
+    Return a sortable timestamp from the start of a salt daemon log line or
+    ``None``
+    '''
+    match = DAEMON_LOG_TIMESTAMP_RE.match(line)
+    if match is None:
+        return None
+    date, time_, fraction = match.groups()
+    return (date, time_, int((fraction or '0').ljust(6, '0')))
+
+
+class DaemonLogsTailer(TestResultObserver):
+    '''
+    Follow the salt daemons log files and re-log each new line, prefixed
+    with the ID of the running test, to the ``salttesting.daemons.<name>``
+    logger. The lines end up in the tests suite log, next to the test's own
+    log messages.
+
+    The ``salttesting.daemons`` loggers don't propagate, the lines are only
+    handled by ``handlers``, ie, the tests logfile handler, and not by the
+    handlers capturing each test's log messages.
+
+    The files are polled every ``poll_interval`` seconds from a background
+    thread, and once more when each test stops, so the lines a test caused
+    are attributed to it and not to the next one. The lines read from the
+    several files on each poll are merged in the order of their timestamps.
+
+    .. code-block:: python
+
+        tailer = DaemonLogsTailer(
+            {'master': '/tmp/master.log', 'minion': '/tmp/minion.log'},
+            handlers=[filehandler]
+        )
+        tailer.start()
+        ...
+        tailer.stop()
+    '''
+
+    def __init__(self, log_files, handlers=(), poll_interval=0.25, level=logging.DEBUG):
+        # {name: [path, file object, position, partial line, last timestamp]}
+        self.log_files = dict([
+            (name, [path, None, 0, b'', DAEMON_LOG_MIN_TIMESTAMP]) for (name, path) in six.iteritems(log_files)
+        ])
+        self.poll_interval = poll_interval
+        self.level = level
+        self.current_test_id = None
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.__logger = logging.getLogger('salttesting.daemons')
+        self.__logger.propagate = False
+        self.__logger.setLevel(level)
+        self.__handlers = list(handlers)
+        for handler in self.__handlers:
+            self.__logger.addHandler(handler)
+        self.__loggers = dict([
+            (name, logging.getLogger('salttesting.daemons.{0}'.format(name))) for name in log_files
+        ])
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__run, name='DaemonLogsTailer')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        '''
+        Stop the background thread, re-log whatever is left and close the
+        log files
+        '''
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        with self.__lock:
+            self.__poll()
+            for entry in self.log_files.values():
+                if entry[1] is not None:
+                    entry[1].close()
+                    entry[1] = None
+        for handler in self.__handlers:
+            self.__logger.removeHandler(handler)
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            self.__stopped.wait(self.poll_interval)
+            with self.__lock:
+                self.__poll()
+
+    def poll(self):
+        '''
+        Re-log the lines written since the last poll
+        '''
+        with self.__lock:
+            self.__poll()
+
+    def __poll(self):
+        # [(timestamp, file order, line order, name, line)]
+        lines = []
+        for name, entry in sorted(six.iteritems(self.log_files)):
+            path, rfh, position, partial, timestamp = entry
+            if rfh is None:
+                try:
+                    rfh = entry[1] = open(path, 'rb')
+                except (IOError, OSError):
+                    # Not created yet
+                    continue
+            try:
+                size = os.fstat(rfh.fileno()).st_size
+                if size < position:
+                    # Truncated, start over
+                    position = 0
+                    partial = b''
+                if size == position:
+                    continue
+                rfh.seek(position)
+                data = rfh.read(size - position)
+            except (IOError, OSError):
+                continue
+            entry[2] = position + len(data)
+            file_lines = (partial + data).split(b'\n')
+            entry[3] = file_lines.pop()
+            for line in file_lines:
+                line = line.decode('utf-8', 'replace').rstrip()
+                # Lines without a timestamp, ie, tracebacks, stay after the
+                # line they belong to
+                timestamp = _get_daemon_log_timestamp(line) or timestamp
+                lines.append((timestamp, len(lines), name, line))
+            entry[4] = timestamp
+
+        test_id = self.current_test_id or '-'
+        for _, _, name, line in sorted(lines):
+            self.__loggers[name].log(self.level, '[%s] %s', test_id, line)
+
+    def start_test(self, test):
+        with self.__lock:
+            # Lines written before the test started are not it's lines
+            self.__poll()
+            self.current_test_id = test.id()
+
+    def stop_test(self, test, outcome, reason=None):
+        with self.__lock:
+            self.__poll()
+            self.current_test_id = None
@@ -51,6 +51,158 @@ class CheckShellBinaryNameAndVersionMixIn(object):
         self.assertIn(self._call_binary_expected_version_, out)
 
 
+class SaltStateReturn(object):
+    '''
+    View of a salt state return, as used by :class:`SaltReturnAssertsMixIn`.
+
+    Like the asserts always did, only the first state in the return is
+    considered. The first state and the :class:`SaltStateReturnSummary` of
+    the return are indexed once and re-indexed when states are added to,
+    or removed from, the return. The ``result``, ``comment``, ``changes``
+    and ``warnings`` lookups are done on the indexed state, they always
+    reflect it's current contents. Since the summary copies the states
+    results, call :meth:`invalidate` after changing those in place.
+    '''
+
+    __slots__ = ('ret', '_stamp', '_state', '_summary')
+
+    def __init__(self, ret):
+        self.ret = ret
+        self.invalidate()
+
+    def invalidate(self):
+        '''
+        Drop the indexed state and summary, they're indexed again when next
+        needed
+        '''
+        self._stamp = None
+        self._state = None
+        self._summary = None
+
+    def _index(self):
+        stamp = len(self.ret)
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._state = next(iter(self.ret.values()))
+            self._summary = None
+
+    @property
+    def state(self):
+        self._index()
+        return self._state
+
+    @property
+    def result(self):
+        return self.get(['result'])
+
+    @property
+    def comment(self):
+        return self.get(['comment'])
+
+    @property
+    def changes(self):
+        return self.get(['changes'])
+
+    @property
+    def warnings(self):
+        return self.get(['warnings'])
+
+    @property
+    def summary(self):
+        '''
+        The :class:`SaltStateReturnSummary` of all the states in the return
+        '''
+        self._index()
+        if self._summary is None:
+            self._summary = SaltStateReturnSummary(self.ret)
+        return self._summary
+
+    def get(self, keys):
+        '''
+        Return the value found by walking ``keys`` into the state return,
+        raising an :class:`AssertionError` if it's not there.
+        '''
+        ret_item = self.state
+        for key in keys:
+            try:
+                ret_item = ret_item[key]
+            except (KeyError, TypeError):
+                self.__raise_not_found(keys)
+        return ret_item
+
+    def __raise_not_found(self, keys):
+        raise AssertionError(
+            'Could not get ret{0} from salt\'s return: {1}'.format(
+                ''.join(['[{0!r}]'.format(k) for k in keys]), self.state
+            )
+        )
+
+
+class SaltStateReturnSummary(object):
+    '''
+    Columnar summary of all the states in a salt state return, ie, a
+    highstate return.
+
+    The return is scanned once into parallel ``ids``, ``results``,
+    ``changed`` and ``durations`` lists. Failure details, like the state
+    comments, are only looked up when formatting a failure message.
+    '''
+
+    __slots__ = ('ret', 'ids', 'results', 'changed', 'durations')
+
+    def __init__(self, ret):
+        self.ret = ret
+        self.ids = []
+        self.results = []
+        self.changed = []
+        self.durations = []
+        for state_id, state in six.iteritems(ret):
+            self.ids.append(state_id)
+            if isinstance(state, dict):
+                self.results.append(state.get('result'))
+                self.changed.append(bool(state.get('changes')))
+                self.durations.append(state.get('duration'))
+            else:
+                self.results.append(None)
+                self.changed.append(False)
+                self.durations.append(None)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def failing_ids(self):
+        '''
+        The state ids whose result is not ``True``
+        '''
+        return [state_id for (state_id, result) in zip(self.ids, self.results) if result is not True]
+
+    def changed_ids(self):
+        '''
+        The state ids which reported changes
+        '''
+        return [state_id for (state_id, changed) in zip(self.ids, self.changed) if changed]
+
+    def format_states(self, state_ids):
+        '''
+        Return a human readable description of the passed state ids
+        '''
+        lines = []
+        for state_id in sorted(state_ids):
+            state = self.ret.get(state_id)
+            if not isinstance(state, dict):
+                lines.append('  {0}: {1!r}'.format(state_id, state))
+                continue
+            lines.append(
+                '  {0}: result={1!r} duration={2} comment={3!r}'.format(
+                    state_id,
+                    state.get('result'),
+                    state.get('duration'),
+                    state.get('comment')
+                )
+            )
+        return '\n'.join(lines)
+
+
 class SaltReturnAssertsMixIn(object):
     '''
     Mix-in class to add as a companion to the TestCase class or it's subclasses which
@@ -68,6 +220,9 @@ class SaltReturnAssertsMixIn(object):
                 self.assertReturnSaltType(ret)
     '''
 
+    # The number of parsed salt returns to keep cached
+    _salt_state_returns_cache_size_ = 8
+
     def assertReturnSaltType(self, ret):
         try:
             self.assertTrue(isinstance(ret, dict))
@@ -99,29 +254,32 @@ class SaltReturnAssertsMixIn(object):
             raise RuntimeError('The passed keys need to be a list')
         return keys
 
-    def __getWithinSaltReturn(self, ret, keys):
+    def get_salt_state_return(self, ret):
+        '''
+        Return the :class:`SaltStateReturn` view of ``ret``.
+
+        The views of the most recently asserted returns are cached by object
+        identity, so, asserting several things about the same return only
+        validates it once. The cache is dropped when the test finishes.
+        '''
+        cache = self.__dict__.get('_salt_state_returns_cache')
+        if cache is None:
+            cache = self._salt_state_returns_cache = []
+            if hasattr(self, 'addCleanup'):
+                # Don't keep the, possibly huge, returns alive past the test
+                self.addCleanup(self.__dict__.pop, '_salt_state_returns_cache', None)
+        for cached_ret, view in cache:
+            if cached_ret is ret:
+                return view
         self.assertReturnNonEmptySaltType(ret)
-        keys = self.__return_valid_keys(keys)
-        okeys = keys[:]
-        for part in ret.itervalues():
-            try:
-                ret_item = part[okeys.pop(0)]
-            except (KeyError, TypeError):
-                raise AssertionError(
-                    'Could not get ret{0} from salt\'s return: {1}'.format(
-                        ''.join(['[{0!r}]'.format(k) for k in keys]), part
-                    )
-                )
-            while okeys:
-                try:
-                    ret_item = ret_item[okeys.pop(0)]
-                except (KeyError, TypeError):
-                    raise AssertionError(
-                        'Could not get ret{0} from salt\'s return: {1}'.format(
-                            ''.join(['[{0!r}]'.format(k) for k in keys]), part
-                        )
-                    )
-            return ret_item
+        view = SaltStateReturn(ret)
+        cache.insert(0, (ret, view))
+        # Don't hold on to more returns than needed
+        del cache[self._salt_state_returns_cache_size_:]
+        return view
+
+    def __getWithinSaltReturn(self, ret, keys):
+        return self.get_salt_state_return(ret).get(self.__return_valid_keys(keys))
 
     def assertSaltTrueReturn(self, ret):
         try:
@@ -223,6 +381,47 @@ class SaltReturnAssertsMixIn(object):
             self.__getWithinSaltReturn(ret, keys), comparison
         )
 
+    # ----- Bulk State Return Assertions -------------------------------------------------------------------------------->
+    # These consider every state in the return, not just the first one, and
+    # scan the return only once no matter how many states it holds
+
+    def assertAllSaltTrueReturn(self, ret):
+        summary = self.get_salt_state_return(ret).summary
+        failing = summary.failing_ids()
+        if failing:
+            raise AssertionError(
+                '{0} out of {1} states did not return True:\n{2}'.format(
+                    len(failing), len(summary), summary.format_states(failing)
+                )
+            )
+
+    def assertNoSaltStateChanges(self, ret):
+        summary = self.get_salt_state_return(ret).summary
+        changed = summary.changed_ids()
+        if changed:
+            raise AssertionError(
+                '{0} out of {1} states reported changes:\n{2}'.format(
+                    len(changed), len(summary), summary.format_states(changed)
+                )
+            )
+
+    def assertSaltFailingStateIds(self, ret, expected_ids):
+        summary = self.get_salt_state_return(ret).summary
+        failing = set(summary.failing_ids())
+        if isinstance(expected_ids, six.string_types):
+            expected_ids = [expected_ids]
+        expected_ids = set(expected_ids)
+        if failing != expected_ids:
+            unexpected = failing - expected_ids
+            missing = expected_ids - failing
+            msg = ['The set of failing states is not the expected one.']
+            if unexpected:
+                msg.append('Unexpectedly failing states:\n{0}'.format(summary.format_states(unexpected)))
+            if missing:
+                msg.append('States expected to fail which did not:\n{0}'.format(summary.format_states(missing)))
+            raise AssertionError('\n'.join(msg))
+    # <---- Bulk State Return Assertions ---------------------------------------------------------------------------------
+
 
 class AdaptedConfigurationTestCaseMixIn(object):
 
@@ -388,6 +587,171 @@ class ShellCaseCommonTestsMixIn(CheckShellBinaryNameAndVersionMixIn):
         self.assertIn(parsed_version.string, out)
 
 
+# Values of these types can be shared between tests since they can't be changed
+_IMMUTABLE_TYPES = six.string_types + six.integer_types + (six.binary_type, float, bool, type(None))
+
+
+def can_copy_on_write(source):
+    '''
+    Return ``True`` if ``source`` can be wrapped in a :class:`CopyOnWriteDict`
+    without any access leaking it's shared mutable values.
+
+    That's always the case under Python 3. Under Python 2 only flat
+    dictionaries, holding just immutable values, qualify.
+    '''
+    if six.PY3:
+        return True
+    return all(isinstance(value, _IMMUTABLE_TYPES) for value in six.itervalues(source))
+
+
+class CopyOnWriteDict(dict):
+    '''
+    Dictionary which starts as a shallow copy of a shared ``source``
+    dictionary and only deep copies it's mutable values the first time they
+    are accessed.
+
+    :class:`LoaderModuleMockMixin` uses it so that big, class level,
+    ``__opts__`` or ``__grains__`` fixtures don't get deep copied for every
+    single test, just the parts each test actually touches.
+
+    :meth:`copy` and :func:`copy.copy` return a plain dictionary with deep
+    copies of the mutable values.
+
+    .. note::
+
+        Under Python 2, ``dict(d)``, ``**d`` and ``other.update(d)`` read
+        the stored values directly and get the shared ones. Use
+        :func:`can_copy_on_write` to only wrap dictionaries for which that
+        is safe.
+    '''
+
+    def __init__(self, source):
+        dict.__init__(self, source)
+        self._source = source
+        self._pristine = set([
+            key for (key, value) in six.iteritems(source)
+            if not isinstance(value, _IMMUTABLE_TYPES)
+        ])
+        self._mutated = set()
+
+    def __materialize(self, key):
+        if key in self._pristine:
+            self._pristine.discard(key)
+            self._mutated.add(key)
+            dict.__setitem__(self, key, copy.deepcopy(dict.__getitem__(self, key)))
+
+    def __materialize_all(self):
+        for key in list(self._pristine):
+            self.__materialize(key)
+
+    @property
+    def mutated(self):
+        '''
+        The keys which were changed, or could have been changed in place,
+        since the dictionary was created or last reset
+        '''
+        return frozenset(self._mutated)
+
+    def reset(self):
+        '''
+        Restore the mutated keys to the shared ``source`` values
+        '''
+        for key in self._mutated:
+            if key in self._source:
+                value = self._source[key]
+                dict.__setitem__(self, key, value)
+                if not isinstance(value, _IMMUTABLE_TYPES):
+                    self._pristine.add(key)
+            elif key in self:
+                dict.__delitem__(self, key)
+        self._mutated = set()
+
+    def __getitem__(self, key):
+        self.__materialize(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self._pristine.discard(key)
+        self._mutated.add(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._pristine.discard(key)
+        self._mutated.add(key)
+        dict.__delitem__(self, key)
+
+    def __iter__(self):
+        # Defining it makes python 3 build ``dict(d)``, ``**d`` and
+        # ``other.update(d)`` through ``keys()`` and ``__getitem__``
+        return dict.__iter__(self)
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict.copy(self), memo)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, key, *args):
+        self.__materialize(key)
+        if key in self:
+            self._mutated.add(key)
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        self.__materialize_all()
+        key, value = dict.popitem(self)
+        self._mutated.add(key)
+        return key, value
+
+    def clear(self):
+        self._mutated.update(self.keys())
+        self._pristine = set()
+        dict.clear(self)
+
+    def update(self, *args, **kwargs):
+        for key, value in six.iteritems(dict(*args, **kwargs)):
+            self[key] = value
+
+    def copy(self):
+        return copy.deepcopy(dict.copy(self))
+
+    def values(self):
+        self.__materialize_all()
+        return dict.values(self)
+
+    def items(self):
+        self.__materialize_all()
+        return dict.items(self)
+
+    if six.PY2:
+        def itervalues(self):
+            self.__materialize_all()
+            return dict.itervalues(self)
+
+        def iteritems(self):
+            self.__materialize_all()
+            return dict.iteritems(self)
+
+        def viewvalues(self):
+            self.__materialize_all()
+            return dict.viewvalues(self)
+
+        def viewitems(self):
+            self.__materialize_all()
+            return dict.viewitems(self)
+
+
 class _FixLoaderModuleMockMixinMroOrder(type):
     '''
     This metaclass will make sure that LoaderModuleMockMixin will always come as the first
@@ -396,54 +760,155 @@ class _FixLoaderModuleMockMixinMroOrder(type):
     def __new__(mcs, cls_name, cls_bases, cls_dict):
         if cls_name == 'LoaderModuleMockMixin':
             return super(_FixLoaderModuleMockMixinMroOrder, mcs).__new__(mcs, cls_name, cls_bases, cls_dict)
-        bases = list(cls_bases)
-        for idx, base in enumerate(bases):
-            if base.__name__ == 'LoaderModuleMockMixin':
-                bases.insert(0, bases.pop(idx))
-                break
-        return super(_FixLoaderModuleMockMixinMroOrder, mcs).__new__(mcs, cls_name, tuple(bases), cls_dict)
+        if cls_bases and cls_bases[0].__name__ != 'LoaderModuleMockMixin':
+            # Only rebuild the bases when the mixin is not already first
+            bases = list(cls_bases)
+            for idx, base in enumerate(bases):
+                if base.__name__ == 'LoaderModuleMockMixin':
+                    bases.insert(0, bases.pop(idx))
+                    cls_bases = tuple(bases)
+                    break
+        return super(_FixLoaderModuleMockMixinMroOrder, mcs).__new__(mcs, cls_name, cls_bases, cls_dict)
 
 
 class LoaderModuleMockMixin(six.with_metaclass(_FixLoaderModuleMockMixinMroOrder, object)):
+
+    salt_dunders = (
+        '__opts__', '__salt__', '__runner__', '__context__', '__utils__',
+        '__ext_pillar__', '__thorium__', '__states__', '__serializers__', '__ret__',
+        '__grains__', '__pillar__', '__sdb__',
+        # Proxy is commented out on purpose since some code in salt expects a NameError
+        # and is most of the time not a required dunder
+        # '__proxy__'
+    )
+
+    # When ``True``, the loader module is patched once, in ``setUpClass``,
+    # instead of around every test. After each test, only the globals which
+    # the test changed, or rebound, are restored.
+    loader_module_class_scoped = False
+
+    @classmethod
+    def _get_loader_module_patch_spec(cls, loader_module, class_globals, loader_module_globals):
+        '''
+        Return the names of the dunders which need to be patched with an empty
+        dictionary and make sure the loader module has all the attributes to
+        be patched.
+
+        Unless ``loader_module_globals`` is a callable, this only depends on
+        class level attributes and is computed once per class.
+        '''
+        loader_module_blacklisted_dunders = getattr(cls, 'loader_module_blacklisted_dunders', ())
+        cache_key = (loader_module, class_globals, loader_module_blacklisted_dunders)
+        cached = cls.__dict__.get('_loader_module_patch_spec_')
+        if cached is not None and all([a is b for (a, b) in zip(cached[0], cache_key)]):
+            return cached[1]
+
+        empty_dunders = tuple([
+            dunder_name for dunder_name in cls.salt_dunders
+            if dunder_name not in loader_module_globals and
+            dunder_name not in loader_module_blacklisted_dunders
+        ])
+        for key in list(loader_module_globals) + list(empty_dunders):
+            if not hasattr(loader_module, key):
+                if key in cls.salt_dunders:
+                    setattr(loader_module, key, {})
+                else:
+                    setattr(loader_module, key, None)
+
+        if not callable(class_globals):
+            setattr(cls, '_loader_module_patch_spec_', (cache_key, empty_dunders))
+        return empty_dunders
+
+    @classmethod
+    def _get_loader_module_globals(cls, loader_module, empty_dunders_factory=dict, owner=None):
+        '''
+        Return the globals to patch the loader module with.
+
+        ``loader_module_globals`` is looked up on ``owner``, the test case
+        instance for per test patching, so that fixtures defined as regular
+        methods keep working. Class scoped patching looks it up on the
+        class, a callable fixture must then be a class or static method.
+        '''
+        class_globals = getattr(owner if owner is not None else cls, 'loader_module_globals', None)
+        if class_globals is None:
+            loader_module_globals = {}
+        elif callable(class_globals):
+            loader_module_globals = class_globals()
+        else:
+            # Share the class level fixture and only copy what each test
+            # actually touches
+            loader_module_globals = {}
+            for key, value in six.iteritems(class_globals):
+                if isinstance(value, dict) and can_copy_on_write(value):
+                    loader_module_globals[key] = CopyOnWriteDict(value)
+                else:
+                    loader_module_globals[key] = copy.deepcopy(value)
+
+        empty_dunders = cls._get_loader_module_patch_spec(
+            loader_module, class_globals, loader_module_globals
+        )
+        for dunder_name in empty_dunders:
+            loader_module_globals[dunder_name] = empty_dunders_factory()
+        return loader_module_globals
+
+    @classmethod
+    def setUpClass(cls):
+        loader_module = getattr(cls, 'loader_module', None)
+        if loader_module is not None and cls.loader_module_class_scoped and not NO_MOCK:
+            loader_module_globals = cls._get_loader_module_globals(
+                loader_module,
+                # Empty dunders are also tracked so they can be cheaply reset
+                empty_dunders_factory=lambda: CopyOnWriteDict({})
+            )
+            # Whatever is not a dictionary is deep copied again, from these
+            # values, after each test
+            snapshots = {}
+            for key, value in six.iteritems(loader_module_globals):
+                if not isinstance(value, CopyOnWriteDict) and not isinstance(value, _IMMUTABLE_TYPES):
+                    snapshots[key] = copy.deepcopy(value)
+            patcher = None
+            if loader_module_globals:
+                patcher = patch.multiple(loader_module.__name__, **loader_module_globals)
+                patcher.start()
+            cls._loader_module_class_patch_ = (patcher, loader_module_globals, snapshots)
+        super(LoaderModuleMockMixin, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        class_patch = cls.__dict__.get('_loader_module_class_patch_')
+        if class_patch is not None:
+            del cls._loader_module_class_patch_
+            if class_patch[0] is not None:
+                class_patch[0].stop()
+        super(LoaderModuleMockMixin, cls).tearDownClass()
+
+    def _reset_loader_module_globals(self, loader_module, loader_module_globals, snapshots):
+        '''
+        Restore, in place, the class scoped loader module globals which the
+        test which just ran changed
+        '''
+        for key, value in six.iteritems(loader_module_globals):
+            if key in snapshots:
+                value = loader_module_globals[key] = copy.deepcopy(snapshots[key])
+            elif isinstance(value, CopyOnWriteDict) and value.mutated:
+                value.reset()
+            if getattr(loader_module, key, None) is not value:
+                # The test rebound the global
+                setattr(loader_module, key, value)
+
     def setUp(self):
         loader_module = getattr(self, 'loader_module', None)
         if loader_module is not None:
             if NO_MOCK:
                 self.skipTest(NO_MOCK_REASON)
 
-            loader_module_name = loader_module.__name__
-            loader_module_globals = getattr(self, 'loader_module_globals', None)
-            loader_module_blacklisted_dunders = getattr(self, 'loader_module_blacklisted_dunders', ())
-            if loader_module_globals is None:
-                loader_module_globals = {}
-            elif callable(loader_module_globals):
-                loader_module_globals = loader_module_globals()
+            class_patch = self.__class__.__dict__.get('_loader_module_class_patch_')
+            if class_patch is not None:
+                self.addCleanup(self._reset_loader_module_globals, loader_module, *class_patch[1:])
             else:
-                loader_module_globals = copy.deepcopy(loader_module_globals)
-
-            salt_dunders = (
-                '__opts__', '__salt__', '__runner__', '__context__', '__utils__',
-                '__ext_pillar__', '__thorium__', '__states__', '__serializers__', '__ret__',
-                '__grains__', '__pillar__', '__sdb__',
-                # Proxy is commented out on purpose since some code in salt expects a NameError
-                # and is most of the time not a required dunder
-                # '__proxy__'
-            )
-            for dunder_name in salt_dunders:
-                if dunder_name not in loader_module_globals:
-                    if dunder_name in loader_module_blacklisted_dunders:
-                        continue
-                    loader_module_globals[dunder_name] = {}
-
-            for key in loader_module_globals:
-                if not hasattr(loader_module, key):
-                    if key in salt_dunders:
-                        setattr(loader_module, key, {})
-                    else:
-                        setattr(loader_module, key, None)
-
-            if loader_module_globals:
-                patcher = patch.multiple(loader_module_name, **loader_module_globals)
-                patcher.start()
-                self.addCleanup(patcher.stop)
+                loader_module_globals = self._get_loader_module_globals(loader_module, owner=self)
+                if loader_module_globals:
+                    patcher = patch.multiple(loader_module.__name__, **loader_module_globals)
+                    patcher.start()
+                    self.addCleanup(patcher.stop)
         super(LoaderModuleMockMixin, self).setUp()
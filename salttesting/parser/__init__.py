@@ -29,7 +29,11 @@ from contextlib import closing
 import six
 from salttesting import TestLoader, TextTestRunner
 from salttesting import helpers
+from salttesting import dockerpool
+from salttesting import log as tests_log
 from salttesting.version import __version_info__
+from salttesting.profiler import TestResourcesProfiler
+from salttesting.reporters import JSONLinesReporter, ProgressReporter
 from salttesting.xmlunit import HAS_XMLRUNNER, XMLTestRunner
 try:
     from salttesting.ext import console
@@ -154,6 +158,12 @@ class SaltTestingParser(optparse.OptionParser):
         optparse.OptionParser.__init__(self, *args, **kwargs)
         self.testsuite_directory = testsuite_directory
         self.testsuite_results = []
+        # TestResultObserver instances passed to every test runner
+        self.result_observers = []
+        self.progress_reporter = None
+        self.logging_writer = None
+        self.tests_logfile_handler = None
+        self.leaked_processes_tracker = None
 
         self.test_selection_group = optparse.OptionGroup(
             self,
@@ -195,6 +205,14 @@ class SaltTestingParser(optparse.OptionParser):
             help=('The location of a newline delimited file of test names to '
                   'run')
         )
+        self.test_selection_group.add_option(
+            '--shard',
+            default=None,
+            metavar='INDEX/COUNT',
+            help=('Only run the INDEX shard, starting at 1, of the tests '
+                  'split in COUNT shards. The tests of each test case class '
+                  'are kept in the same shard.')
+        )
         self.add_option_group(self.test_selection_group)
 
         if self.support_docker_execution is True:
@@ -231,6 +249,25 @@ class SaltTestingParser(optparse.OptionParser):
                 help='Skip docker container deletion on exit if errors '
                      'occurred. Default: False'
             )
+            self.docked_selection_group.add_option(
+                '--docked-pool-size',
+                default=0,
+                type=int,
+                metavar='N',
+                help=('Run the tests suite split in N shards, in parallel, '
+                      'each in a warm container, through \'docker exec\' and '
+                      'the image\'s entrypoint. Idle containers are kept '
+                      'running between runs, but each container only ever '
+                      'runs a single shard, it\'s then replaced by a fresh '
+                      'one. Default: %default, a single \'docker run\'')
+            )
+            self.docked_selection_group.add_option(
+                '--docked-pool-teardown',
+                default=False,
+                action='store_true',
+                help=('Remove the \'--docked-pool-size\' warm containers '
+                      'when done. Default: False')
+            )
             self.docked_selection_group.add_option(
                 '--docker-binary',
                 help='The docker binary on the host system. Default: %default',
@@ -260,6 +297,49 @@ class SaltTestingParser(optparse.OptionParser):
             default=self.tests_logfile,
             help='The path to the tests suite logging logfile'
         )
+        self.output_options_group.add_option(
+            '--async-logging',
+            default=False,
+            action='store_true',
+            help=('Write the tests suite logfile from a background thread, '
+                  'logging calls only enqueue the log records')
+        )
+        self.output_options_group.add_option(
+            '--tests-logfile-max-bytes',
+            default=0,
+            type=int,
+            help=('Rotate the tests suite logfile when it reaches this size. '
+                  'Implies --async-logging')
+        )
+        self.output_options_group.add_option(
+            '--tests-logfile-backups',
+            default=5,
+            type=int,
+            help=('How many rotated tests suite logfiles to keep. '
+                  'Default: %default')
+        )
+        self.output_options_group.add_option(
+            '--compress-tests-logfile',
+            default=False,
+            action='store_true',
+            help='Gzip compress the tests suite logfile. Implies --async-logging'
+        )
+        self.output_options_group.add_option(
+            '--index-tests-logfile',
+            default=False,
+            action='store_true',
+            help=('Index where each test\'s log starts and ends in the tests '
+                  'suite logfile, and include the log of each failed test in '
+                  'the overall tests report')
+        )
+        self.output_options_group.add_option(
+            '--failed-test-log-lines',
+            default=100,
+            type=int,
+            help=('Include, at most, the last N lines of each failed test\'s '
+                  'log in the overall tests report. 0 includes all of them. '
+                  'Default: %default')
+        )
         if self.xml_output_dir is not None:
             self.output_options_group.add_option(
                 '-x',
@@ -277,6 +357,67 @@ class SaltTestingParser(optparse.OptionParser):
             action='store_true',
             help='Do NOT show the overall tests result'
         )
+        self.output_options_group.add_option(
+            '--tests-resources-report',
+            default=None,
+            help=('Write a JSON report with the wall time, CPU time, peak RSS, '
+                  'open file descriptors and left behind child processes of '
+                  'each test to this path')
+        )
+        self.output_options_group.add_option(
+            '--tests-resources-sample-every',
+            default=1,
+            type=int,
+            help=('Only gather the expensive resources metrics for one in '
+                  'every N tests. Default: %default')
+        )
+        self.output_options_group.add_option(
+            '--results-stream',
+            default=None,
+            help=('Append a JSON record, one per line, to this file when each '
+                  'test starts and stops, as it happens')
+        )
+        self.output_options_group.add_option(
+            '--results-stream-log-lines',
+            default=50,
+            type=int,
+            help=('How many of the last log messages emitted by a failed test '
+                  'to include in it\'s results stream record. Default: %default')
+        )
+        self.output_options_group.add_option(
+            '--progress',
+            default=False,
+            action='store_true',
+            help=('Periodically print the tests run progress, the estimated '
+                  'time to completion and the pass/fail tally')
+        )
+        self.output_options_group.add_option(
+            '--progress-interval',
+            default=10,
+            type=float,
+            help=('Print the tests run progress at most once every N seconds. '
+                  'Default: %default')
+        )
+        self.output_options_group.add_option(
+            '--durations-file',
+            default=None,
+            help=('Load the tests durations, used to estimate the time to '
+                  'completion, from this file and save them back to it')
+        )
+        self.output_options_group.add_option(
+            '--track-leaked-processes',
+            default=False,
+            action='store_true',
+            help=('Report the tests which left child processes running after '
+                  'they finished')
+        )
+        self.output_options_group.add_option(
+            '--reap-leaked-processes',
+            default=False,
+            action='store_true',
+            help=('Terminate the child processes left running by a test as soon '
+                  'as it finishes. Implies \'--track-leaked-processes\'')
+        )
         self.add_option_group(self.output_options_group)
 
         self.fs_cleanup_options_group = optparse.OptionGroup(
@@ -357,10 +498,7 @@ class SaltTestingParser(optparse.OptionParser):
                     'in {0!r}.'.format(self.__class__.__name__)
                 )
 
-            if '/' not in self.options.docked:
-                self.options.docked = 'salttest/{0}'.format(
-                    self.options.docked
-                )
+            self.options.docked = self._get_docked_image()
 
             if self.options.docked_interpreter is None:
                 self.options.docked_interpreter = self._known_interpreters.get(
@@ -369,6 +507,8 @@ class SaltTestingParser(optparse.OptionParser):
 
             # No more processing should be done. We'll exit with the return
             # code we get from the docker container execution
+            if self.options.docked_pool_size > 0:
+                self.exit(self.run_suite_in_docker_pool())
             self.exit(self.run_suite_in_docker())
 
         # Validate options after checking that we're not goint to execute the
@@ -400,6 +540,19 @@ class SaltTestingParser(optparse.OptionParser):
                 'installed.'
             )
 
+        if getattr(self.options, 'shard', None) is not None:
+            try:
+                dockerpool.parse_shard(self.options.shard)
+            except ValueError as exc:
+                self.error('\'--shard\': {0}'.format(exc))
+
+        if self.options.tests_logfile_max_bytes and \
+                (self.options.compress_tests_logfile or self.options.index_tests_logfile):
+            self.error(
+                '\'--tests-logfile-max-bytes\' can\'t be used with '
+                '\'--compress-tests-logfile\' or \'--index-tests-logfile\''
+            )
+
         if self.options.xml_out:
             # Override any environment setting with the passed value
             self.xml_output_dir = self.options.xml_out
@@ -412,6 +565,35 @@ class SaltTestingParser(optparse.OptionParser):
                 'at {0!r}'.format(self.xml_output_dir)
             )
 
+        if self.options.tests_resources_report:
+            self.result_observers.append(
+                TestResourcesProfiler(
+                    self.options.tests_resources_report,
+                    sample_every=self.options.tests_resources_sample_every
+                )
+            )
+
+        if self.options.results_stream:
+            self.result_observers.append(
+                JSONLinesReporter(
+                    self.options.results_stream,
+                    log_excerpt_size=self.options.results_stream_log_lines
+                )
+            )
+
+        if self.options.progress:
+            self.progress_reporter = ProgressReporter(
+                durations_file=self.options.durations_file,
+                interval=self.options.progress_interval
+            )
+            self.result_observers.append(self.progress_reporter)
+
+        if self.options.track_leaked_processes or self.options.reap_leaked_processes:
+            self.leaked_processes_tracker = helpers.ChildProcessLeakTracker(
+                reap=self.options.reap_leaked_processes
+            )
+            self.result_observers.append(self.leaked_processes_tracker)
+
         self.validate_options()
 
         if self.support_destructive_tests_selection:
@@ -451,14 +633,40 @@ class SaltTestingParser(optparse.OptionParser):
         logging.root.setLevel(logging.NOTSET)
 
         if self.options.tests_logfile:
-            filehandler = logging.FileHandler(
-                mode='w',           # Not preserved between re-runs
-                filename=self.options.tests_logfile
-            )
+            queued_logging = (self.options.async_logging or
+                              self.options.tests_logfile_max_bytes or
+                              self.options.compress_tests_logfile)
+            if queued_logging:
+                filehandler = tests_log.get_file_handler(
+                    self.options.tests_logfile,
+                    mode='w',       # Not preserved between re-runs
+                    max_bytes=self.options.tests_logfile_max_bytes,
+                    backup_count=self.options.tests_logfile_backups,
+                    compress=self.options.compress_tests_logfile,
+                    index=self.options.index_tests_logfile
+                )
+            elif self.options.index_tests_logfile:
+                filehandler = tests_log.IndexedFileHandler(
+                    mode='w',           # Not preserved between re-runs
+                    filename=self.options.tests_logfile
+                )
+            else:
+                filehandler = logging.FileHandler(
+                    mode='w',           # Not preserved between re-runs
+                    filename=self.options.tests_logfile
+                )
+            if self.options.index_tests_logfile:
+                self.tests_logfile_handler = filehandler
             # The logs of the file are the most verbose possible
             filehandler.setLevel(logging.DEBUG)
             filehandler.setFormatter(formatter)
-            logging.root.addHandler(filehandler)
+            if queued_logging:
+                # Log records are only enqueued, the file is written by a
+                # background thread
+                queuehandler, self.logging_writer = tests_log.setup_queued_logging((filehandler,))
+                logging.root.addHandler(queuehandler)
+            else:
+                logging.root.addHandler(filehandler)
 
             print(' * Logging tests on {0}'.format(self.options.tests_logfile))
 
@@ -520,24 +728,59 @@ class SaltTestingParser(optparse.OptionParser):
                 additional_tests = loader.discover(test_dir, suffix, test_dir)
                 tests.addTests(additional_tests)
 
+        if getattr(self.options, 'shard', None) is not None:
+            tests = dockerpool.shard_tests(
+                tests, *dockerpool.parse_shard(self.options.shard)
+            )
+
         header = '{0} Tests'.format(display_name)
         print_header('Starting {0}'.format(header),
                      width=self.options.output_columns)
 
+        if self.progress_reporter is not None:
+            self.progress_reporter.add_tests(tests)
+
         if self.options.xml_out:
             runner = XMLTestRunner(
                 stream=sys.stdout,
                 output=self.xml_output_dir,
-                verbosity=self.options.verbosity
+                verbosity=self.options.verbosity,
+                observers=self.result_observers
             ).run(tests)
             self.testsuite_results.append((header, runner))
         else:
             runner = TextTestRunner(
                 stream=sys.stdout,
-                verbosity=self.options.verbosity).run(tests)
+                verbosity=self.options.verbosity,
+                observers=self.result_observers).run(tests)
             self.testsuite_results.append((header, runner))
         return runner.wasSuccessful()
 
+    def print_test_log(self, testcase):
+        '''
+        Print the log of the provided test, if the tests logfile is indexed
+        '''
+        handler = self.tests_logfile_handler
+        if handler is None:
+            return
+        if self.logging_writer is not None:
+            self.logging_writer.drain()
+        segment = handler.read_segment(testcase.id())
+        if not segment:
+            return
+        lines = segment.rstrip().splitlines()
+        max_lines = self.options.failed_test_log_lines
+        print_header(u'   ', sep=u'.', inline=True,
+                     width=self.options.output_columns)
+        if max_lines and len(lines) > max_lines:
+            print(u'       Test Log (last {0} of {1} lines):'.format(
+                max_lines, len(lines)))
+            lines = lines[-max_lines:]
+        else:
+            print(u'       Test Log:')
+        for line in lines:
+            print(u'       {0}'.format(line.rstrip()))
+
     def print_overall_testsuite_report(self):
         '''
         Print a nicely formatted report about the test suite results
@@ -596,6 +839,7 @@ class SaltTestingParser(optparse.OptionParser):
                     )
                     for line in reason.rstrip().splitlines():
                         print('       {0}'.format(line.rstrip()))
+                    self.print_test_log(testcase)
                     print_header(u'   ', sep=u'.', inline=True,
                                  width=self.options.output_columns)
                 print_header(u' ', sep='-', inline=True,
@@ -614,11 +858,34 @@ class SaltTestingParser(optparse.OptionParser):
                     )
                     for line in reason.rstrip().splitlines():
                         print('       {0}'.format(line.rstrip()))
+                    self.print_test_log(testcase)
                     print_header(u'   ', sep=u'.', inline=True,
                                  width=self.options.output_columns)
                 print_header(u' ', sep='-', inline=True,
                              width=self.options.output_columns)
 
+        leaks_tracker = self.leaked_processes_tracker
+        if leaks_tracker is not None and leaks_tracker.leaks:
+            no_problems_found = False
+            print_header(
+                u' --------  Tests Which Left Child Processes Running  ', sep='-',
+                inline=True, width=self.options.output_columns
+            )
+            for test_id, entries in leaks_tracker.leaks:
+                print_header(
+                    u'   -> {0}  '.format(test_id),
+                    sep=u'.', inline=True,
+                    width=self.options.output_columns
+                )
+                for entry in entries:
+                    print(u'       PID {0}{1}: {2}'.format(
+                        entry['pid'], ' (reaped)' if entry['reaped'] else '', entry['cmdline']
+                    ))
+                print_header(u'   ', sep=u'.', inline=True,
+                             width=self.options.output_columns)
+            print_header(u' ', sep='-', inline=True,
+                         width=self.options.output_columns)
+
         if no_problems_found:
             print_header(
                 u'***  No Problems Found While Running Tests  ',
@@ -666,6 +933,55 @@ class SaltTestingParser(optparse.OptionParser):
         )
         self.exit(exit_code)
 
+    def _get_docked_calling_args(self, skip_dests=()):
+        '''
+        Return the tests suite command line arguments to pass along to the
+        tests suite running in a docker container
+        '''
+        calling_args = []
+        for option in self._get_all_options():
+            if option.dest is None:
+                # For example --version
+                continue
+
+            if option.dest and (option.dest in ('verbosity',) + tuple(skip_dests) or
+                                option.dest.startswith('docked')):
+                # We don't need to pass any docker related arguments inside the
+                # container, and verbose will be handled bellow
+                continue
+
+            default = self.defaults.get(option.dest)
+            value = getattr(self.options, option.dest, default)
+
+            if default == value:
+                # This is the default value, no need to pass the option to the
+                # parser
+                continue
+
+            if option.action.startswith('store_'):
+                calling_args.append(option.get_opt_string())
+
+            elif option.action == 'append':
+                for val in (value is not None and value or default):
+                    calling_args.extend([option.get_opt_string(), str(val)])
+            elif option.action == 'count':
+                calling_args.extend([option.get_opt_string()] * value)
+            else:
+                calling_args.extend(
+                    [option.get_opt_string(),
+                    str(value is not None and value or default)]
+                )
+
+        if not self.options.run_destructive:
+            calling_args.append('--run-destructive')
+
+        if self.options.verbosity > 1:
+            calling_args.append(
+                '-{0}'.format('v' * (self.options.verbosity - 1))
+            )
+
+        return calling_args
+
     def run_suite_in_docker(self):
         '''
         Run the tests suite in a Docker container
@@ -757,53 +1073,11 @@ class SaltTestingParser(optparse.OptionParser):
             sys.exit(returncode)
 
         # Let's start the Docker container and run the tests suite there
-        if '/' not in self.options.docked:
-            container = 'salttest/{0}'.format(self.options.docked)
-        else:
-            container = self.options.docked
+        container = self._get_docked_image()
 
         calling_args = [self.options.docked_interpreter,
                         '/salt-source/tests/runtests.py']
-        for option in self._get_all_options():
-            if option.dest is None:
-                # For example --version
-                continue
-
-            if option.dest and (option.dest in ('verbosity',) or
-                                option.dest.startswith('docked')):
-                # We don't need to pass any docker related arguments inside the
-                # container, and verbose will be handled bellow
-                continue
-
-            default = self.defaults.get(option.dest)
-            value = getattr(self.options, option.dest, default)
-
-            if default == value:
-                # This is the default value, no need to pass the option to the
-                # parser
-                continue
-
-            if option.action.startswith('store_'):
-                calling_args.append(option.get_opt_string())
-
-            elif option.action == 'append':
-                for val in (value is not None and value or default):
-                    calling_args.extend([option.get_opt_string(), str(val)])
-            elif option.action == 'count':
-                calling_args.extend([option.get_opt_string()] * value)
-            else:
-                calling_args.extend(
-                    [option.get_opt_string(),
-                    str(value is not None and value or default)]
-                )
-
-        if not self.options.run_destructive:
-            calling_args.append('--run-destructive')
-
-        if self.options.verbosity > 1:
-            calling_args.append(
-                '-{0}'.format('v' * (self.options.verbosity - 1))
-            )
+        calling_args.extend(self._get_docked_calling_args())
 
         sys.stdout.write(' * Docker command: {0}\n'.format(' '.join(calling_args)))
         sys.stdout.write(' * Running the tests suite under the {0!r} docker '
@@ -898,6 +1172,84 @@ class SaltTestingParser(optparse.OptionParser):
         else:
             sys.exit(call.returncode)
 
+    def _get_docked_image(self):
+        '''
+        Return the ``--docked`` image name, images without a repository are
+        the ``salttest`` ones
+        '''
+        if '/' not in self.options.docked:
+            return 'salttest/{0}'.format(self.options.docked)
+        return self.options.docked
+
+    def run_suite_in_docker_pool(self):
+        '''
+        Run the tests suite split in shards across a pool of warm Docker
+        containers, see :mod:`salttesting.dockerpool`
+        '''
+        image = self._get_docked_image()
+        pool = dockerpool.WarmContainerPool(
+            image,
+            self.options.docked_pool_size,
+            self.source_code_basedir,
+            docker_binary=self.options.docker_binary
+        )
+        calling_args = [self.options.docked_interpreter,
+                        '/salt-source/tests/runtests.py']
+        # Each shard gets it's own results stream, merged back here
+        calling_args.extend(
+            self._get_docked_calling_args(skip_dests=('shard', 'results_stream'))
+        )
+
+        sys.stdout.write(' * Docker command: {0}\n'.format(' '.join(calling_args)))
+        try:
+            warm = pool.start()
+        except RuntimeError as exc:
+            print(' * {0}'.format(exc))
+            return 1
+        print(
+            ' * Running the tests suite in {0} shards across {1!r} docker '
+            'containers, {2} already warm'.format(
+                self.options.docked_pool_size, image, warm
+            )
+        )
+        print_header('', inline=True, width=self.options.output_columns)
+        sys.stdout.flush()
+
+        runner = dockerpool.ShardsRunner(
+            pool,
+            calling_args,
+            self.options.docked_pool_size,
+            results_stream=self.options.results_stream,
+            environ={
+                'COLUMNS': str(WIDTH),
+                'LINES': str(HEIGHT),
+            }
+        )
+        returncode = runner.run()
+
+        print_header('', inline=True, width=self.options.output_columns)
+        for index in sorted(runner.results):
+            container, shard_returncode = runner.results[index]
+            print(
+                ' * Shard {0}/{1} ran in {2}, exit code: {3}'.format(
+                    index, self.options.docked_pool_size, container, shard_returncode
+                )
+            )
+        if runner.outcomes:
+            print(
+                ' * Outcomes: {0}'.format(
+                    ', '.join([
+                        '{0}={1}'.format(outcome, count)
+                        for (outcome, count) in sorted(runner.outcomes.items())
+                    ])
+                )
+            )
+        if self.options.docked_pool_teardown:
+            print(' * Removing the warm containers')
+        pool.teardown(remove=self.options.docked_pool_teardown)
+        print_header('', inline=True, width=self.options.output_columns)
+        return returncode
+
 
 class SaltTestcaseParser(SaltTestingParser):
     '''
@@ -931,8 +1283,12 @@ class SaltTestcaseParser(SaltTestingParser):
             print_header('Starting {0}'.format(header),
                          width=self.options.output_columns)
 
+        if self.progress_reporter is not None:
+            self.progress_reporter.add_tests(tests)
+
         runner = TextTestRunner(
-            verbosity=self.options.verbosity).run(tests)
+            verbosity=self.options.verbosity,
+            observers=self.result_observers).run(tests)
         self.testsuite_results.append((header, runner))
         return runner.wasSuccessful()
 
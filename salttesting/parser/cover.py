@@ -16,10 +16,12 @@ import os
 import re
 import sys
 import json
+import multiprocessing
 import shutil
 import warnings
 
 # Import salt testing libs
+from salttesting import coverdata
 from salttesting.parser import SaltTestingParser
 
 # Import coverage libs
@@ -48,8 +50,7 @@ try:
         if coverage_options.get('data_suffix', False) is False:
             return
 
-        coverage_object = coverage.coverage(**coverage_options)
-        coverage_object.start()
+        coverage_object = coverdata.start_process_coverage(coverage_options)
 
         multiprocessing.util.Finalize(
             None,
@@ -88,6 +89,8 @@ class SaltCoverageTestingParser(SaltTestingParser):
 
         SaltTestingParser.__init__(self, *args, **kwargs)
         self.code_coverage = None
+        self.code_coverage_options = None
+        self.code_coverage_combiner = None
 
         # Add the coverage related options
         self.output_options_group.add_option(
@@ -115,6 +118,62 @@ class SaltCoverageTestingParser(SaltTestingParser):
                   'will be saved to. The directory, if existing, will be '
                   'deleted before the report is generated.')
         )
+        self.output_options_group.add_option(
+            '--coverage-impact-map',
+            default=None,
+            help=('Record which tests cover each line and save that test '
+                  'impact map to this path, gzip compressed if it ends with '
+                  '\'.gz\'. The entries of the tests not run are kept. '
+                  'Requires coverage>=5.0')
+        )
+        self.output_options_group.add_option(
+            '--coverage-combine-interval',
+            default=0,
+            type=int,
+            help=('Combine the coverage data files of the processes which '
+                  'finished every N seconds, while the tests are running. '
+                  'Default: %default, disabled')
+        )
+        self.output_options_group.add_option(
+            '--coverage-combine-processes',
+            default=multiprocessing.cpu_count(),
+            type=int,
+            help=('Combine the coverage data files left when the tests suite '
+                  'finishes using N processes. Default: %default')
+        )
+        self.output_options_group.add_option(
+            '--coverage-line-hit-once',
+            default=False,
+            action='store_true',
+            help=('Lower overhead code coverage, for long running tests '
+                  'suites. On Python>=3.12, each line is only traced, using '
+                  'sys.monitoring, until it\'s first executed. On older '
+                  'pythons it\'s regular coverage, with its C tracer, only '
+                  'measuring lines. Branch coverage is never measured. '
+                  'Requires coverage>=5.0')
+        )
+        self.output_options_group.add_option(
+            '--parallel-coverage-reports',
+            default=False,
+            action='store_true',
+            help=('Generate the XML and HTML coverage reports in parallel, '
+                  'from the combined coverage data')
+        )
+        self.output_options_group.add_option(
+            '--background-coverage-reports',
+            default=False,
+            action='store_true',
+            help=('Generate the coverage reports in a detached process, '
+                  'which writes the \'--coverage-reports-marker\' file when '
+                  'done, instead of waiting for them before exiting')
+        )
+        self.output_options_group.add_option(
+            '--coverage-reports-marker',
+            default=None,
+            help=('The file written, as JSON, when the background coverage '
+                  'reports are done. Default: \'{0}\' next to the coverage '
+                  'data file'.format(coverdata.REPORTS_MARKER_NAME))
+        )
 
     def _validate_options(self):
         if (self.options.coverage_xml or self.options.coverage_html) and \
@@ -139,6 +198,16 @@ class SaltCoverageTestingParser(SaltTestingParser):
                     'know to produce incorrect results. Please consider '
                     'upgrading...'
                 )
+            if self.options.coverage_impact_map and not coverdata.SUPPORTS_CONTEXTS:
+                self.error('\'--coverage-impact-map\' requires coverage>=5.0')
+            if self.options.coverage_line_hit_once:
+                if not coverdata.SUPPORTS_LINE_HIT_ONCE:
+                    self.error('\'--coverage-line-hit-once\' requires coverage>=5.0')
+                if self.options.coverage_impact_map:
+                    self.error(
+                        '\'--coverage-line-hit-once\' and '
+                        '\'--coverage-impact-map\' are mutually exclusive'
+                    )
         SaltTestingParser._validate_options(self)
 
     def pre_execution_cleanup(self):
@@ -170,6 +239,10 @@ class SaltCoverageTestingParser(SaltTestingParser):
             )
         print(' * Starting Coverage')
 
+        if self.options.coverage_line_hit_once:
+            coverage_options['branch'] = False
+            coverage_options['line_hit_once'] = True
+
         if self.options.no_processes_coverage is False:
             # Update environ so that any subprocess started on tests are also
             # included in the report
@@ -178,9 +251,23 @@ class SaltCoverageTestingParser(SaltTestingParser):
             os.environ['COVERAGE_OPTIONS'] = json.dumps(coverage_options)
 
         # Setup coverage
-        self.code_coverage = coverage.coverage(**coverage_options)
+        self.code_coverage_options = coverage_options
+        self.code_coverage = coverdata.create_coverage(coverage_options)
         self.code_coverage.start()
 
+        if self.options.no_processes_coverage is False:
+            self.code_coverage_combiner = coverdata.CoverageDataCombiner(
+                self.code_coverage.config.data_file,
+                interval=self.options.coverage_combine_interval,
+                processes=self.options.coverage_combine_processes
+            )
+            self.code_coverage_combiner.start()
+
+        if self.options.coverage_impact_map:
+            self.result_observers.append(
+                coverdata.CoverageContextSwitcher(self.code_coverage)
+            )
+
     def stop_coverage(self, save_coverage=True):
         '''
         Stop code coverage.
@@ -201,9 +288,59 @@ class SaltCoverageTestingParser(SaltTestingParser):
         if self.options.no_processes_coverage is False:
             # Combine any multiprocessing coverage data files
             print(' * Combining multiple coverage info files ... '),
-            self.code_coverage.combine()
+            self.code_coverage_combiner.stop()
+            self.code_coverage_combiner.combine(self.code_coverage)
+            print('Done.')
+
+        if self.options.coverage_impact_map:
+            print(
+                ' * Writing The Test Impact Map At {0!r} ... '.format(
+                    self.options.coverage_impact_map
+                )
+            ),
+            sys.stdout.flush()
+            coverdata.write_test_impact_map(
+                self.options.coverage_impact_map,
+                coverdata.build_test_impact_map(
+                    self.code_coverage.get_data(),
+                    coverdata.get_test_impact_map_root(self.source_code_basedir or os.getcwd())
+                )
+            )
             print('Done.')
 
+        if self.options.coverage_xml is None and self.options.coverage_html is None:
+            return
+
+        if self.options.background_coverage_reports:
+            marker_file = coverdata.start_background_reports(
+                coverdata.get_combined_data_file(self.code_coverage),
+                self.code_coverage_options,
+                xml_output=self.options.coverage_xml,
+                html_output=self.options.coverage_html,
+                parallel=self.options.parallel_coverage_reports,
+                marker_file=self.options.coverage_reports_marker
+            )
+            print(
+                ' * Generating Coverage Reports In The Background, done when '
+                '{0!r} exists'.format(marker_file)
+            )
+            return
+
+        if self.options.parallel_coverage_reports:
+            print(' * Generating Coverage Reports In Parallel ... '),
+            sys.stdout.flush()
+            errors = coverdata.write_reports(
+                coverdata.get_combined_data_file(self.code_coverage),
+                self.code_coverage_options,
+                xml_output=self.options.coverage_xml,
+                html_output=self.options.coverage_html,
+                parallel=True
+            )
+            print('Done.')
+            for error in errors:
+                print('   {0}'.format(error))
+            return
+
         if self.options.coverage_xml is not None:
             print(
                 ' * Generating Coverage XML Report At {0!r} ... '.format(
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    salttesting.profiler
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Per test resources profiling.
+
+    The :class:`TestResourcesProfiler` observer records, for each test, the
+    wall time, CPU time, peak RSS, open file descriptors and the child
+    processes the test left behind, and writes them to a JSON report.
+
+    .. code-block:: python
+
+        runner = TextTestRunner(
+            observers=[TestResourcesProfiler('/tmp/resources.json', sample_every=10)]
+        )
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import sys
+import json
+import time
+import logging
+import threading
+
+# Import salt testing libs
+from salttesting.unit import TestResultObserver
+
+# Import 3rd-party libs
+import six
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+log = logging.getLogger(__name__)
+
+
+class _PeakRSSSampler(threading.Thread):
+    '''
+    Background thread which, while sampling, polls the RSS every ``interval``
+    seconds and keeps the highest value seen
+    '''
+
+    def __init__(self, get_rss, interval):
+        super(_PeakRSSSampler, self).__init__(name='PeakRSSSampler')
+        self.daemon = True
+        self.get_rss = get_rss
+        self.interval = interval
+        self.__lock = threading.Lock()
+        self.__sampling = threading.Event()
+        self.__stopped = False
+        # Bumped on each start_sampling() so that a sample taken for the
+        # previous test is never attributed to the next one
+        self.__generation = 0
+        self.__peak = None
+
+    def __record(self, generation, rss):
+        with self.__lock:
+            if generation != self.__generation or not self.__sampling.is_set():
+                return
+            if rss is not None and (self.__peak is None or rss > self.__peak):
+                self.__peak = rss
+
+    def run(self):
+        while True:
+            self.__sampling.wait()
+            if self.__stopped:
+                return
+            generation = self.__generation
+            self.__record(generation, self.get_rss())
+            time.sleep(self.interval)
+
+    def start_sampling(self):
+        with self.__lock:
+            self.__generation += 1
+            self.__peak = None
+            self.__sampling.set()
+        self.__record(self.__generation, self.get_rss())
+
+    def stop_sampling(self):
+        '''
+        Stop sampling and return the peak RSS since :meth:`start_sampling`
+        '''
+        self.__record(self.__generation, self.get_rss())
+        with self.__lock:
+            self.__sampling.clear()
+            return self.__peak
+
+    def stop(self):
+        self.__stopped = True
+        self.__sampling.set()
+
+
+class TestResourcesProfiler(TestResultObserver):
+    '''
+    Record the resources used by each test.
+
+    Wall and CPU times are cheap to gather and are recorded for every test.
+    The remaining metrics need to query the process and are only gathered
+    for one in every ``sample_every`` tests, which keeps the overhead low on
+    big test suites. While a sampled test runs, a background thread polls the
+    RSS every ``rss_interval`` seconds to record the test's peak RSS.
+
+    The report is (re)written, at ``report_path``, at the end of each tests
+    run.
+    '''
+
+    def __init__(self, report_path, sample_every=1, rss_interval=0.05):
+        self.report_path = report_path
+        self.sample_every = max(1, int(sample_every))
+        self.rss_interval = rss_interval
+        self.records = []
+        self.__process = None
+        self.__sampler = None
+        self.__counter = 0
+        self.__current = None
+
+    def _get_rss(self):
+        '''
+        Return the current resident set size, in bytes
+        '''
+        if HAS_PSUTIL:
+            return self.process.memory_info().rss
+        try:
+            with open('/proc/self/statm') as rfh:
+                return int(rfh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (IOError, OSError, ValueError, IndexError):
+            return None
+
+    @property
+    def process(self):
+        if self.__process is None and HAS_PSUTIL:
+            self.__process = psutil.Process(os.getpid())
+        return self.__process
+
+    def _get_num_fds(self):
+        if HAS_PSUTIL and hasattr(self.process, 'num_fds'):
+            return self.process.num_fds()
+        try:
+            return len(os.listdir('/proc/self/fd'))
+        except OSError:
+            return None
+
+    def _get_children(self):
+        if not HAS_PSUTIL:
+            return {}
+        children = {}
+        for child in self.process.children(recursive=True):
+            try:
+                if child.status() == psutil.STATUS_ZOMBIE:
+                    continue
+                children[(child.pid, child.create_time())] = child
+            except psutil.NoSuchProcess:
+                continue
+        return children
+
+    def start_test(self, test):
+        sampled = self.__counter % self.sample_every == 0
+        self.__counter += 1
+        cpu_times = os.times()
+        self.__current = {
+            'sampled': sampled,
+            'start': time.time(),
+            'cpu': cpu_times[0] + cpu_times[1],
+            'children_cpu': cpu_times[2] + cpu_times[3],
+        }
+        if sampled:
+            self.__current['children'] = self._get_children()
+            if self.__sampler is None:
+                self.__sampler = _PeakRSSSampler(self._get_rss, self.rss_interval)
+                self.__sampler.start()
+            self.__current['rss'] = self._get_rss()
+            self.__sampler.start_sampling()
+
+    def stop_test(self, test, outcome, reason=None):
+        current, self.__current = self.__current, None
+        if current is None:
+            return
+        cpu_times = os.times()
+        record = {
+            'id': test.id(),
+            'outcome': outcome,
+            'wall_time': time.time() - current['start'],
+            'cpu_time': cpu_times[0] + cpu_times[1] - current['cpu'],
+            'children_cpu_time': cpu_times[2] + cpu_times[3] - current['children_cpu'],
+            'sampled': current['sampled'],
+        }
+        if current['sampled']:
+            peak_rss = self.__sampler.stop_sampling()
+            record['peak_rss'] = peak_rss
+            record['peak_rss_growth'] = None
+            if peak_rss is not None and current['rss'] is not None:
+                record['peak_rss_growth'] = peak_rss - current['rss']
+            record['num_fds'] = self._get_num_fds()
+            leftovers = []
+            for key, child in six.iteritems(self._get_children()):
+                if key in current['children']:
+                    continue
+                try:
+                    leftovers.append({
+                        'pid': child.pid,
+                        'name': child.name(),
+                        'cmdline': child.cmdline()
+                    })
+                except psutil.NoSuchProcess:
+                    continue
+            record['leftover_children'] = leftovers
+        self.records.append(record)
+
+    def stop_test_run(self, result):
+        if self.__sampler is not None:
+            self.__sampler.stop()
+            self.__sampler = None
+        self.write_report()
+
+    def get_summary(self):
+        '''
+        Return a summary of the recorded data
+        '''
+        summary = {
+            'tests': len(self.records),
+            'sampled': 0,
+            'wall_time': 0.0,
+            'cpu_time': 0.0,
+            'peak_rss': None,
+            'max_peak_rss_growth': None,
+            'max_num_fds': None,
+            'leftover_children': 0,
+        }
+        for record in self.records:
+            summary['wall_time'] += record['wall_time']
+            summary['cpu_time'] += record['cpu_time']
+            if not record['sampled']:
+                continue
+            summary['sampled'] += 1
+            for key, value in (('peak_rss', record['peak_rss']),
+                               ('max_peak_rss_growth', record['peak_rss_growth']),
+                               ('max_num_fds', record['num_fds'])):
+                if value is not None and (summary[key] is None or value > summary[key]):
+                    summary[key] = value
+            summary['leftover_children'] += len(record['leftover_children'])
+        return summary
+
+    def get_slowest(self, count=10):
+        '''
+        Return the ``count`` slowest tests records
+        '''
+        return sorted(self.records, key=lambda record: record['wall_time'], reverse=True)[:count]
+
+    def write_report(self):
+        report_dir = os.path.dirname(os.path.abspath(self.report_path))
+        if not os.path.isdir(report_dir):
+            os.makedirs(report_dir)
+        with open(self.report_path, 'w') as wfh:
+            json.dump(
+                {
+                    'sample_every': self.sample_every,
+                    'summary': self.get_summary(),
+                    'tests': self.records
+                },
+                wfh,
+                indent=2
+            )
+        log.info('Tests resources report written to {0}'.format(self.report_path))
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    salttesting.reporters
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Tests results reporters which report the tests progress as it happens.
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+from collections import deque
+
+# Import salt testing libs
+from salttesting.unit import TestResultObserver
+
+# Import 3rd-party libs
+import six
+
+log = logging.getLogger(__name__)
+
+# Set on each worker, ie, on each docker container, when running the tests
+# suite split across several workers
+WORKER_ID_ENV_VAR = 'SALT_RUNTESTS_WORKER_ID'
+
+
+def get_worker_id():
+    '''
+    Return the ID of the worker running the tests
+    '''
+    worker_id = os.environ.get(WORKER_ID_ENV_VAR)
+    if worker_id:
+        return worker_id
+    return '{0}-{1}'.format(socket.gethostname(), os.getpid())
+
+
+class _LogExcerptHandler(logging.Handler):
+    '''
+    Keeps the last ``maxlen`` log records. They're only formatted when an
+    excerpt is requested.
+    '''
+
+    def __init__(self, maxlen=50, level=logging.DEBUG):
+        logging.Handler.__init__(self, level)
+        self.records = deque(maxlen=maxlen)
+        self.setFormatter(
+            logging.Formatter(
+                '%(asctime)s,%(msecs)03.0f [%(name)-5s:%(lineno)-4d]'
+                '[%(levelname)-8s] %(message)s',
+                datefmt='%H:%M:%S'
+            )
+        )
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def clear(self):
+        self.records.clear()
+
+    def get_excerpt(self):
+        lines = []
+        for record in list(self.records):
+            try:
+                lines.append(self.format(record))
+            except Exception:  # pylint: disable=broad-except
+                continue
+        return lines
+
+
+class JSONLinesReporter(TestResultObserver):
+    '''
+    Write one JSON record, per line, when the tests run starts and stops
+    and when each test starts and stops, as it happens, so the run can be
+    followed in real time, ie, ``tail -f``.
+
+    Each record has, at least, the ``event``, one of ``start-run``,
+    ``start``, ``stop`` or ``stop-run``, the ``time`` and the ``worker``
+    keys. ``stop`` records also have the test ``id``, ``outcome``,
+    ``duration`` and ``reason``. The last ``log_excerpt_size`` log messages
+    emitted during the test are included in the ``log`` key of the tests
+    which did not pass, or of every test if ``log_excerpt_always`` is
+    ``True``.
+
+    When given a path, the file is opened, for appending, when a tests run
+    starts and closed when it stops.
+    '''
+
+    def __init__(self, path_or_stream, log_excerpt_size=50, log_excerpt_always=False):
+        if isinstance(path_or_stream, six.string_types):
+            dirname = os.path.dirname(os.path.abspath(path_or_stream))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self.path = path_or_stream
+            self.stream = None
+        else:
+            self.path = None
+            self.stream = path_or_stream
+        self.worker_id = get_worker_id()
+        self.log_excerpt_always = log_excerpt_always
+        self.__lock = threading.Lock()
+        self.__log_handler = None
+        if log_excerpt_size:
+            self.__log_handler = _LogExcerptHandler(maxlen=log_excerpt_size)
+        self.__run_start = None
+        self.__test_start = None
+
+    def write_record(self, event, **data):
+        data['event'] = event
+        data['time'] = time.time()
+        data['worker'] = self.worker_id
+        line = json.dumps(data, sort_keys=True)
+        with self.__lock:
+            if self.stream is None:
+                self.stream = open(self.path, 'a')
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def start_test_run(self, result):
+        self.__run_start = time.time()
+        if self.__log_handler is not None:
+            logging.root.addHandler(self.__log_handler)
+        self.write_record('start-run', pid=os.getpid())
+
+    def start_test(self, test):
+        if self.__log_handler is not None:
+            self.__log_handler.clear()
+        self.__test_start = time.time()
+        self.write_record('start', id=test.id())
+
+    def stop_test(self, test, outcome, reason=None):
+        duration = None
+        if self.__test_start is not None:
+            duration = time.time() - self.__test_start
+            self.__test_start = None
+        data = {
+            'id': test.id(),
+            'outcome': outcome,
+            'duration': duration,
+            'reason': reason,
+        }
+        if self.__log_handler is not None and (self.log_excerpt_always or outcome in ('failure', 'error')):
+            data['log'] = self.__log_handler.get_excerpt()
+        self.write_record('stop', **data)
+
+    def stop_test_run(self, result):
+        if self.__log_handler is not None:
+            logging.root.removeHandler(self.__log_handler)
+            self.__log_handler.clear()
+        self.write_record(
+            'stop-run',
+            duration=None if self.__run_start is None else time.time() - self.__run_start,
+            tests_run=result.testsRun,
+            failures=len(result.failures),
+            errors=len(result.errors),
+            skipped=len(result.skipped)
+        )
+        self.close()
+
+    def close(self):
+        '''
+        Close the stream, if it was opened from a path
+        '''
+        with self.__lock:
+            if self.path is not None and self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+
+def _iter_tests(tests):
+    '''
+    Iterate over the individual tests of a, possibly nested, tests suite
+    '''
+    try:
+        iter(tests)
+    except TypeError:
+        yield tests
+        return
+    for test in tests:
+        for subtest in _iter_tests(test):
+            yield subtest
+
+
+def _format_seconds(seconds):
+    seconds = int(round(seconds))
+    return '{0:02d}:{1:02d}:{2:02d}'.format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+class ProgressReporter(TestResultObserver):
+    '''
+    Periodically print how far along the tests run is, the estimated time
+    to completion, the slowest test so far and the pass/fail tally.
+
+    The estimate uses the tests durations recorded, in ``durations_file``,
+    on previous runs. Tests without a recorded duration are estimated at
+    the average recorded duration or, without any history, at the current
+    run's average.
+
+    Updating the counters is constant time, the progress line is printed at
+    most once every ``interval`` seconds.
+    '''
+
+    # How much the latest duration weights in the recorded durations
+    durations_smoothing = 0.5
+
+    def __init__(self, tests=None, stream=None, durations_file=None, interval=10):
+        self.stream = stream if stream is not None else sys.stderr
+        self.durations_file = durations_file
+        self.interval = interval
+        self.durations = self._load_durations()
+        self.reset()
+        self.add_tests(tests or ())
+
+    def _load_durations(self):
+        if not self.durations_file or not os.path.isfile(self.durations_file):
+            return {}
+        try:
+            with open(self.durations_file) as rfh:
+                return json.load(rfh)
+        except (IOError, OSError, ValueError) as exc:
+            log.warning('Failed to load the tests durations from %s: %s', self.durations_file, exc)
+            return {}
+
+    def save_durations(self):
+        if not self.durations_file:
+            return
+        try:
+            dirname = os.path.dirname(os.path.abspath(self.durations_file))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            with open(self.durations_file, 'w') as wfh:
+                json.dump(self.durations, wfh)
+        except (IOError, OSError) as exc:
+            log.warning('Failed to save the tests durations to %s: %s', self.durations_file, exc)
+
+    def add_tests(self, tests):
+        '''
+        Add the tests, a tests suite or a list of tests, about to be run. The
+        tests suite can be run in several batches, ie, one per ``run_suite``
+        call, the progress covers them all.
+        '''
+        for test in _iter_tests(tests):
+            test_id = test.id()
+            self.total += 1
+            duration = self.durations.get(test_id)
+            self.__estimates[test_id] = duration
+            if duration is None:
+                self.__pending_unknown += 1
+            else:
+                self.__pending_known_duration += duration
+                self.__known_durations_sum += duration
+                self.__known_durations_count += 1
+
+    def reset(self):
+        '''
+        Forget about the tests added and the progress so far
+        '''
+        self.total = self.done = self.passed = self.failed = self.skipped = 0
+        self.slowest = (None, 0.0)
+        # The recorded duration, if any, of the tests not yet run
+        self.__estimates = {}
+        self.__pending_unknown = 0
+        self.__pending_known_duration = 0.0
+        self.__known_durations_sum = 0.0
+        self.__known_durations_count = 0
+        self.__run_start = self.__test_start = None
+        self.__last_print = 0
+
+    def _get_unknown_duration(self):
+        if not self.__known_durations_count:
+            return None
+        return self.__known_durations_sum / self.__known_durations_count
+
+    def start_test_run(self, result):
+        if self.__run_start is None:
+            self.__run_start = time.time()
+
+    def start_test(self, test):
+        self.__test_start = time.time()
+
+    def stop_test(self, test, outcome, reason=None):
+        now = time.time()
+        duration = now - (self.__test_start or now)
+        test_id = test.id()
+        if test_id in self.__estimates:
+            estimate = self.__estimates.pop(test_id)
+            if estimate is None:
+                self.__pending_unknown -= 1
+            else:
+                self.__pending_known_duration -= estimate
+        if outcome != 'skipped':
+            previous = self.durations.get(test_id)
+            if previous is None:
+                self.durations[test_id] = duration
+            else:
+                self.durations[test_id] = previous + self.durations_smoothing * (duration - previous)
+
+        self.done += 1
+        if outcome in ('failure', 'error', 'unexpected-success'):
+            self.failed += 1
+        elif outcome == 'skipped':
+            self.skipped += 1
+        else:
+            self.passed += 1
+        if duration > self.slowest[1]:
+            self.slowest = (test_id, duration)
+
+        if now - self.__last_print >= self.interval:
+            self.__last_print = now
+            self.print_progress(now)
+
+    def get_eta(self, now=None):
+        '''
+        Return the estimated number of seconds until the tests run finishes
+        '''
+        if not self.done or self.__run_start is None:
+            return None
+        unknown_duration = self._get_unknown_duration()
+        if unknown_duration is None:
+            # No history at all, extrapolate from the current run
+            elapsed = (now or time.time()) - self.__run_start
+            return elapsed / self.done * max(self.total - self.done, 0)
+        return max(self.__pending_known_duration + self.__pending_unknown * unknown_duration, 0.0)
+
+    def print_progress(self, now=None):
+        eta = self.get_eta(now)
+        line = ' * Progress: [{0:>3}%] {1}/{2} | ETA {3} | passed={4} failed={5} skipped={6}'.format(
+            int(self.done * 100 / self.total) if self.total else 100,
+            self.done, self.total,
+            'N/A' if eta is None else _format_seconds(eta),
+            self.passed, self.failed, self.skipped
+        )
+        if self.slowest[0] is not None:
+            line += ' | slowest: {0} ({1:.1f}s)'.format(self.slowest[0], self.slowest[1])
+        self.stream.write(line + '\n')
+        self.stream.flush()
+
+    def stop_test_run(self, result):
+        self.print_progress()
+        self.save_durations()
@@ -318,6 +318,7 @@ import platform
 import argparse
 import tempfile
 import multiprocessing
+from collections import deque
 from copy import deepcopy
 from datetime import datetime, timedelta
 try:
@@ -329,7 +330,12 @@ except ImportError:
 # Import Salt Testing libs
 from salttesting import helpers
 from salttesting import version
+from salttesting import cgroups
+from salttesting import coverdata
+from salttesting import log as tests_log
 from salttesting.unit import TestLoader, TestSuite, TextTestRunner
+from salttesting.profiler import TestResourcesProfiler
+from salttesting.reporters import JSONLinesReporter, ProgressReporter
 from salttesting.xmlunit import HAS_XMLRUNNER, XMLTestRunner
 try:
     from salttesting.ext import console
@@ -365,8 +371,7 @@ try:
         if coverage_options.get('data_suffix', False) is False:
             return
 
-        coverage_object = coverage.coverage(**coverage_options)
-        coverage_object.start()
+        coverage_object = coverdata.start_process_coverage(coverage_options)
 
         multiprocessing.util.Finalize(
             None,
@@ -383,7 +388,7 @@ try:
 except ImportError:
     pass
 
-# ----- 1 to 1 copy of Salt's Temporary Logging Handler ------------------------------------------------------------->
+# ----- Salt's Temporary Logging Handler ---------------------------------------------------------------------------->
 if sys.version_info < (2, 7):
     class NewStyleClassMixIn(object):
         '''
@@ -412,21 +417,19 @@ if sys.version_info < (2, 7):
 
 class TemporaryLoggingHandler(logging.NullHandler):
     '''
-    Copied from ``salt.log.handlers``
+    Based on ``salt.log.handlers``'s, but storing the records in a bounded
+    :class:`collections.deque`, which discards the oldest records in O(1).
     '''
 
     def __init__(self, level=logging.NOTSET, max_queue_size=10000):
         self.__max_queue_size = max_queue_size
         super(TemporaryLoggingHandler, self).__init__(level=level)  # pylint: disable=bad-super-call
-        self.__messages = []
+        # Once full, appending discards the initial log records
+        self.__messages = deque(maxlen=max_queue_size)
 
     def handle(self, record):
-        self.acquire()
-        if len(self.__messages) >= self.__max_queue_size:
-            # Loose the initial log records
-            self.__messages.pop(0)
+        # Appending to a deque is atomic, no need to lock
         self.__messages.append(record)
-        self.release()
 
     def sync_with_handlers(self, handlers=()):
         '''
@@ -435,16 +438,20 @@ class TemporaryLoggingHandler(logging.NullHandler):
         if not handlers:
             return
 
-        while self.__messages:
-            record = self.__messages.pop(0)
-            for handler in handlers:
-                if handler.level > record.levelno:
-                    # If the handler's level is higher than the log record one,
-                    # it should not handle the log record
-                    continue
-                handler.handle(record)
+        records, self.__messages = self.__messages, deque(maxlen=self.__max_queue_size)
+        for handler in handlers:
+            # If the handler's level is higher than the log record one,
+            # it should not handle the log record
+            level = handler.level
+            handler.acquire()
+            try:
+                for record in records:
+                    if record.levelno >= level and handler.filter(record):
+                        handler.emit(record)
+            finally:
+                handler.release()
 
-# <---- 1 to 1 copy of Salt's Temporary Logging Handler --------------------------------------------------------------
+# <---- Salt's Temporary Logging Handler -----------------------------------------------------------------------------
 
 # ----- Setup Temporary Logging ------------------------------------------------------------------------------------->
 # Store a reference to the temporary queue logging handler
@@ -706,8 +713,7 @@ class CoverageAction(argparse._StoreTrueAction):
             if coverage_options.get('data_suffix', False) is False:
                 return
 
-            coverage_object = coverage.coverage(**coverage_options)
-            coverage_object.start()
+            coverage_object = coverdata.start_process_coverage(coverage_options)
 
             multiprocessing.util.Finalize(
                 None,
@@ -762,10 +768,21 @@ class SaltRuntests(argparse.ArgumentParser):
         self.__testsuite_status__ = []
         self.__testsuite_results__ = []
         self.__testsuite_searched_paths__ = set()
+        # TestResultObserver instances passed to every test runner
+        self.__testsuite_observers__ = []
+        self.__leaked_processes_tracker__ = None
+        self.__cgroup_containment__ = None
+        self.__progress_reporter__ = None
+        self.__logging_writer__ = None
+        self.__tests_logfile_handler__ = None
+        # The handler logging to the tests logfile, queued or not
+        self.__tests_log_handler__ = None
         # <---- Tests Suite Attributes -------------------------------------------------------------------------------
 
         # ----- Coverage Support Attributes ------------------------------------------------------------------------->
         self.__coverage_instance__ = None
+        self.__coverage_options__ = None
+        self.__coverage_combiner__ = None
         # <---- Coverage Support Attributes --------------------------------------------------------------------------
 
         # ----- Let's not use argparse's help action ---------------------------------------------------------------->
@@ -851,6 +868,48 @@ class SaltRuntests(argparse.ArgumentParser):
             ),
             help='The path to the tests suite logging logfile. Default: %(default)r'
         )
+        self.output_options_group.add_argument(
+            '--async-logging',
+            default=False,
+            action='store_true',
+            help=('Write the tests suite logfile from a background thread, logging calls only enqueue '
+                  'the log records')
+        )
+        self.output_options_group.add_argument(
+            '--tests-logfile-max-bytes',
+            default=0,
+            type=int,
+            metavar='BYTES',
+            help='Rotate the tests suite logfile when it reaches BYTES. Implies --async-logging'
+        )
+        self.output_options_group.add_argument(
+            '--tests-logfile-backups',
+            default=5,
+            type=int,
+            metavar='N',
+            help='How many rotated tests suite logfiles to keep. Default: %(default)s'
+        )
+        self.output_options_group.add_argument(
+            '--compress-tests-logfile',
+            default=False,
+            action='store_true',
+            help='Gzip compress the tests suite logfile. Implies --async-logging'
+        )
+        self.output_options_group.add_argument(
+            '--index-tests-logfile',
+            default=False,
+            action='store_true',
+            help=('Index where each test\'s log starts and ends in the tests suite logfile, and include the '
+                  'log of each failed test in the overall tests report')
+        )
+        self.output_options_group.add_argument(
+            '--failed-test-log-lines',
+            default=100,
+            type=int,
+            metavar='N',
+            help=('Include, at most, the last N lines of each failed test\'s log in the overall tests '
+                  'report. 0 includes all of them. Default: %(default)s')
+        )
         self.output_options_group.add_argument(
             '--sysinfo',
             default=False,
@@ -880,6 +939,55 @@ class SaltRuntests(argparse.ArgumentParser):
             action='store_true',
             help='Do NOT show the overall tests result'
         )
+        self.output_options_group.add_argument(
+            '--tests-resources-report',
+            default=None,
+            help=('Write a JSON report with the wall time, CPU time, peak RSS, open file '
+                  'descriptors and left behind child processes of each test to this path')
+        )
+        self.output_options_group.add_argument(
+            '--tests-resources-sample-every',
+            default=1,
+            type=int,
+            metavar='N',
+            help=('Only gather the expensive resources metrics for one in every N tests. '
+                  'Default: %(default)s')
+        )
+        self.output_options_group.add_argument(
+            '--results-stream',
+            default=None,
+            metavar='PATH',
+            help=('Append a JSON record, one per line, to this file when each test starts and '
+                  'stops, as it happens')
+        )
+        self.output_options_group.add_argument(
+            '--results-stream-log-lines',
+            default=50,
+            type=int,
+            metavar='N',
+            help=('How many of the last log messages emitted by a failed test to include in '
+                  'it\'s results stream record. Default: %(default)s')
+        )
+        self.output_options_group.add_argument(
+            '--progress',
+            default=False,
+            action='store_true',
+            help='Periodically print the tests run progress, the estimated time to completion and the pass/fail tally'
+        )
+        self.output_options_group.add_argument(
+            '--progress-interval',
+            default=10,
+            type=float,
+            metavar='SECONDS',
+            help='Print the tests run progress at most once every SECONDS. Default: %(default)s'
+        )
+        self.output_options_group.add_argument(
+            '--durations-file',
+            default=None,
+            metavar='PATH',
+            help=('Load the tests durations, used to estimate the time to completion, from this file and save '
+                  'them back to it')
+        )
         # <---- Output Options ---------------------------------------------------------------------------------------
 
         # ----- Files-system cleanup options ------------------------------------------------------------------------>
@@ -917,6 +1025,35 @@ class SaltRuntests(argparse.ArgumentParser):
                   'which can cost money, for example, the cloud provider tests. '
                   'Default: %(default)s')
         )
+        self.tests_execution_tweaks_group.add_argument(
+            '--track-leaked-processes',
+            action='store_true',
+            default=False,
+            help='Report the tests which left child processes running after they finished'
+        )
+        self.tests_execution_tweaks_group.add_argument(
+            '--reap-leaked-processes',
+            action='store_true',
+            default=False,
+            help=('Terminate the child processes left running by a test as soon as it '
+                  'finishes. Implies \'--track-leaked-processes\'')
+        )
+        self.tests_execution_tweaks_group.add_argument(
+            '--cgroup-containment',
+            action='store_true',
+            default=False,
+            help=('Place the tests suite, the salt daemons and the executed scripts in a dedicated '
+                  'cgroup v2 subtree which is killed at once on teardown and provides the CPU and '
+                  'memory usage of each tests suite phase. Falls back to tracking the started '
+                  'processes when cgroups are not available.')
+        )
+        self.tests_execution_tweaks_group.add_argument(
+            '--collect-daemon-logs',
+            action='store_true',
+            default=False,
+            help=('Follow the salt daemons log files and copy their lines to the tests suite logfile, '
+                  'tagged with the ID of the test running at the time')
+        )
         # <---- Tests Execution Tweaks Group -------------------------------------------------------------------------
 
         # ----- Code Coverage Group --------------------------------------------------------------------------------->
@@ -970,6 +1107,68 @@ class SaltRuntests(argparse.ArgumentParser):
                   'will be saved to. The directory, if existing, will be '
                   'deleted before the report is generated.')
         )
+        self.code_coverage_group.add_argument(
+            '--coverage-impact-map',
+            default=None,
+            metavar='PATH',
+            help=('Record which tests cover each line and save that test impact map to PATH, gzip '
+                  'compressed if it ends with \'.gz\'. The entries of the tests not run are kept. '
+                  'Requires coverage>=5.0')
+        )
+        self.code_coverage_group.add_argument(
+            '--select-impacted-tests',
+            default=None,
+            metavar='DIFF',
+            help=('Only run the tests which, according to \'--coverage-impact-map\', cover the lines '
+                  'changed by the unified diff at DIFF, \'-\' to read it from stdin. Tests not in the '
+                  'map are also run. Every test is run if the diff changes files not in the map.')
+        )
+        self.code_coverage_group.add_argument(
+            '--coverage-combine-interval',
+            default=0,
+            type=int,
+            metavar='SECONDS',
+            help=('Combine the coverage data files of the processes which finished every SECONDS, '
+                  'while the tests are running. Default: %(default)s, disabled')
+        )
+        self.code_coverage_group.add_argument(
+            '--coverage-combine-processes',
+            default=multiprocessing.cpu_count(),
+            type=int,
+            metavar='N',
+            help=('Combine the coverage data files left when the tests suite finishes using N '
+                  'processes. Default: %(default)s')
+        )
+        self.code_coverage_group.add_argument(
+            '--coverage-line-hit-once',
+            default=False,
+            action='store_true',
+            help=('Lower overhead code coverage, for long running tests suites. On Python>=3.12, '
+                  'each line is only traced, using sys.monitoring, until it\'s first executed. On '
+                  'older pythons it\'s regular coverage, with its C tracer, only measuring lines. '
+                  'Branch coverage is never measured. Requires coverage>=5.0')
+        )
+        self.code_coverage_group.add_argument(
+            '--parallel-coverage-reports',
+            default=False,
+            action='store_true',
+            help='Generate the XML and HTML coverage reports in parallel, from the combined coverage data'
+        )
+        self.code_coverage_group.add_argument(
+            '--background-coverage-reports',
+            default=False,
+            action='store_true',
+            help=('Generate the coverage reports in a detached process, which writes the '
+                  '\'--coverage-reports-marker\' file when done, instead of waiting for them before '
+                  'exiting')
+        )
+        self.code_coverage_group.add_argument(
+            '--coverage-reports-marker',
+            default=None,
+            metavar='PATH',
+            help=('The file written, as JSON, when the background coverage reports are done. '
+                  'Default: \'{0}\' next to the coverage data file'.format(coverdata.REPORTS_MARKER_NAME))
+        )
         # <---- Code Coverage Group ----------------------------------------------------------------------------------
 
         # ----- Tests Filtering Group ------------------------------------------------------------------------------->
@@ -1322,12 +1521,27 @@ class SaltRuntests(argparse.ArgumentParser):
         if self.options.coverage_no_processes is False:
             os.environ['COVERAGE_PROCESS_START'] = '1'
             coverage_options['data_suffix'] = True
+        if self.options.coverage_line_hit_once:
+            coverage_options['branch'] = False
+            coverage_options['line_hit_once'] = True
 
         os.environ['SALT_RUNTESTS_COVERAGE_OPTIONS'] = json.dumps(coverage_options)
 
-        self.__coverage_instance__ = coverage.coverage(**coverage_options)
+        self.__coverage_options__ = coverage_options
+        self.__coverage_instance__ = coverdata.create_coverage(coverage_options)
         self.__coverage_instance__.start()
 
+        if self.options.coverage_no_processes is False:
+            self.__coverage_combiner__ = coverdata.CoverageDataCombiner(
+                self.__coverage_instance__.config.data_file,
+                interval=self.options.coverage_combine_interval,
+                processes=self.options.coverage_combine_processes
+            )
+            self.__coverage_combiner__.start()
+
+        if self.options.coverage_impact_map:
+            self.__testsuite_observers__.append(coverdata.CoverageContextSwitcher(self.__coverage_instance__))
+
 
     def __stop_coverage__(self):
         # Clean up environment
@@ -1343,7 +1557,51 @@ class SaltRuntests(argparse.ArgumentParser):
 
         if self.options.coverage_no_processes is False:
             self.print_bulleted('Combining Multiple Coverage Files')
-            self.__coverage_instance__.combine()
+            self.__coverage_combiner__.stop()
+            self.__coverage_combiner__.combine(self.__coverage_instance__)
+
+        if self.options.coverage_impact_map:
+            self.print_bulleted('Writing The Test Impact Map At {0!r}'.format(self.options.coverage_impact_map))
+            coverdata.write_test_impact_map(
+                self.options.coverage_impact_map,
+                coverdata.build_test_impact_map(
+                    self.__coverage_instance__.get_data(),
+                    coverdata.get_test_impact_map_root(self.options.coverage_source)
+                )
+            )
+
+        if self.options.coverage_xml_output is None and self.options.coverage_html_output is None:
+            print_header(u'', inline=True, width=self.options.output_columns)
+            return
+
+        if self.options.background_coverage_reports:
+            marker_file = coverdata.start_background_reports(
+                coverdata.get_combined_data_file(self.__coverage_instance__),
+                self.__coverage_options__,
+                xml_output=self.options.coverage_xml_output,
+                html_output=self.options.coverage_html_output,
+                parallel=self.options.parallel_coverage_reports,
+                marker_file=self.options.coverage_reports_marker
+            )
+            self.print_bulleted(
+                'Writing The Coverage Reports In The Background, Done When {0!r} Exists'.format(marker_file)
+            )
+            print_header(u'', inline=True, width=self.options.output_columns)
+            return
+
+        if self.options.parallel_coverage_reports:
+            self.print_bulleted('Writing The Coverage Reports In Parallel')
+            errors = coverdata.write_reports(
+                coverdata.get_combined_data_file(self.__coverage_instance__),
+                self.__coverage_options__,
+                xml_output=self.options.coverage_xml_output,
+                html_output=self.options.coverage_html_output,
+                parallel=True
+            )
+            for error in errors:
+                self.print_bulleted(error, 'LIGHT_RED')
+            print_header(u'', inline=True, width=self.options.output_columns)
+            return
 
         if self.options.coverage_xml_output is not None:
             self.print_bulleted(
@@ -1426,12 +1684,65 @@ class SaltRuntests(argparse.ArgumentParser):
             self.error(
                 '\'--coverage-html-output\' and \'--coverage-xml-output\' require the \'--coverage\''
             )
+        if self.options.select_impacted_tests and not self.options.coverage_impact_map:
+            self.error('\'--select-impacted-tests\' requires \'--coverage-impact-map\'')
+        if self.options.coverage and self.options.coverage_impact_map and not coverdata.SUPPORTS_CONTEXTS:
+            self.error('\'--coverage-impact-map\' requires coverage>=5.0')
+        if self.options.coverage_line_hit_once:
+            if self.options.coverage and not coverdata.SUPPORTS_LINE_HIT_ONCE:
+                self.error('\'--coverage-line-hit-once\' requires coverage>=5.0')
+            if self.options.coverage_impact_map:
+                self.error(
+                    '\'--coverage-line-hit-once\' and \'--coverage-impact-map\' are mutually exclusive'
+                )
         if self.options.coverage_source is None:
             self.options.coverage_source = self.options.workspace
         # <---- Coverage Checks --------------------------------------------------------------------------------------
 
+        # ----- Tests Resources Profiling --------------------------------------------------------------------------->
+        if self.options.tests_resources_report:
+            self.__testsuite_observers__.append(
+                TestResourcesProfiler(
+                    self.options.tests_resources_report,
+                    sample_every=self.options.tests_resources_sample_every
+                )
+            )
+        # <---- Tests Resources Profiling ----------------------------------------------------------------------------
+
+        # ----- Results Stream -------------------------------------------------------------------------------------->
+        if self.options.results_stream:
+            self.__testsuite_observers__.append(
+                JSONLinesReporter(
+                    self.options.results_stream,
+                    log_excerpt_size=self.options.results_stream_log_lines
+                )
+            )
+        # <---- Results Stream ---------------------------------------------------------------------------------------
+
+        # ----- Progress Reporting ---------------------------------------------------------------------------------->
+        if self.options.progress:
+            self.__progress_reporter__ = ProgressReporter(
+                durations_file=self.options.durations_file,
+                interval=self.options.progress_interval
+            )
+            self.__testsuite_observers__.append(self.__progress_reporter__)
+        # <---- Progress Reporting -----------------------------------------------------------------------------------
+
+        # ----- Leaked Child Processes Tracking --------------------------------------------------------------------->
+        if self.options.track_leaked_processes or self.options.reap_leaked_processes:
+            self.__leaked_processes_tracker__ = helpers.ChildProcessLeakTracker(
+                reap=self.options.reap_leaked_processes
+            )
+            self.__testsuite_observers__.append(self.__leaked_processes_tracker__)
+        # <---- Leaked Child Processes Tracking ----------------------------------------------------------------------
+
 
         # ----- Setup File Logging ---------------------------------------------------------------------------------->
+        if options.tests_logfile_max_bytes and (options.compress_tests_logfile or options.index_tests_logfile):
+            self.error(
+                '\'--tests-logfile-max-bytes\' can\'t be used with \'--compress-tests-logfile\' or '
+                '\'--index-tests-logfile\''
+            )
         log.info('Logging tests on {0}'.format(options.tests_logfile))
         print_header(u'', inline=True, width=getattr(options, 'output_columns', SCREEN_COLS))
         # Setup tests logging
@@ -1440,13 +1751,33 @@ class SaltRuntests(argparse.ArgumentParser):
             '[%(levelname)-8s] %(message)s',
             datefmt='%H:%M:%S'
         )
-        filehandler = logging.FileHandler(
-            mode='w',   # Not preserved between re-runs
-            filename=options.tests_logfile
-        )
+        queued_logging = options.async_logging or options.tests_logfile_max_bytes or options.compress_tests_logfile
+        if queued_logging:
+            filehandler = tests_log.get_file_handler(
+                options.tests_logfile,
+                mode='w',   # Not preserved between re-runs
+                max_bytes=options.tests_logfile_max_bytes,
+                backup_count=options.tests_logfile_backups,
+                compress=options.compress_tests_logfile,
+                index=options.index_tests_logfile
+            )
+        elif options.index_tests_logfile:
+            filehandler = tests_log.IndexedFileHandler(
+                mode='w',   # Not preserved between re-runs
+                filename=options.tests_logfile
+            )
+        else:
+            filehandler = logging.FileHandler(
+                mode='w',   # Not preserved between re-runs
+                filename=options.tests_logfile
+            )
+        if options.index_tests_logfile:
+            self.__tests_logfile_handler__ = filehandler
         filehandler.setLevel(logging.DEBUG)
         filehandler.setFormatter(formatter)
-        logging.root.addHandler(filehandler)
+        if not queued_logging:
+            logging.root.addHandler(filehandler)
+            self.__tests_log_handler__ = filehandler
         logging.root.setLevel(logging.DEBUG)
 
         global LOGGING_TEMP_HANDLER
@@ -1455,6 +1786,12 @@ class SaltRuntests(argparse.ArgumentParser):
         # Remove and reset the temporary logging handler
         logging.root.removeHandler(LOGGING_TEMP_HANDLER)
         LOGGING_TEMP_HANDLER = None
+        if queued_logging:
+            # Log records are now only enqueued, the file is written by a
+            # background thread
+            queuehandler, self.__logging_writer__ = tests_log.setup_queued_logging((filehandler,))
+            logging.root.addHandler(queuehandler)
+            self.__tests_log_handler__ = queuehandler
         # <---- Setup File Logging -----------------------------------------------------------------------------------
 
         # If we're passed filenames as arguments, then those are the tests
@@ -1499,6 +1836,9 @@ class SaltRuntests(argparse.ArgumentParser):
                 except AttributeError:
                     self.error('Unable to load tests from {0!r}'.format(name))
 
+        if options.select_impacted_tests:
+            self.__select_impacted_tests__()
+
         if self.__count_test_cases__() < 1:
             # No need to continue if no tests were discovered
             self.error('No tests were found')
@@ -1529,11 +1869,22 @@ class SaltRuntests(argparse.ArgumentParser):
 
         print_header(u'', inline=True, width=self.options.output_columns)
         RUNTIME_VARS.lock()
+        if self.options.cgroup_containment is True:
+            self.__cgroup_containment__ = cgroups.TestsContainment()
+            if self.__cgroup_containment__.setup():
+                self.print_bulleted('Tests suite processes contained in {0}'.format(self.__cgroup_containment__.path))
+            self.__cgroup_containment__.export_leaf('scripts')
+            self.__cgroup_containment__.mark_phase('setup')
+
         if self.options.coverage is True:
             self.__start_coverage__()
 
         with TestDaemon(self, start_daemons=self.__testsuite_needs_daemons_running__()):
+            if self.__cgroup_containment__ is not None:
+                self.__cgroup_containment__.mark_phase('tests')
             self.run_collected_tests()
+            if self.__cgroup_containment__ is not None:
+                self.__cgroup_containment__.mark_phase('teardown')
 
         if self.options.coverage is True:
             self.__stop_coverage__()
@@ -1542,6 +1893,78 @@ class SaltRuntests(argparse.ArgumentParser):
             self.finalize(1)
         self.finalize(0)
 
+    def __print_test_log__(self, testcase):
+        '''
+        Print the log of the provided test, if the tests logfile is indexed
+        '''
+        handler = self.__tests_logfile_handler__
+        if handler is None:
+            return
+        if self.__logging_writer__ is not None:
+            self.__logging_writer__.drain()
+        segment = handler.read_segment(testcase.id())
+        if not segment:
+            return
+        lines = segment.rstrip().splitlines()
+        max_lines = self.options.failed_test_log_lines
+        print_header(u'   ', sep=u'.', inline=True, width=self.options.output_columns)
+        if max_lines and len(lines) > max_lines:
+            print(u'       Test Log (last {0} of {1} lines):'.format(max_lines, len(lines)))
+            lines = lines[-max_lines:]
+        else:
+            print(u'       Test Log:')
+        for line in lines:
+            print(u'       {0}'.format(line.rstrip()))
+
+    def __select_impacted_tests__(self):
+        '''
+        Only keep the collected tests which cover the lines changed by the
+        provided diff, or which are not in the test impact map. Every test is
+        kept if the diff changes files the map doesn't cover. The tests which
+        need the salt daemons are always kept, the map only holds the lines
+        the tests suite process itself runs, not what they make the daemons
+        run.
+        '''
+        try:
+            tests_map = coverdata.load_test_impact_map(self.options.coverage_impact_map)
+        except (IOError, OSError, ValueError) as exc:
+            self.print_bulleted(
+                'Not selecting the impacted tests, failed to load the test impact map: {0}'.format(exc),
+                'LIGHT_RED'
+            )
+            return
+        if self.options.select_impacted_tests == '-':
+            diff = sys.stdin.read()
+        else:
+            with open(self.options.select_impacted_tests) as rfh:
+                diff = rfh.read()
+        changed = coverdata.parse_diff(diff)
+        unmapped = coverdata.get_unmapped_paths(tests_map, changed)
+        if unmapped:
+            self.print_bulleted(
+                'Running all of the collected tests, the test impact map does not cover the changes to: {0}{1}'.format(
+                    ', '.join(unmapped[:5]),
+                    ' and {0} more'.format(len(unmapped) - 5) if len(unmapped) > 5 else ''
+                ),
+                'YELLOW'
+            )
+            return
+        impacted = coverdata.select_impacted_tests(tests_map, changed)
+        collected = len(self.__testsuite__)
+        needs_daemons_count = 0
+        for test_id, (test, needs_daemons) in list(self.__testsuite__.items()):
+            if needs_daemons:
+                needs_daemons_count += 1
+                continue
+            if test_id in tests_map and test_id not in impacted:
+                self.__testsuite__.pop(test_id)
+        self.print_bulleted(
+            'Selected {0} of the {1} collected tests as impacted by the changes, '
+            'including the {2} which need the salt daemons'.format(
+                len(self.__testsuite__), collected, needs_daemons_count
+            )
+        )
+
     def __count_test_cases__(self):
         return len(self.__testsuite__)
 
@@ -1679,17 +2102,21 @@ class SaltRuntests(argparse.ArgumentParser):
         '''
         Execute a unit test suite
         '''
+        if self.__progress_reporter__ is not None:
+            self.__progress_reporter__.add_tests(suite)
 
         if HAS_XMLRUNNER and self.options.xml_out:
             runner = XMLTestRunner(
                 stream=sys.stdout,
                 output=self.options.xml_out_path,
-                verbosity=self.options.verbosity
+                verbosity=self.options.verbosity,
+                observers=self.__testsuite_observers__
             )
         else:
             runner = TextTestRunner(
                 stream=sys.stdout,
-                verbosity=self.options.verbosity)
+                verbosity=self.options.verbosity,
+                observers=self.__testsuite_observers__)
         results = runner.run(suite)
         self.__testsuite_results__.append(results)
         return results.wasSuccessful()
@@ -1747,6 +2174,7 @@ class SaltRuntests(argparse.ArgumentParser):
                     )
                     for line in reason.rstrip().splitlines():
                         print('       {0}'.format(line.rstrip()))
+                    self.__print_test_log__(testcase)
                     print_header(u'   ', sep=u'.', inline=True,
                                 width=self.options.output_columns)
                 print_header(u' ', sep='-', inline=True,
@@ -1765,11 +2193,48 @@ class SaltRuntests(argparse.ArgumentParser):
                     )
                     for line in reason.rstrip().splitlines():
                         print('       {0}'.format(line.rstrip()))
+                    self.__print_test_log__(testcase)
                     print_header(u'   ', sep=u'.', inline=True,
                                 width=self.options.output_columns)
                 print_header(u' ', sep='-', inline=True,
                              width=self.options.output_columns)
 
+        leaks_tracker = self.__leaked_processes_tracker__
+        if leaks_tracker is not None and leaks_tracker.leaks:
+            no_problems_found = False
+            print_header(
+                u' --------  Tests Which Left Child Processes Running  ', sep='-',
+                inline=True, width=self.options.output_columns
+            )
+            for test_id, entries in leaks_tracker.leaks:
+                print_header(
+                    u'   -> {0}  '.format(test_id),
+                    sep=u'.', inline=True,
+                    width=self.options.output_columns
+                )
+                for entry in entries:
+                    print(u'       PID {0}{1}: {2}'.format(
+                        entry['pid'], ' (reaped)' if entry['reaped'] else '', entry['cmdline']
+                    ))
+                print_header(u'   ', sep=u'.', inline=True,
+                             width=self.options.output_columns)
+            print_header(u' ', sep='-', inline=True,
+                         width=self.options.output_columns)
+
+        if self.__cgroup_containment__ is not None and self.__cgroup_containment__.phases:
+            print_header(
+                u' --------  Resources Usage Per Phase  ', sep='-', inline=True,
+                width=self.options.output_columns
+            )
+            for phase, usage in self.__cgroup_containment__.phases:
+                print(u'   -> {0: <10}  wall: {1:.1f}s  cpu: {2:.1f}s  memory peak growth: {3}  lifetime memory peak: {4}'.format(
+                    phase, usage['wall_time'], usage['cpu_time'],
+                    'N/A' if usage['memory_peak_growth'] is None else '{0:.1f}MB'.format(usage['memory_peak_growth'] / 1048576.0),
+                    'N/A' if usage['lifetime_memory_peak'] is None else '{0:.1f}MB'.format(usage['lifetime_memory_peak'] / 1048576.0)
+                ))
+            print_header(u' ', sep='-', inline=True,
+                         width=self.options.output_columns)
+
         if no_problems_found:
             print_header(
                 u'***  No Problems Found While Running Tests  ',
@@ -1801,6 +2266,10 @@ class SaltRuntests(argparse.ArgumentParser):
         for func in self.__post_test_daemon_exit__:
             func(self, start_daemons=self.__testsuite_needs_daemons_running__())
 
+        if self.__cgroup_containment__ is not None:
+            self.__cgroup_containment__.mark_phase(None)
+            self.__cgroup_containment__.teardown()
+
         if self.options.no_report is False:
             self.print_overall_testsuite_report()
         log.info(
@@ -1817,6 +2286,8 @@ class TestDaemon(object):
     Set up the master and minion daemons, and run related cases
     '''
     MINIONS_CONNECT_TIMEOUT = MINIONS_SYNC_TIMEOUT = 120
+    # How long, in seconds, the contained daemons get to exit after SIGTERM
+    DAEMONS_TERMINATE_TIMEOUT = 10
 
     def __init__(self, parser, start_daemons=True):
         # Late import
@@ -1824,6 +2295,7 @@ class TestDaemon(object):
         self.parser = parser
         self.start_daemons = start_daemons
         self.colors = get_colors(self.parser.options.no_colors is False)
+        self.daemon_logs_tailer = None
 
     def __enter__(self):
         try:
@@ -1930,11 +2402,30 @@ class TestDaemon(object):
         # Set up PATH to mockbin
         self._enter_mockbin()
 
+        if self.start_daemons and self.parser.options.collect_daemon_logs:
+            daemon_log_files = {}
+            for name, opts in (('master', self.master_opts),
+                               ('minion', self.minion_opts),
+                               ('sub_minion', self.sub_minion_opts),
+                               ('syndic', self.syndic_opts),
+                               ('syndic_master', self.syndic_master_opts)):
+                if opts.get('log_file') and opts['log_file'] not in daemon_log_files.values():
+                    daemon_log_files[name] = opts['log_file']
+            self.daemon_logs_tailer = tests_log.DaemonLogsTailer(
+                daemon_log_files,
+                # Only to the tests logfile, not to the tests log captures
+                handlers=[handler for handler in (self.parser.__tests_log_handler__,) if handler is not None]
+            )
+            self.daemon_logs_tailer.start()
+            self.parser.__testsuite_observers__.append(self.daemon_logs_tailer)
+
         if self.start_daemons:
-            if self.parser.options.transport == 'raet':
-                self.start_raet_daemons()
+            containment = self.parser.__cgroup_containment__
+            if containment is not None:
+                with containment.spawning('daemons'):
+                    self.__start_daemons__()
             else:
-                self.start_zeromq_daemons()
+                self.__start_daemons__()
 
             self.minion_targets = set(['minion', 'sub_minion'])
             self.pre_setup_minions()
@@ -1990,6 +2481,12 @@ class TestDaemon(object):
             if self.start_daemons:
                 self.post_setup_minions()
 
+    def __start_daemons__(self):
+        if self.parser.options.transport == 'raet':
+            self.start_raet_daemons()
+        else:
+            self.start_zeromq_daemons()
+
     def start_zeromq_daemons(self):
         # Late import Salt
         import salt.master
@@ -2127,21 +2624,31 @@ class TestDaemon(object):
         import salt.master
 
         if self.start_daemons:
+            containment = self.parser.__cgroup_containment__
+            if containment is not None:
+                # A single SIGTERM to the whole cgroup gives every daemon, and
+                # whatever they left behind, ie, daemonized grandchildren, the
+                # chance to save their coverage data and run their atexit
+                # functions, at once. Whatever is still around after that is
+                # killed. The per process waits below then only reap.
+                if not containment.terminate('daemons', timeout=self.DAEMONS_TERMINATE_TIMEOUT):
+                    containment.kill('daemons')
             if self.process_manager:
                 self.process_manager.kill_children()
             else:
-                salt.master.clean_proc(self.sub_minion_process, wait_for_kill=50)
-                self.sub_minion_process.join()
-                salt.master.clean_proc(self.minion_process, wait_for_kill=50)
-                self.minion_process.join()
-                salt.master.clean_proc(self.master_process, wait_for_kill=50)
-                self.master_process.join()
-
+                processes = [self.sub_minion_process, self.minion_process, self.master_process]
                 if self.parser.options.transport == 'zeromq':
-                    salt.master.clean_proc(self.syndic_process, wait_for_kill=50)
-                    self.syndic_process.join()
-                    salt.master.clean_proc(self.smaster_process, wait_for_kill=50)
-                    self.smaster_process.join()
+                    processes.extend([self.syndic_process, self.smaster_process])
+                for process in processes:
+                    if containment is None:
+                        salt.master.clean_proc(process, wait_for_kill=50)
+                    process.join()
+
+        if self.daemon_logs_tailer is not None:
+            # Copy the last lines before the log files are cleaned
+            self.daemon_logs_tailer.stop()
+            self.parser.__testsuite_observers__.remove(self.daemon_logs_tailer)
+            self.daemon_logs_tailer = None
 
         self._exit_mockbin()
         for func in self.parser.__test_daemon_exit__:
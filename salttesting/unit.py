@@ -22,6 +22,7 @@
 
 # Import python libs
 from __future__ import absolute_import
+import os
 import sys
 import copy
 import logging
@@ -126,9 +127,14 @@ class TestCase(_TestCase):
             proc_info = ''
             found_zombies = 0
             try:
-                for proc in psutil.process_iter():
-                    if proc.status == psutil.STATUS_ZOMBIE:
-                        found_zombies += 1
+                # Only our own children can be zombies we're responsible for,
+                # no need to go through every process on the system
+                for proc in psutil.Process(os.getpid()).children(recursive=True):
+                    try:
+                        if proc.status() == psutil.STATUS_ZOMBIE:
+                            found_zombies += 1
+                    except psutil.NoSuchProcess:
+                        continue
                 proc_info = '[CPU:{0}%|MEM:{1}%|Z:{2}] {short_desc}'.format(psutil.cpu_percent(),
                                                                             psutil.virtual_memory().percent,
                                                                             found_zombies,
@@ -137,7 +143,7 @@ class TestCase(_TestCase):
                 pass
             return proc_info
         else:
-            return _TestCase.shortDescription(self)
+            return desc
 
     #def runTest(self):
     #    pass
@@ -209,18 +215,125 @@ class TestCase(_TestCase):
         return _TestCase.failIfAlmostEqual(self, *args, **kwargs)
 
 
-class TextTestResult(_TextTestResult):
+class TestResultObserver(object):
+    '''
+    Base class for objects which want to be notified about the progress of
+    a tests run without having to subclass the test result classes.
+
+    Observers are passed to the test runners, ie, ``TextTestRunner(observers=[...])``.
+    '''
+
+    def start_test_run(self, result):
+        '''
+        Called once before any test is executed
+        '''
+
+    def start_test(self, test):
+        '''
+        Called before each test is executed
+        '''
+
+    def stop_test(self, test, outcome, reason=None):
+        '''
+        Called after each test is executed.
+
+        ``outcome`` is one of ``passed``, ``failure``, ``error``, ``skipped``,
+        ``expected-failure`` or ``unexpected-success``. ``reason`` is the
+        formatted traceback or the skip reason, if any.
+        '''
+
+    def stop_test_run(self, result):
+        '''
+        Called once after all tests were executed
+        '''
+
+
+class ObservableTestResultMixIn(object):
+    '''
+    Notifies :class:`TestResultObserver` instances about the tests progress.
+
+    The methods are explicitly called from the test result classes since not
+    all of them are new-style classes.
+    '''
+
+    # (result attribute, outcome)
+    _observed_outcomes_ = (
+        ('errors', 'error'),
+        ('failures', 'failure'),
+        ('skipped', 'skipped'),
+        ('expectedFailures', 'expected-failure'),
+        ('unexpectedSuccesses', 'unexpected-success'),
+    )
+
+    observers = ()
+
+    def _notify_observers(self, method, *args):
+        for observer in self.observers:
+            try:
+                getattr(observer, method)(*args)
+            except Exception:  # pylint: disable=broad-except
+                logging.getLogger(__name__).error(
+                    'Failed to call {0}.{1}()'.format(observer.__class__.__name__, method),
+                    exc_info=True
+                )
+
+    def _observed_start_test_run(self):
+        if self.observers:
+            self._notify_observers('start_test_run', self)
+
+    def _observed_start_test(self, test):
+        if self.observers:
+            # Snapshot the outcome lists lengths, whichever grows is this
+            # test's outcome
+            self._observed_lengths = [
+                len(getattr(self, attr, ())) for (attr, _) in self._observed_outcomes_
+            ]
+            self._notify_observers('start_test', test)
+
+    def _observed_stop_test(self, test):
+        if not self.observers:
+            return
+        outcome, reason = 'passed', None
+        lengths = getattr(self, '_observed_lengths', None) or [0] * len(self._observed_outcomes_)
+        for (attr, name), length in zip(self._observed_outcomes_, lengths):
+            entries = getattr(self, attr, ())
+            if len(entries) > length:
+                outcome = name
+                entry = entries[-1]
+                if isinstance(entry, tuple):
+                    reason = entry[1]
+                break
+        self._notify_observers('stop_test', test, outcome, reason)
+
+    def _observed_stop_test_run(self):
+        if self.observers:
+            self._notify_observers('stop_test_run', self)
+
+
+class TextTestResult(_TextTestResult, ObservableTestResultMixIn):
     '''
     Custom TestResult class whith logs the start and the end of a test
     '''
 
+    def startTestRun(self):
+        super(TextTestResult, self).startTestRun()
+        self._observed_start_test_run()
+
+    def stopTestRun(self):
+        self._observed_stop_test_run()
+        super(TextTestResult, self).stopTestRun()
+
     def startTest(self, test):
         logging.getLogger(__name__).debug(
             '>>>>> START >>>>> {0}'.format(test.id())
         )
-        return super(TextTestResult, self).startTest(test)
+        ret = super(TextTestResult, self).startTest(test)
+        self._observed_start_test(test)
+        return ret
 
     def stopTest(self, test):
+        # Observers first, whatever they log is part of the test's log
+        self._observed_stop_test(test)
         logging.getLogger(__name__).debug(
             '<<<<< END <<<<<<< {0}'.format(test.id())
         )
@@ -233,6 +346,16 @@ class TextTestRunner(_TextTestRunner):
     '''
     resultclass = TextTestResult
 
+    def __init__(self, *args, **kwargs):
+        self.observers = list(kwargs.pop('observers', None) or ())
+        super(TextTestRunner, self).__init__(*args, **kwargs)
+
+    def _makeResult(self):
+        result = super(TextTestRunner, self)._makeResult()
+        if self.observers:
+            result.observers = self.observers
+        return result
+
 
 __all__ = [
     'TestLoader',
@@ -241,5 +364,6 @@ __all__ = [
     'expectedFailure',
     'TestSuite',
     'skipIf',
-    'TestResult'
+    'TestResult',
+    'TestResultObserver'
 ]
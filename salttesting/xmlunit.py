@@ -13,15 +13,218 @@
 
 # Import python libs
 from __future__ import absolute_import
+import io
+import os
+import re
 import sys
+import time
+import shutil
 import logging
+import tempfile
+from xml.sax.saxutils import quoteattr
 
 # Import 3rd-party libs
 import six
-from six import StringIO
+
+# Import salt testing libs
+from salttesting.unit import ObservableTestResultMixIn
 
 log = logging.getLogger(__name__)
 
+# Per test, at most, this many bytes of each captured stream are kept
+MAX_CAPTURED_OUTPUT_SIZE = 1024 * 1024
+# Captured output bigger than this many bytes is spilled to disk
+CAPTURED_OUTPUT_SPOOL_SIZE = 64 * 1024
+
+# Characters which are not allowed in XML 1.0 documents
+_ILLEGAL_XML_CHARS_RE = re.compile(
+    u'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]'
+)
+
+
+class _BoundedCapture(object):
+    '''
+    File like object which keeps, at most, ``max_size`` bytes of whatever is
+    written to it. Anything past ``spool_size`` bytes is kept on disk.
+    '''
+
+    def __init__(self, max_size=MAX_CAPTURED_OUTPUT_SIZE, spool_size=CAPTURED_OUTPUT_SPOOL_SIZE):
+        self.max_size = max_size
+        self.spool_size = spool_size
+        self._file = None
+        self._size = 0
+        self._dropped = 0
+
+    def write(self, text):
+        if not text:
+            return
+        if isinstance(text, six.text_type):
+            data = text.encode('utf-8', 'replace')
+        else:
+            data = text
+        remaining = self.max_size - self._size
+        if len(data) > remaining:
+            self._dropped += len(data) - max(remaining, 0)
+            data = data[:max(remaining, 0)]
+            if not data:
+                return
+        if self._file is None:
+            self._file = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        self._file.write(data)
+        self._size += len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def getvalue(self):
+        if self._file is None:
+            return u''
+        self._file.seek(0)
+        data = self._file.read().decode('utf-8', 'replace')
+        self._file.seek(0, os.SEEK_END)
+        if self._dropped:
+            data += u'\n[... {0} bytes of output were not captured ...]\n'.format(self._dropped)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self._file is not None:
+            self._file.seek(offset, whence)
+
+    def truncate(self, size=None):
+        # Only used to reset the capture between tests
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._size = self._dropped = 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.truncate()
+
+
+class JUnitXMLStreamWriter(object):
+    '''
+    Write JUnit XML reports, one per test case class, as the tests finish.
+
+    Each ``<testcase>`` element is appended to a per test case class body
+    file as soon as the test finishes, only the totals are kept in memory.
+    :meth:`close` writes the final reports, the ``<testsuite>`` element with
+    the totals followed by the body.
+    '''
+
+    def __init__(self, output_dir, outsuffix=None, encoding='UTF-8'):
+        self.output_dir = output_dir
+        self.outsuffix = outsuffix
+        self.encoding = encoding
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        self._tmpdir = tempfile.mkdtemp(prefix='.junit-stream-', dir=output_dir)
+        self._suites = {}
+        self._suites_order = []
+
+    @staticmethod
+    def _cdata(text):
+        text = _ILLEGAL_XML_CHARS_RE.sub(u'', six.text_type(text))
+        return u'<![CDATA[{0}]]>'.format(text.replace(u']]>', u']]]]><![CDATA[>'))
+
+    @staticmethod
+    def _attr(value):
+        return quoteattr(_ILLEGAL_XML_CHARS_RE.sub(u'', six.text_type(value)))
+
+    def add_testcase(self, suite_name, classname, name, elapsed_time,
+                     timestamp=None, outcome=None, exception_name=None,
+                     exception_message=None, error_info=None, stdout=None,
+                     stderr=None, filename=None, lineno=None):
+        '''
+        Append a ``<testcase>`` element to the ``suite_name`` report.
+        ``outcome`` is the name of the outcome element, ie, ``failure``,
+        ``error`` or ``skipped``, ``None`` for successful tests.
+        '''
+        suite = self._suites.get(suite_name)
+        if suite is None:
+            suite = self._suites[suite_name] = {
+                'body': os.path.join(self._tmpdir, '{0}.xml'.format(len(self._suites))),
+                'tests': 0,
+                'failures': 0,
+                'errors': 0,
+                'skipped': 0,
+                'time': 0.0,
+                'timestamp': None
+            }
+            self._suites_order.append(suite_name)
+        suite['tests'] += 1
+        suite['time'] += elapsed_time
+        if outcome in ('failure', 'error'):
+            suite[outcome + 's'] += 1
+        elif outcome == 'skipped':
+            suite['skipped'] += 1
+        if timestamp is not None and (suite['timestamp'] is None or timestamp > suite['timestamp']):
+            suite['timestamp'] = timestamp
+
+        parts = [
+            u'\t<testcase classname={0} name={1} time="{2:.3f}"'.format(
+                self._attr(classname), self._attr(name), elapsed_time
+            )
+        ]
+        if timestamp is not None:
+            parts.append(u' timestamp={0}'.format(self._attr(timestamp)))
+        if filename is not None:
+            parts.append(u' file={0}'.format(self._attr(filename)))
+        if lineno is not None:
+            parts.append(u' line="{0}"'.format(lineno))
+        parts.append(u'>\n')
+        if outcome is not None:
+            parts.append(u'\t\t<{0} type={1} message={2}'.format(
+                outcome, self._attr(exception_name or ''), self._attr(exception_message or '')
+            ))
+            if error_info:
+                parts.append(u'>{0}</{1}>\n'.format(self._cdata(error_info), outcome))
+            else:
+                parts.append(u'/>\n')
+        if stdout:
+            parts.append(u'\t\t<system-out>{0}</system-out>\n'.format(self._cdata(stdout)))
+        if stderr:
+            parts.append(u'\t\t<system-err>{0}</system-err>\n'.format(self._cdata(stderr)))
+        parts.append(u'\t</testcase>\n')
+
+        with io.open(suite['body'], 'ab') as wfh:
+            wfh.write(u''.join(parts).encode(self.encoding, 'xmlcharrefreplace'))
+
+    def close(self):
+        '''
+        Write the final reports and return their paths
+        '''
+        filenames = []
+        for suite_name in self._suites_order:
+            suite = self._suites[suite_name]
+            if self.outsuffix:
+                report_name = '{0}-{1}'.format(suite_name, self.outsuffix)
+            else:
+                report_name = suite_name
+            filename = os.path.join(self.output_dir, 'TEST-{0}.xml'.format(report_name))
+            header = u'<?xml version="1.0" encoding="{0}"?>\n'.format(self.encoding)
+            header += u'<testsuite errors="{0}" failures="{1}" file={2} name={3} skipped="{4}" tests="{5}" time="{6:.3f}"'.format(
+                suite['errors'], suite['failures'],
+                self._attr(suite_name.rpartition('.')[0].replace('.', '/') + '.py'),
+                self._attr(report_name), suite['skipped'], suite['tests'], suite['time']
+            )
+            if suite['timestamp'] is not None:
+                header += u' timestamp={0}'.format(self._attr(suite['timestamp']))
+            header += u'>\n'
+            with io.open(filename, 'wb') as wfh:
+                wfh.write(header.encode(self.encoding))
+                with io.open(suite['body'], 'rb') as rfh:
+                    shutil.copyfileobj(rfh, wfh)
+                wfh.write(u'</testsuite>\n'.encode(self.encoding))
+            filenames.append(filename)
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+        self._suites = {}
+        self._suites_order = []
+        return filenames
+
 
 try:
     import xmlrunner.runner
@@ -32,17 +235,93 @@ try:
         '''
         This class defines an object that captures whatever is written to
         a stream or file.
+
+        Writes are accumulated in a buffer which is passed, in batches, to
+        both the capture and the delegate stream. The delegate is only
+        flushed when a batch is written, which keeps the overhead low when
+        it's a pipe. Writing to a sibling ``_DelegateIO``, ie, stderr's for
+        stdout's, first writes this one's batch so the output order is kept.
         '''
 
-        def __init__(self, delegate):
-            self._captured = StringIO()
+        # Write the buffered data once it reaches this many bytes...
+        batch_size = 64 * 1024
+        # ... or when the oldest buffered write is older than this many
+        # seconds. Whatever is left is written at the end of the test.
+        batch_interval = 0.25
+
+        def __init__(self, delegate, sibling=None):
+            self._captured = _BoundedCapture()
             self.delegate = delegate
+            self._pending = bytearray() if six.PY2 else []
+            self._pending_size = 0
+            self._pending_since = None
+            self.sibling = None
+            if sibling is not None:
+                self.sibling = sibling
+                sibling.sibling = self
 
         def write(self, text):
             if six.PY2 and isinstance(text, six.text_type):
                 text = text.encode(__salt_system_encoding__)
-            self._captured.write(text)
-            self.delegate.write(text)
+            if not text:
+                return
+            sibling = self.sibling
+            if sibling is not None and sibling._pending_size:
+                sibling.write_batch()
+            if six.PY2:
+                self._pending.extend(text)
+            else:
+                self._pending.append(text)
+            self._pending_size += len(text)
+            if self._pending_since is None:
+                self._pending_since = time.time()
+            if self._batch_is_due():
+                self.write_batch()
+
+        def _batch_is_due(self):
+            return (self._pending_size >= self.batch_size or
+                    time.time() - self._pending_since >= self.batch_interval)
+
+        def writelines(self, lines):
+            for line in lines:
+                self.write(line)
+
+        def write_batch(self):
+            '''
+            Write the buffered data to the capture and the delegate, and
+            flush the delegate
+            '''
+            if not self._pending_size:
+                return
+            if six.PY2:
+                data = bytes(self._pending)
+                del self._pending[:]
+            else:
+                data = ''.join(self._pending)
+                del self._pending[:]
+            self._pending_size = 0
+            self._pending_since = None
+            self._captured.write(data)
+            self.delegate.write(data)
+            self.delegate.flush()
+
+        def flush(self):
+            # The tests flushing their output don't force a batch out, it's
+            # written when it's due or when the test ends
+            if self._pending_size and self._batch_is_due():
+                self.write_batch()
+
+        def getvalue(self):
+            self.write_batch()
+            return self._captured.getvalue()
+
+        def seek(self, *args):
+            self.write_batch()
+            return self._captured.seek(*args)
+
+        def truncate(self, *args):
+            self.write_batch()
+            return self._captured.truncate(*args)
 
         def __getattr__(self, attr):
             try:
@@ -50,39 +329,125 @@ try:
             except AttributeError:
                 return getattr(self.delegate, attr)
 
-    class _XMLTestResult(xmlrunner.result._XMLTestResult):
+    class _XMLTestResult(xmlrunner.result._XMLTestResult, ObservableTestResultMixIn):
+
+        # When set, each test is written to the XML report as soon as it
+        # finishes instead of being kept in memory until the end of the run
+        stream_writer = None
+
+        def _prepare_callback(self, test_info, *args, **kwargs):
+            self._last_test_info = test_info
+            return xmlrunner.result._XMLTestResult._prepare_callback(self, test_info, *args, **kwargs)
+
         def startTest(self, test):
             logging.getLogger(__name__).debug(
                 '>>>>> START >>>>> {0}'.format(test.id())
             )
+            # Bound the memory used to capture the test's output
+            self._stdout_capture = _BoundedCapture()
+            self._stderr_capture = _BoundedCapture()
             # xmlrunner classes are NOT new-style classes
             xmlrunner.result._XMLTestResult.startTest(self, test)
             if self.buffer:
                 # Let's override the values of self._stdXXX_buffer
                 # We want a similar sys.stdXXX file like behaviour
                 self._stderr_buffer = _DelegateIO(sys.__stderr__)
-                self._stdout_buffer = _DelegateIO(sys.__stdout__)
+                self._stdout_buffer = _DelegateIO(sys.__stdout__, sibling=self._stderr_buffer)
                 sys.stderr = self._stderr_buffer
                 sys.stdout = self._stdout_buffer
+            self._observed_start_test(test)
 
         def stopTest(self, test):
+            # Observers first, whatever they log is part of the test's log
+            self._observed_stop_test(test)
             logging.getLogger(__name__).debug(
                 '<<<<< END <<<<<<< {0}'.format(test.id())
             )
+            if self.buffer:
+                for stream in (getattr(self, '_stdout_buffer', None), getattr(self, '_stderr_buffer', None)):
+                    if isinstance(stream, _DelegateIO):
+                        stream.write_batch()
             # xmlrunner classes are NOT new-style classes
-            return xmlrunner.result._XMLTestResult.stopTest(self, test)
+            ret = xmlrunner.result._XMLTestResult.stopTest(self, test)
+            test_info, self._last_test_info = getattr(self, '_last_test_info', None), None
+            if self.stream_writer is not None and test_info is not None:
+                self._stream_test_info(test_info)
+            return ret
+
+        @staticmethod
+        def _get_outcome_element(test_info):
+            outcome_elements = getattr(test_info, 'OUTCOME_ELEMENTS', None)
+            if outcome_elements is None:
+                # Older xmlrunner releases only define the outcome constants
+                outcome_elements = {
+                    test_info.SUCCESS: None,
+                    test_info.FAILURE: 'failure',
+                    test_info.ERROR: 'error',
+                    test_info.SKIP: 'skipped'
+                }
+            return outcome_elements.get(test_info.outcome)
+
+        def _stream_test_info(self, test_info):
+            test_id = test_info.id()
+            filename = getattr(test_info, 'filename', None)
+            if filename is not None:
+                # Try to make filename relative to current directory.
+                relpath = os.path.relpath(filename)
+                filename = filename if relpath.startswith('../') else relpath
+            self.stream_writer.add_testcase(
+                test_info.test_name,
+                re.sub(r'^__main__.', '', test_id).rpartition('.')[0],
+                test_id.split('.')[-1],
+                test_info.elapsed_time,
+                timestamp=getattr(test_info, 'timestamp', None),
+                outcome=self._get_outcome_element(test_info),
+                exception_name=getattr(test_info, 'test_exception_name', None),
+                exception_message=getattr(test_info, 'test_exception_message', None),
+                error_info=test_info.get_error_info(),
+                stdout=test_info.stdout,
+                stderr=test_info.stderr,
+                filename=filename,
+                lineno=getattr(test_info, 'lineno', None)
+            )
+            # It's already in the report, don't hold on to it's output
+            test_info.stdout = test_info.stderr = None
+            if self.successes and self.successes[-1] is test_info:
+                self.successes.pop()
+
+        def generate_reports(self, test_runner):
+            if self.stream_writer is None:
+                return xmlrunner.result._XMLTestResult.generate_reports(self, test_runner)
+            for filename in self.stream_writer.close():
+                if self.showAll:
+                    self.stream.writeln('Generated XML report: {0}'.format(filename))
 
     class XMLTestRunner(xmlrunner.runner.XMLTestRunner):
+        def __init__(self, *args, **kwargs):
+            self.observers = list(kwargs.pop('observers', None) or ())
+            xmlrunner.runner.XMLTestRunner.__init__(self, *args, **kwargs)
+
         def _make_result(self):
-            return _XMLTestResult(
+            result = _XMLTestResult(
                 self.stream,
                 self.descriptions,
                 self.verbosity,
                 self.elapsed_times
             )
+            if isinstance(self.output, six.string_types):
+                result.stream_writer = JUnitXMLStreamWriter(
+                    self.output,
+                    outsuffix=self.outsuffix,
+                    encoding=getattr(self, 'encoding', 'UTF-8')
+                )
+            if self.observers:
+                result.observers = self.observers
+                # xmlrunner does not call startTestRun()/stopTestRun()
+                result._observed_start_test_run()
+            return result
 
         def run(self, test):
             result = xmlrunner.runner.XMLTestRunner.run(self, test)
+            result._observed_stop_test_run()
             self.stream.writeln('Finished generating XML reports')
             return result
 
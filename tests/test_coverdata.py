@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_coverdata
+    ~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+# Import salt testing libs
+from salttesting import TestCase, skipIf
+from salttesting import coverdata
+from salttesting.reporters import WORKER_ID_ENV_VAR
+
+
+class IsDataFileCompleteTestCase(TestCase):
+
+    data_file = os.path.join(os.sep, 'tmp', 'coverage', '.coverage')
+
+    def setUp(self):
+        previous = os.environ.get(WORKER_ID_ENV_VAR)
+        if previous is None:
+            self.addCleanup(os.environ.pop, WORKER_ID_ENV_VAR, None)
+        else:
+            self.addCleanup(os.environ.__setitem__, WORKER_ID_ENV_VAR, previous)
+        os.environ[WORKER_ID_ENV_VAR] = 'worker-1'
+
+    def _get_path(self, suffix):
+        return '{0}.{1}'.format(self.data_file, suffix)
+
+    def _get_exited_pid(self):
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proc.wait()
+        return proc.pid
+
+    def test_own_data_file_suffix(self):
+        suffix = coverdata.get_data_suffix()
+        self.assertTrue(suffix.startswith('worker-1.{0}.'.format(os.getpid())))
+        # This process is still running
+        self.assertFalse(coverdata.is_data_file_complete(self._get_path(suffix), self.data_file))
+
+    def test_exited_process(self):
+        path = self._get_path('worker-1.{0}.000001'.format(self._get_exited_pid()))
+        self.assertTrue(coverdata.is_data_file_complete(path, self.data_file))
+
+    def test_combined_data_file(self):
+        path = self._get_path('{0}1'.format(coverdata.COMBINED_SUFFIX_PREFIX))
+        self.assertTrue(coverdata.is_data_file_complete(path, self.data_file))
+
+    def test_other_worker(self):
+        path = self._get_path('worker-2.{0}.000001'.format(self._get_exited_pid()))
+        self.assertFalse(coverdata.is_data_file_complete(path, self.data_file))
+
+    def test_foreign_data_files(self):
+        for suffix in ('myhost.1234', 'worker-1.notapid.000001', 'worker-1.1.2.3'):
+            self.assertFalse(coverdata.is_data_file_complete(self._get_path(suffix), self.data_file))
+
+    def test_worker_name_is_sanitized(self):
+        os.environ[WORKER_ID_ENV_VAR] = 'worker.1/a'
+        suffix = coverdata.get_data_suffix()
+        self.assertEqual(suffix.split('.')[0], 'worker_1_a')
+        path = self._get_path('worker_1_a.{0}.000001'.format(self._get_exited_pid()))
+        self.assertTrue(coverdata.is_data_file_complete(path, self.data_file))
+
+
+DIFF = """\
+diff --git a/salt/modules/foo.py b/salt/modules/foo.py
+index 1111111..2222222 100644
+--- a/salt/modules/foo.py
++++ b/salt/modules/foo.py
+@@ -10,2 +10,3 @@ def foo():
+     a = 1
++    b = 2
+     return a
+@@ -40,2 +41,0 @@ def bar():
+-    removed()
+-    removed()
+diff --git a/salt/modules/gone.py b/salt/modules/gone.py
+deleted file mode 100644
+index 3333333..0000000
+--- a/salt/modules/gone.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-import os
+-import sys
+diff --git a/tests/files/logo.png b/tests/files/logo.png
+index 4444444..5555555 100644
+Binary files a/tests/files/logo.png and b/tests/files/logo.png differ
+diff --git a/salt/modules/single.py b/salt/modules/single.py
+--- a/salt/modules/single.py
++++ b/salt/modules/single.py
+@@ -5 +5 @@
+-x = 1
++x = 2
+"""
+
+
+class WriteReportsTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.module_path = os.path.join(self.tmpdir, 'measured.py')
+        with open(self.module_path, 'w') as wfh:
+            wfh.write('def measured():\n    return 1\n')
+        self.data_file = os.path.join(self.tmpdir, '.coverage')
+        data = coverdata.coverage.CoverageData(basename=self.data_file)
+        data.add_lines({self.module_path: [1, 2]})
+        data.write()
+
+    def _write_reports(self, parallel):
+        xml_output = os.path.join(self.tmpdir, 'coverage.xml')
+        html_output = os.path.join(self.tmpdir, 'html')
+        # The coverage options, as passed by the tests suite, which also
+        # name the data file
+        coverage_options = {
+            'data_file': self.data_file,
+            'data_suffix': True,
+            'line_hit_once': True,
+            'source': [self.tmpdir],
+        }
+        errors = coverdata.write_reports(
+            self.data_file, coverage_options, xml_output=xml_output, html_output=html_output, parallel=parallel
+        )
+        self.assertEqual(errors, [])
+        self.assertTrue(os.path.isfile(xml_output))
+        self.assertTrue(os.path.isfile(os.path.join(html_output, 'index.html')))
+
+    def test_write_reports(self):
+        self._write_reports(parallel=False)
+
+    def test_write_reports_in_parallel(self):
+        self._write_reports(parallel=True)
+
+
+class TestImpactMapTestCase(TestCase):
+
+    tests_map = {
+        'test_foo': {'salt/modules/foo.py': [[1, 5], [11, 12]]},
+        'test_bar': {'salt/modules/foo.py': [[40, 45]]},
+        'test_baz': {'salt/modules/foo.py': [[100, 110]], 'salt/modules/gone.py': [[30, 30]]},
+        'test_other': {'salt/modules/other.py': [[1, 100]]},
+    }
+
+    def test_to_ranges(self):
+        self.assertEqual(coverdata._to_ranges([]), [])
+        self.assertEqual(coverdata._to_ranges([7]), [[7, 7]])
+        self.assertEqual(
+            coverdata._to_ranges([5, 1, 2, 3, 9, 10]),
+            [[1, 3], [5, 5], [9, 10]]
+        )
+
+    def test_parse_diff(self):
+        changed = coverdata.parse_diff(DIFF)
+        self.assertEqual(
+            changed,
+            {
+                # The insertion marks the lines around it
+                'salt/modules/foo.py': set([10, 11, 40, 41]),
+                # Deleted and binary files are changed as a whole
+                'salt/modules/gone.py': set(),
+                'tests/files/logo.png': set(),
+                'salt/modules/single.py': set([5]),
+            }
+        )
+
+    def test_parse_diff_uses_base_lines(self):
+        # 20 lines inserted after line 4 shift the later hunks, the map
+        # holds the base revision lines
+        diff = '\n'.join(
+            ['--- a/salt/modules/foo.py',
+             '+++ b/salt/modules/foo.py',
+             '@@ -4,0 +5,20 @@'] +
+            ['+inserted'] * 20 +
+            ['@@ -51,3 +71,3 @@',
+             ' line51',
+             '-line52',
+             '+changed52',
+             ' line53']
+        )
+        changed = coverdata.parse_diff(diff)
+        self.assertEqual(changed, {'salt/modules/foo.py': set([4, 5, 52])})
+        tests_map = {
+            'test_covers_the_change': {'salt/modules/foo.py': [[50, 55]]},
+            'test_covers_the_new_lines': {'salt/modules/foo.py': [[10, 12]]},
+        }
+        self.assertEqual(
+            coverdata.select_impacted_tests(tests_map, changed),
+            set(['test_covers_the_change'])
+        )
+
+    def test_parse_diff_hunk_lines_which_look_like_headers(self):
+        diff = '\n'.join([
+            '--- a/salt/modules/foo.py',
+            '+++ b/salt/modules/foo.py',
+            '@@ -7,2 +7,2 @@',
+            '--- old comment',
+            '+++ new comment',
+            ' context',
+        ])
+        self.assertEqual(coverdata.parse_diff(diff), {'salt/modules/foo.py': set([7])})
+
+    def test_select_impacted_tests(self):
+        changed = coverdata.parse_diff(DIFF)
+        self.assertEqual(
+            coverdata.select_impacted_tests(self.tests_map, changed),
+            set(['test_foo', 'test_bar', 'test_baz'])
+        )
+        self.assertEqual(
+            coverdata.select_impacted_tests(self.tests_map, {'salt/modules/foo.py': set([6, 7, 46])}),
+            set()
+        )
+        self.assertEqual(coverdata.select_impacted_tests(self.tests_map, {}), set())
+
+    def test_unmapped_paths(self):
+        changed = coverdata.parse_diff(DIFF)
+        self.assertEqual(
+            coverdata.get_unmapped_paths(self.tests_map, changed),
+            ['salt/modules/single.py', 'tests/files/logo.png']
+        )
+        self.assertEqual(
+            coverdata.get_unmapped_paths(self.tests_map, {'salt/modules/other.py': set([1])}),
+            []
+        )
+
+    def test_test_impact_map_root(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        # The same from anywhere in the repository
+        self.assertEqual(
+            coverdata.get_test_impact_map_root(os.path.join(root, 'salttesting')),
+            coverdata.get_test_impact_map_root(root)
+        )
+
+
+@skipIf(not coverdata.HAS_SYS_MONITORING or not coverdata.SUPPORTS_LINE_HIT_ONCE,
+        'Requires Python>=3.12 and coverage>=5.0')
+class LineHitOnceCoverageTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.module_path = os.path.join(self.tmpdir, 'measured.py')
+        with open(self.module_path, 'w') as wfh:
+            wfh.write('def measured():\n    return 1\n')
+        self.data_file = os.path.join(self.tmpdir, '.coverage')
+
+    def _get_code_coverage(self):
+        code_coverage = coverdata.create_coverage({
+            'line_hit_once': True,
+            'source': [self.tmpdir],
+            'data_file': self.data_file
+        })
+        self.addCleanup(code_coverage.stop)
+        return code_coverage
+
+    def _run_measured(self):
+        namespace = {}
+        with open(self.module_path) as rfh:
+            exec(compile(rfh.read(), self.module_path, 'exec'), namespace)  # pylint: disable=exec-used
+        namespace['measured']()
+        return namespace
+
+    def test_does_not_use_the_coverage_tool_id(self):
+        monitoring = sys.monitoring  # pylint: disable=no-member
+        code_coverage = self._get_code_coverage()
+        code_coverage.start()
+        self.assertNotEqual(code_coverage.tool_id, monitoring.COVERAGE_ID)
+        self.assertEqual(monitoring.get_tool(code_coverage.tool_id), coverdata.LINE_HIT_ONCE_TOOL_NAME)
+        code_coverage.stop()
+        self.assertIsNone(code_coverage.tool_id)
+
+    def test_no_free_tool_id(self):
+        monitoring = sys.monitoring  # pylint: disable=no-member
+        for tool_id in coverdata.LINE_HIT_ONCE_TOOL_IDS:
+            if monitoring.get_tool(tool_id) is None:
+                monitoring.use_tool_id(tool_id, 'tests')
+                self.addCleanup(monitoring.free_tool_id, tool_id)
+        with self.assertRaises(RuntimeError):
+            self._get_code_coverage().start()
+
+    def test_save_replaces_the_data_file(self):
+        stale = coverdata.coverage.CoverageData(basename=self.data_file)
+        stale.add_lines({os.path.join(self.tmpdir, 'stale.py'): [1]})
+        stale.write()
+
+        code_coverage = self._get_code_coverage()
+        code_coverage.start()
+        self._run_measured()
+        code_coverage.stop()
+        code_coverage.save()
+
+        data = coverdata.coverage.CoverageData(basename=self.data_file)
+        data.read()
+        self.assertEqual(list(data.measured_files()), [self.module_path])
+        self.assertEqual(sorted(data.lines(self.module_path)), [1, 2])
+
+    def test_forked_process_records_the_lines_again(self):
+        code_coverage = self._get_code_coverage()
+        code_coverage.start()
+        namespace = self._run_measured()
+        self.assertEqual(code_coverage.lines, {self.module_path: set([1, 2])})
+        child_data_file = os.path.join(self.tmpdir, '.coverage.child')
+        pid = os.fork()
+        if pid == 0:
+            exitcode = 1
+            try:
+                child_coverage = coverdata.create_coverage({
+                    'line_hit_once': True,
+                    'source': [self.tmpdir],
+                    'data_file': child_data_file
+                })
+                child_coverage.start()
+                # Takes over the parent's tool ID instead of grabbing another
+                if child_coverage.tool_id == code_coverage.tool_id:
+                    # The line already executed by the parent process
+                    namespace['measured']()
+                    child_coverage.stop()
+                    child_coverage.save()
+                    exitcode = 0
+            finally:
+                os._exit(exitcode)  # pylint: disable=protected-access
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        data = coverdata.coverage.CoverageData(basename=child_data_file)
+        data.read()
+        self.assertEqual(sorted(data.lines(self.module_path)), [2])
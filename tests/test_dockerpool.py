@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_dockerpool
+    ~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import sys
+import time
+import subprocess
+
+# Import salt testing libs
+from salttesting import TestCase
+from salttesting.unit import TestSuite
+from salttesting.dockerpool import (
+    CLAIM_MAX_AGE,
+    ShardsRunner,
+    WarmContainerPool,
+    get_claim_owner,
+    is_stale_claim,
+    parse_shard,
+    shard_tests
+)
+
+
+def _get_tests():
+    '''
+    Return a tests suite of three test case classes, defined here so they're
+    not collected themselves
+    '''
+    class FirstCase(TestCase):
+        def test_a(self):
+            pass
+
+        def test_b(self):
+            pass
+
+    class SecondCase(TestCase):
+        def test_a(self):
+            pass
+
+    class ThirdCase(TestCase):
+        def test_a(self):
+            pass
+
+        def test_b(self):
+            pass
+
+    return TestSuite([
+        TestSuite([FirstCase('test_a'), FirstCase('test_b')]),
+        TestSuite([TestSuite([SecondCase('test_a')])]),
+        ThirdCase('test_a'),
+        ThirdCase('test_b'),
+    ])
+
+
+class ParseShardTestCase(TestCase):
+
+    def test_valid(self):
+        self.assertEqual(parse_shard('1/1'), (1, 1))
+        self.assertEqual(parse_shard('3/4'), (3, 4))
+
+    def test_invalid(self):
+        for shard in (None, '', '1', '1/2/3', 'a/2', '0/2', '3/2', '-1/2'):
+            with self.assertRaises(ValueError):
+                parse_shard(shard)
+
+
+class ShardTestsTestCase(TestCase):
+
+    def _get_ids(self, suite):
+        return ['{0}.{1}'.format(test.__class__.__name__, test._testMethodName) for test in suite]
+
+    def test_classes_are_kept_together(self):
+        tests = _get_tests()
+        self.assertEqual(
+            self._get_ids(shard_tests(tests, 1, 2)),
+            ['FirstCase.test_a', 'FirstCase.test_b', 'ThirdCase.test_a', 'ThirdCase.test_b']
+        )
+        self.assertEqual(self._get_ids(shard_tests(tests, 2, 2)), ['SecondCase.test_a'])
+
+    def test_shards_cover_every_test_once(self):
+        tests = _get_tests()
+        expected = sorted([test.id() for test in shard_tests(tests, 1, 1)])
+        self.assertEqual(len(expected), 5)
+        for count in (2, 3, 4):
+            sharded = []
+            for index in range(1, count + 1):
+                sharded.extend([test.id() for test in shard_tests(tests, index, count)])
+            self.assertEqual(sorted(sharded), expected)
+        # More shards than classes leaves some shards empty
+        self.assertEqual(shard_tests(tests, 4, 4).countTestCases(), 0)
+
+
+class StaleClaimTestCase(TestCase):
+
+    def _get_exited_pid(self):
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proc.wait()
+        return proc.pid
+
+    def test_running_owner(self):
+        self.assertFalse(is_stale_claim(get_claim_owner()))
+
+    def test_exited_owner(self):
+        owner = get_claim_owner()
+        owner['pid'] = self._get_exited_pid()
+        self.assertTrue(is_stale_claim(owner))
+
+    def test_other_host(self):
+        owner = get_claim_owner()
+        owner['host'] = 'not-' + owner['host']
+        owner['pid'] = self._get_exited_pid()
+        # The owner can't be checked, only it's age
+        self.assertFalse(is_stale_claim(owner))
+        self.assertTrue(is_stale_claim(owner, now=time.time() + CLAIM_MAX_AGE + 1))
+
+    def test_unknown_format(self):
+        self.assertFalse(is_stale_claim({}))
+        self.assertFalse(is_stale_claim({'host': 'a', 'pid': 'b', 'time': 'c'}))
+
+
+class ShardCommandTestCase(TestCase):
+
+    def _get_command(self, entrypoint):
+        pool = WarmContainerPool('salttest/arch', 2, os.getcwd(), docker_binary='docker')
+        pool.entrypoint = entrypoint
+        runner = ShardsRunner(pool, ['python2', '/salt-source/tests/runtests.py', '-v'], 2)
+        command = runner._get_shard_command(1, 'container')  # pylint: disable=protected-access
+        return command[command.index('container') + 1:]
+
+    def test_through_the_entrypoint(self):
+        command = self._get_command(['/start-me-up.sh'])
+        self.assertEqual(command[0], '/start-me-up.sh')
+        # A single string, like 'docker run' passes it
+        self.assertEqual(len(command), 2)
+        self.assertTrue(command[1].startswith('python2 /salt-source/tests/runtests.py -v --shard 1/2 '))
+
+    def test_without_an_entrypoint(self):
+        command = self._get_command([])
+        self.assertEqual(command[:5], ['python2', '/salt-source/tests/runtests.py', '-v', '--shard', '1/2'])
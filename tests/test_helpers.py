@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_helpers
+    ~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import logging
+
+# Import salt testing libs
+from salttesting import TestCase
+from salttesting.helpers import TestsLoggingHandler
+
+
+class TestsLoggingHandlerTestCase(TestCase):
+
+    def _log(self):
+        logging.getLogger('salt.minion').info('minion')
+        logging.getLogger('salt.minion.child').info('minion child')
+        logging.getLogger('salt.minionish').info('not a child')
+        logging.getLogger('salt.master').info('master')
+
+    def test_names_filter(self):
+        for lazy in (False, True):
+            with TestsLoggingHandler(level=logging.INFO, lazy=lazy, names=('salt.minion',)) as handler:
+                self._log()
+                self.assertEqual(handler.messages, ['INFO:minion', 'INFO:minion child'])
+
+    def test_no_names_filter(self):
+        for lazy in (False, True):
+            with TestsLoggingHandler(level=logging.INFO, lazy=lazy) as handler:
+                self._log()
+                self.assertEqual(len(handler.messages), 4)
+                handler.clear()
+                self.assertEqual(handler.messages, [])
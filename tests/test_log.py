@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_log
+    ~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import shutil
+import signal
+import logging
+import tempfile
+import threading
+from collections import deque
+
+# Import salt testing libs
+from salttesting import TestCase, skipIf
+from salttesting.log import (
+    TEST_START_MARKER,
+    TEST_END_MARKER,
+    DaemonLogsTailer,
+    QueueHandler,
+    get_file_handler,
+    load_log_index
+)
+
+
+class _RecordsHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class IndexedLogTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.logger = logging.getLogger('tests.test_log.{0}'.format(self.id()))
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def _get_handler(self, **kwargs):
+        handler = get_file_handler(os.path.join(self.tmpdir, 'runtests.log'), index=True, **kwargs)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return handler
+
+    def _log_test(self, test_id, *messages):
+        self.logger.debug('{0}{1}'.format(TEST_START_MARKER, test_id))
+        for message in messages:
+            self.logger.debug(message)
+        self.logger.debug('{0}{1}'.format(TEST_END_MARKER, test_id))
+
+    def _assert_segments(self, handler):
+        self.logger.debug('Before any test')
+        self._log_test('test_a', 'first a')
+        self.logger.debug('Between tests')
+        self._log_test('test_b', u'b with a non ascii char: é', 'second b')
+        self._log_test('test_a', 'rerun a')
+
+        self.assertEqual(
+            handler.read_segment('test_a'),
+            u'{0}test_a\nrerun a\n{1}test_a\n'.format(TEST_START_MARKER, TEST_END_MARKER)
+        )
+        self.assertEqual(
+            handler.read_segment('test_b'),
+            u'{0}test_b\nb with a non ascii char: é\nsecond b\n{1}test_b\n'.format(
+                TEST_START_MARKER, TEST_END_MARKER
+            )
+        )
+        self.assertIsNone(handler.read_segment('test_c'))
+
+        index = load_log_index(handler.index_path)
+        self.assertEqual(index, dict([(key, [tuple(entry) for entry in value]) for key, value in handler.index.items()]))
+        self.assertEqual(len(index['test_a']), 2)
+        self.assertEqual(len(index['test_b']), 1)
+
+    def test_read_segment(self):
+        self._assert_segments(self._get_handler())
+
+    def test_read_compressed_segment(self):
+        self._assert_segments(self._get_handler(compress=True))
+
+    def test_unfinished_segment_is_not_indexed(self):
+        handler = self._get_handler()
+        self.logger.debug('{0}test_a'.format(TEST_START_MARKER))
+        self.logger.debug('Interrupted')
+        self.assertIsNone(handler.read_segment('test_a'))
+        self.assertEqual(load_log_index(handler.index_path), {})
+
+    def test_load_truncated_index(self):
+        index_path = os.path.join(self.tmpdir, 'runtests.log.index')
+        with open(index_path, 'w') as wfh:
+            wfh.write('{"id": "test_a", "start": 0, "end": 10}\n')
+            wfh.write('{"id": "test_b", "start": 10, "e')
+        self.assertEqual(load_log_index(index_path), {'test_a': [(0, 10)]})
+
+
+class _FakeTest(object):
+
+    def id(self):
+        return 'test_daemon'
+
+
+@skipIf(not hasattr(os, 'fork'), 'os.fork() is not available')
+class QueueHandlerForkTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.log_file = os.path.join(self.tmpdir, 'tests.log')
+        self.handler = get_file_handler(self.log_file)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        self.addCleanup(self.handler.close)
+        self.queuehandler = QueueHandler(deque(), (self.handler,))
+
+    def _record(self, message):
+        return logging.LogRecord('test', logging.INFO, __file__, 1, message, None, None)
+
+    def test_forked_process_logs(self):
+        # As if forked while the writer thread held the handler lock, with a
+        # written, but not yet flushed, batch
+        self.handler.handle(self._record('Parent'))
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            self.handler.acquire()
+            try:
+                locked.set()
+                release.wait(30)
+            finally:
+                self.handler.release()
+
+        writer = threading.Thread(target=hold_lock)
+        writer.start()
+        locked.wait(30)
+        try:
+            pid = os.fork()
+            if pid == 0:
+                # Fail, instead of hanging, on a dead lock
+                signal.alarm(10)
+                try:
+                    self.queuehandler.handle(self._record('Child'))
+                finally:
+                    os._exit(0)
+            _, status = os.waitpid(pid, 0)
+        finally:
+            release.set()
+            writer.join()
+        self.assertEqual(status, 0)
+        self.handler.flush_batch()
+        with open(self.log_file) as rfh:
+            lines = rfh.read().splitlines()
+        self.assertEqual(sorted(lines), ['Child', 'Parent'])
+
+
+class DaemonLogsTailerTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.log_files = {
+            'master': os.path.join(self.tmpdir, 'master.log'),
+            'minion': os.path.join(self.tmpdir, 'minion.log')
+        }
+
+    def _write(self, name, *lines):
+        with open(self.log_files[name], 'a') as wfh:
+            for line in lines:
+                wfh.write(line + '\n')
+
+    def test_lines_are_merged_by_timestamp(self):
+        handler = _RecordsHandler()
+        root_handler = _RecordsHandler()
+        logging.root.addHandler(root_handler)
+        self.addCleanup(logging.root.removeHandler, root_handler)
+
+        tailer = DaemonLogsTailer(self.log_files, handlers=[handler], poll_interval=3600)
+        self._write(
+            'master',
+            '2017-03-01 10:00:00,100 [salt.master][INFO ] first',
+            '2017-03-01 10:00:00,300 [salt.master][ERROR] third',
+            'Traceback (most recent call last):'
+        )
+        self._write(
+            'minion',
+            '2017-03-01 10:00:00,200 [salt.minion][INFO ] second',
+            '2017-03-01 10:00:00,400 [salt.minion][INFO ] fourth'
+        )
+        with open(self.log_files['minion'], 'a') as wfh:
+            wfh.write('2017-03-01 10:00:00,500 [salt.minion][INFO ] partial')
+        tailer.start_test(_FakeTest())
+        tailer.stop_test(_FakeTest(), 'success')
+        tailer.stop()
+
+        messages = [record.getMessage() for record in handler.records]
+        self.assertEqual(
+            [message.split()[-1] for message in messages],
+            ['first', 'second', 'third', 'last):', 'fourth']
+        )
+        self.assertTrue(messages[0].startswith('[-] '))
+        self.assertEqual(
+            [record.name for record in handler.records],
+            ['salttesting.daemons.master', 'salttesting.daemons.minion',
+             'salttesting.daemons.master', 'salttesting.daemons.master',
+             'salttesting.daemons.minion']
+        )
+        # Not propagated to the other handlers, ie, the tests log captures
+        self.assertFalse([
+            record for record in root_handler.records if record.name.startswith('salttesting.daemons')
+        ])
+
+    def test_lines_are_attributed_to_the_running_test(self):
+        handler = _RecordsHandler()
+        tailer = DaemonLogsTailer(self.log_files, handlers=[handler], poll_interval=3600)
+        tailer.start_test(_FakeTest())
+        self._write('master', '2017-03-01 10:00:00,100 [salt.master][INFO ] during')
+        tailer.stop_test(_FakeTest(), 'success')
+        self._write('master', '2017-03-01 10:00:00,200 [salt.master][INFO ] after')
+        tailer.stop()
+        self.assertEqual(
+            [record.getMessage().split()[0] for record in handler.records],
+            ['[test_daemon]', '[-]']
+        )
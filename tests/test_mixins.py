@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_mixins
+    ~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import copy
+import sys
+import types
+
+# Import 3rd-party libs
+import six
+
+# Import salt testing libs
+from salttesting import TestCase, skipIf
+from salttesting.mixins import (
+    CopyOnWriteDict,
+    can_copy_on_write,
+    LoaderModuleMockMixin,
+    SaltReturnAssertsMixIn,
+    SaltStateReturnSummary
+)
+
+HIGHSTATE_RETURN = {
+    'file_|-a_|-/a_|-managed': {'result': True, 'changes': {}, 'duration': 1.5, 'comment': 'ok'},
+    'file_|-b_|-/b_|-managed': {'result': False, 'changes': {}, 'duration': 0.5, 'comment': 'failed'},
+    'pkg_|-c_|-c_|-installed': {'result': True, 'changes': {'c': {'new': '1.0'}}, 'duration': 9.0},
+    'cmd_|-d_|-d_|-run': {'result': None, 'changes': {}, 'duration': None},
+    'bogus': 'Some error string',
+}
+
+
+class SaltStateReturnSummaryTestCase(TestCase):
+
+    def test_columns(self):
+        summary = SaltStateReturnSummary(HIGHSTATE_RETURN)
+        self.assertEqual(len(summary), 5)
+        self.assertEqual(set(summary.ids), set(HIGHSTATE_RETURN))
+        for state_id, result, changed in zip(summary.ids, summary.results, summary.changed):
+            state = HIGHSTATE_RETURN[state_id]
+            if isinstance(state, dict):
+                self.assertEqual(result, state['result'])
+                self.assertEqual(changed, bool(state['changes']))
+            else:
+                self.assertIs(result, None)
+                self.assertFalse(changed)
+
+    def test_failing_ids(self):
+        summary = SaltStateReturnSummary(HIGHSTATE_RETURN)
+        self.assertEqual(
+            set(summary.failing_ids()),
+            set(['file_|-b_|-/b_|-managed', 'cmd_|-d_|-d_|-run', 'bogus'])
+        )
+
+    def test_changed_ids(self):
+        summary = SaltStateReturnSummary(HIGHSTATE_RETURN)
+        self.assertEqual(summary.changed_ids(), ['pkg_|-c_|-c_|-installed'])
+
+    def test_format_states(self):
+        summary = SaltStateReturnSummary(HIGHSTATE_RETURN)
+        formatted = summary.format_states(['file_|-b_|-/b_|-managed', 'bogus'])
+        self.assertIn("file_|-b_|-/b_|-managed: result=False duration=0.5 comment='failed'", formatted)
+        self.assertIn("bogus: 'Some error string'", formatted)
+
+
+class SaltReturnAssertsMixInTestCase(TestCase, SaltReturnAssertsMixIn):
+
+    def test_assert_all_salt_true_return(self):
+        self.assertAllSaltTrueReturn({'a': {'result': True, 'changes': {}}})
+        with self.assertRaises(AssertionError):
+            self.assertAllSaltTrueReturn(HIGHSTATE_RETURN)
+
+    def test_assert_no_salt_state_changes(self):
+        self.assertNoSaltStateChanges({'a': {'result': True, 'changes': {}}})
+        with self.assertRaises(AssertionError):
+            self.assertNoSaltStateChanges(HIGHSTATE_RETURN)
+
+    def test_assert_salt_failing_state_ids(self):
+        expected = ['file_|-b_|-/b_|-managed', 'cmd_|-d_|-d_|-run', 'bogus']
+        self.assertSaltFailingStateIds(HIGHSTATE_RETURN, expected)
+        self.assertSaltFailingStateIds(HIGHSTATE_RETURN, set(expected))
+        self.assertSaltFailingStateIds(HIGHSTATE_RETURN, (state_id for state_id in expected))
+        with self.assertRaises(AssertionError):
+            self.assertSaltFailingStateIds(HIGHSTATE_RETURN, expected[:1])
+
+    def test_view_reflects_changes(self):
+        ret = {'a': {'result': False, 'comment': 'nope'}}
+        self.assertSaltFalseReturn(ret)
+        ret['a']['result'] = True
+        self.assertSaltTrueReturn(ret)
+
+    def test_indexed_once(self):
+        ret = {'a': {'result': True, 'comment': 'ok'}}
+        view = self.get_salt_state_return(ret)
+        self.assertIs(view.summary, view.summary)
+        self.assertEqual(view.summary.ids, ['a'])
+
+    def test_reindexed_when_states_change(self):
+        ret = {'a': {'result': True}}
+        view = self.get_salt_state_return(ret)
+        summary = view.summary
+        ret['b'] = {'result': False}
+        self.assertIsNot(view.summary, summary)
+        self.assertEqual(sorted(view.summary.ids), ['a', 'b'])
+        # Changed in place, only seen once invalidated
+        ret['a']['result'] = False
+        self.assertEqual(len(view.summary.failing_ids()), 1)
+        view.invalidate()
+        self.assertEqual(len(view.summary.failing_ids()), 2)
+
+    def test_cache_is_cleared(self):
+        ret = {'a': {'result': True}}
+        self.assertIs(self.get_salt_state_return(ret), self.get_salt_state_return(ret))
+        self.doCleanups()
+        self.assertNotIn('_salt_state_returns_cache', self.__dict__)
+
+
+class CopyOnWriteDictTestCase(TestCase):
+
+    def setUp(self):
+        self.source = {'id': 'minion', 'list': [1, 2], 'nested': {'a': {'b': 1}}}
+
+    def test_reads_do_not_copy_immutable_values(self):
+        cow = CopyOnWriteDict(self.source)
+        self.assertEqual(cow['id'], 'minion')
+        self.assertEqual(cow.mutated, frozenset())
+
+    def test_in_place_changes_do_not_reach_the_source(self):
+        cow = CopyOnWriteDict(self.source)
+        cow['list'].append(3)
+        cow['nested']['a']['b'] = 2
+        self.assertEqual(self.source['list'], [1, 2])
+        self.assertEqual(self.source['nested'], {'a': {'b': 1}})
+        self.assertEqual(cow['list'], [1, 2, 3])
+        self.assertEqual(cow.mutated, frozenset(['list', 'nested']))
+
+    def test_untouched_values_are_shared(self):
+        cow = CopyOnWriteDict(self.source)
+        cow['list'].append(3)
+        self.assertIs(dict.__getitem__(cow, 'nested'), self.source['nested'])
+
+    def test_set_delete_and_pop(self):
+        cow = CopyOnWriteDict(self.source)
+        cow['new'] = True
+        del cow['id']
+        self.assertEqual(cow.pop('list'), [1, 2])
+        self.assertNotIn('id', cow)
+        self.assertNotIn('list', cow)
+        self.assertIn('id', self.source)
+        self.assertEqual(cow.mutated, frozenset(['new', 'id', 'list']))
+
+    def test_views_are_copies(self):
+        cow = CopyOnWriteDict(self.source)
+        for value in cow.values():
+            if isinstance(value, list):
+                value.append(3)
+        self.assertEqual(self.source['list'], [1, 2])
+        copied = cow.copy()
+        copied['nested']['a']['b'] = 3
+        self.assertEqual(self.source['nested']['a']['b'], 1)
+
+    def test_copies_do_not_share_nested_values(self):
+        cow = CopyOnWriteDict(self.source)
+        cow['list'].append(3)
+        for copied in (cow.copy(), copy.copy(cow), copy.deepcopy(cow)):
+            self.assertNotIsInstance(copied, CopyOnWriteDict)
+            copied['list'].append(4)
+            copied['nested']['a']['b'] = 2
+        self.assertEqual(cow['list'], [1, 2, 3])
+        self.assertEqual(self.source, {'id': 'minion', 'list': [1, 2], 'nested': {'a': {'b': 1}}})
+
+    @skipIf(six.PY2, 'Python 2 reads the stored values directly')
+    def test_dict_and_keyword_expansion_do_not_share_nested_values(self):
+        cow = CopyOnWriteDict(self.source)
+        dict(cow)['list'].append(3)
+        (lambda **kwargs: kwargs)(**cow)['nested']['a']['b'] = 2
+        other = {}
+        other.update(cow)
+        other['list'].append(4)
+        self.assertEqual(self.source, {'id': 'minion', 'list': [1, 2], 'nested': {'a': {'b': 1}}})
+
+    def test_can_copy_on_write(self):
+        self.assertTrue(can_copy_on_write({'id': 'minion', 'port': 4506}))
+        self.assertEqual(can_copy_on_write(self.source), six.PY3)
+
+    def test_reset(self):
+        cow = CopyOnWriteDict(self.source)
+        cow['list'].append(3)
+        cow['new'] = True
+        del cow['id']
+        cow.reset()
+        self.assertEqual(cow, self.source)
+        self.assertEqual(cow.mutated, frozenset())
+        # Restored values are copied on access again
+        cow['list'].append(4)
+        self.assertEqual(self.source['list'], [1, 2])
+
+
+FAKE_LOADER_MODULE = types.ModuleType('salttesting_fake_loader_module')
+sys.modules[FAKE_LOADER_MODULE.__name__] = FAKE_LOADER_MODULE
+
+
+class LoaderModuleMethodFixtureTestCase(TestCase, LoaderModuleMockMixin):
+
+    loader_module = FAKE_LOADER_MODULE
+
+    def loader_module_globals(self):
+        return {'__opts__': {'id': self.id()}}
+
+    def test_method_fixture(self):
+        self.assertEqual(FAKE_LOADER_MODULE.__opts__, {'id': self.id()})
+        self.assertEqual(FAKE_LOADER_MODULE.__salt__, {})
+
+
+class LoaderModuleClassScopedTestCase(TestCase, LoaderModuleMockMixin):
+
+    loader_module = FAKE_LOADER_MODULE
+    loader_module_class_scoped = True
+    loader_module_globals = {'__opts__': {'list': [1]}}
+
+    def test_a_change(self):
+        FAKE_LOADER_MODULE.__opts__['list'].append(2)
+        FAKE_LOADER_MODULE.__salt__['test.ping'] = True
+
+    def test_b_restored(self):
+        self.assertEqual(FAKE_LOADER_MODULE.__opts__['list'], [1])
+        self.assertEqual(FAKE_LOADER_MODULE.__salt__, {})
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_profiler
+    ~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+# Import salt testing libs
+from salttesting import TestCase, skipIf
+from salttesting.profiler import TestResourcesProfiler, HAS_PSUTIL
+
+
+class _FakeTest(object):
+
+    def __init__(self, test_id):
+        self.test_id = test_id
+
+    def id(self):
+        return self.test_id
+
+
+class TestResourcesProfilerTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.report_path = os.path.join(self.tmpdir, 'resources.json')
+        self.profiler = TestResourcesProfiler(self.report_path, rss_interval=0.005)
+
+    def tearDown(self):
+        # Stops the RSS sampling thread
+        self.profiler.stop_test_run(None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_sample_every(self):
+        profiler = TestResourcesProfiler(self.report_path, sample_every=2)
+        for idx in range(3):
+            test = _FakeTest('test_{0}'.format(idx))
+            profiler.start_test(test)
+            profiler.stop_test(test, 'passed')
+        profiler.stop_test_run(None)
+        self.assertEqual([record['sampled'] for record in profiler.records], [True, False, True])
+        self.assertNotIn('peak_rss', profiler.records[1])
+        self.assertEqual(profiler.get_summary()['sampled'], 2)
+
+    def test_peak_rss_is_sampled_during_the_test(self):
+        test = _FakeTest('test_big')
+        self.profiler.start_test(test)
+        size = 64 * 1024 * 1024
+        chunk = b'x' * size
+        time.sleep(0.2)
+        del chunk
+        self.profiler.stop_test(test, 'passed')
+        record = self.profiler.records[0]
+        if record['peak_rss'] is None:
+            self.skipTest('The RSS can\'t be read on this platform')
+        # The allocation was freed before the test ended, only the sampling
+        # during the test sees it
+        self.assertGreater(record['peak_rss_growth'], size // 2)
+
+    def test_peak_rss_is_per_test(self):
+        big, small = _FakeTest('test_big'), _FakeTest('test_small')
+        self.profiler.start_test(big)
+        chunk = b'x' * (64 * 1024 * 1024)
+        time.sleep(0.2)
+        del chunk
+        self.profiler.stop_test(big, 'passed')
+        self.profiler.start_test(small)
+        self.profiler.stop_test(small, 'passed')
+        big_record, small_record = self.profiler.records
+        if big_record['peak_rss'] is None:
+            self.skipTest('The RSS can\'t be read on this platform')
+        self.assertLess(small_record['peak_rss_growth'], big_record['peak_rss_growth'])
+        self.assertEqual(self.profiler.get_summary()['max_peak_rss_growth'], big_record['peak_rss_growth'])
+
+    @skipIf(not HAS_PSUTIL, 'psutil is needed to find the child processes')
+    def test_leftover_children(self):
+        test = _FakeTest('test_leaks')
+        self.profiler.start_test(test)
+        proc = subprocess.Popen(['sleep', '30'])
+        try:
+            self.profiler.stop_test(test, 'passed')
+        finally:
+            proc.kill()
+            proc.wait()
+        record = self.profiler.records[0]
+        self.assertEqual([child['pid'] for child in record['leftover_children']], [proc.pid])
+        self.assertEqual(self.profiler.get_summary()['leftover_children'], 1)
+
+    def test_report(self):
+        test = _FakeTest('test_report')
+        self.profiler.start_test(test)
+        self.profiler.stop_test(test, 'failure', reason='Boom')
+        self.profiler.stop_test_run(None)
+        with open(self.report_path) as rfh:
+            report = json.load(rfh)
+        self.assertEqual(report['sample_every'], 1)
+        self.assertEqual(report['summary']['tests'], 1)
+        self.assertEqual(report['tests'][0]['id'], 'test_report')
+        self.assertEqual(report['tests'][0]['outcome'], 'failure')
+        self.assertIn('num_fds', report['tests'][0])
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_reporters
+    ~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import os
+import json
+import shutil
+import logging
+import tempfile
+
+# Import salt testing libs
+from salttesting import TestCase
+from salttesting.reporters import JSONLinesReporter, ProgressReporter
+
+# Import 3rd-party libs
+import six
+
+log = logging.getLogger(__name__)
+
+
+class _FakeTest(object):
+
+    def __init__(self, test_id):
+        self.test_id = test_id
+
+    def id(self):
+        return self.test_id
+
+
+class _FakeResult(object):
+    testsRun = 2
+    failures = [None]
+    errors = []
+    skipped = []
+
+
+class JSONLinesReporterTestCase(TestCase):
+
+    def _get_records(self, stream):
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_records(self):
+        stream = six.StringIO()
+        reporter = JSONLinesReporter(stream, log_excerpt_size=5)
+        reporter.start_test_run(_FakeResult())
+        reporter.start_test(_FakeTest('a'))
+        log.warning('From test a')
+        reporter.stop_test(_FakeTest('a'), 'passed')
+        reporter.start_test(_FakeTest('b'))
+        log.warning('From test b')
+        reporter.stop_test(_FakeTest('b'), 'failure', reason='Boom')
+        reporter.stop_test_run(_FakeResult())
+        reporter.close()
+
+        records = self._get_records(stream)
+        self.assertEqual(
+            [record['event'] for record in records],
+            ['start-run', 'start', 'stop', 'start', 'stop', 'stop-run']
+        )
+        for record in records:
+            self.assertEqual(record['worker'], reporter.worker_id)
+            self.assertIn('time', record)
+
+        passed, failure = records[2], records[4]
+        self.assertEqual(passed['id'], 'a')
+        self.assertEqual(passed['outcome'], 'passed')
+        # Only the tests which did not pass get the log excerpt
+        self.assertNotIn('log', passed)
+        self.assertEqual(failure['id'], 'b')
+        self.assertEqual(failure['reason'], 'Boom')
+        self.assertEqual(len(failure['log']), 1)
+        self.assertIn('From test b', failure['log'][0])
+
+        self.assertEqual(records[-1]['tests_run'], 2)
+        self.assertEqual(records[-1]['failures'], 1)
+        # The log handler is gone once the run stops
+        self.assertFalse([
+            handler for handler in logging.root.handlers
+            if handler.__class__.__name__ == '_LogExcerptHandler'
+        ])
+
+    def test_log_excerpt_always(self):
+        stream = six.StringIO()
+        reporter = JSONLinesReporter(stream, log_excerpt_size=5, log_excerpt_always=True)
+        reporter.start_test_run(_FakeResult())
+        reporter.start_test(_FakeTest('a'))
+        log.warning('From test a')
+        reporter.stop_test(_FakeTest('a'), 'passed')
+        reporter.stop_test_run(_FakeResult())
+        self.assertEqual(len(self._get_records(stream)[2]['log']), 1)
+
+    def test_path_is_closed_when_the_run_stops(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        path = os.path.join(tmpdir, 'results', 'stream.jsonl')
+        reporter = JSONLinesReporter(path, log_excerpt_size=0)
+        for test_id in ('a', 'b'):
+            reporter.start_test_run(_FakeResult())
+            self.assertFalse(reporter.stream.closed)
+            reporter.start_test(_FakeTest(test_id))
+            reporter.stop_test(_FakeTest(test_id), 'passed')
+            reporter.stop_test_run(_FakeResult())
+            self.assertIsNone(reporter.stream)
+        with open(path) as rfh:
+            records = [json.loads(line) for line in rfh]
+        # The second run appends to the first one's records
+        self.assertEqual([record.get('id') for record in records if record['event'] == 'stop'], ['a', 'b'])
+
+    def test_no_log_excerpt(self):
+        stream = six.StringIO()
+        reporter = JSONLinesReporter(stream, log_excerpt_size=0)
+        reporter.start_test_run(_FakeResult())
+        reporter.start_test(_FakeTest('a'))
+        reporter.stop_test(_FakeTest('a'), 'error')
+        reporter.stop_test_run(_FakeResult())
+        self.assertNotIn('log', self._get_records(stream)[2])
+
+
+class ProgressReporterTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.durations_file = os.path.join(self.tmpdir, 'durations.json')
+
+    def _run(self, reporter, test_ids, outcome='passed'):
+        for test_id in test_ids:
+            reporter.start_test(_FakeTest(test_id))
+            reporter.stop_test(_FakeTest(test_id), outcome)
+
+    def test_totals_accumulate_across_suites(self):
+        stream = six.StringIO()
+        reporter = ProgressReporter(stream=stream, interval=3600)
+        reporter.start_test_run(_FakeResult())
+        reporter.add_tests([_FakeTest('a'), _FakeTest('b')])
+        self._run(reporter, ['a', 'b'])
+        reporter.stop_test_run(_FakeResult())
+        reporter.add_tests([[_FakeTest('c')], _FakeTest('d')])
+        reporter.start_test_run(_FakeResult())
+        self._run(reporter, ['c'], outcome='failure')
+        self.assertEqual(reporter.total, 4)
+        self.assertEqual(reporter.done, 3)
+        self.assertEqual(reporter.passed, 2)
+        self.assertEqual(reporter.failed, 1)
+        reporter.print_progress()
+        self.assertIn('[ 75%] 3/4', stream.getvalue().splitlines()[-1])
+
+    def test_eta_uses_recorded_durations(self):
+        with open(self.durations_file, 'w') as wfh:
+            json.dump({'a': 10.0, 'b': 20.0}, wfh)
+        reporter = ProgressReporter(
+            tests=[_FakeTest('a'), _FakeTest('b'), _FakeTest('c')],
+            stream=six.StringIO(),
+            durations_file=self.durations_file,
+            interval=3600
+        )
+        reporter.start_test_run(_FakeResult())
+        self.assertIsNone(reporter.get_eta())
+        self._run(reporter, ['a'])
+        # 'b' has a recorded duration, 'c' gets the recorded average
+        self.assertEqual(reporter.get_eta(), 35.0)
+        self._run(reporter, ['b', 'c'])
+        self.assertEqual(reporter.get_eta(), 0.0)
+
+    def test_durations_are_saved(self):
+        reporter = ProgressReporter(
+            tests=[_FakeTest('a'), _FakeTest('b')],
+            stream=six.StringIO(),
+            durations_file=self.durations_file,
+            interval=3600
+        )
+        reporter.start_test_run(_FakeResult())
+        self._run(reporter, ['a'])
+        self._run(reporter, ['b'], outcome='skipped')
+        reporter.stop_test_run(_FakeResult())
+        with open(self.durations_file) as rfh:
+            durations = json.load(rfh)
+        # Skipped tests don't record a duration
+        self.assertEqual(list(durations), ['a'])
+        self.assertEqual(reporter.skipped, 1)
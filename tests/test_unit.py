@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_unit
+    ~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+import logging
+
+# Import salt testing libs
+from salttesting import TestCase
+from salttesting.unit import (
+    TestLoader,
+    TestResultObserver,
+    TextTestRunner,
+    expectedFailure,
+    skipIf
+)
+
+# Import 3rd-party libs
+import six
+
+
+class _RecordingObserver(TestResultObserver):
+
+    def __init__(self):
+        self.calls = []
+
+    def start_test_run(self, result):
+        self.calls.append(('start_test_run',))
+
+    def start_test(self, test):
+        self.calls.append(('start_test', test._testMethodName))
+
+    def stop_test(self, test, outcome, reason=None):
+        self.calls.append(('stop_test', test._testMethodName, outcome, reason))
+
+    def stop_test_run(self, result):
+        self.calls.append(('stop_test_run',))
+
+
+class _BrokenObserver(TestResultObserver):
+
+    def start_test(self, test):
+        raise RuntimeError('Broken observer')
+
+
+def _get_observed_test_case():
+    # Defined in a function so that the test loader doesn't collect it
+    class ObservedTestCase(TestCase):
+
+        def test_a_passes(self):
+            pass
+
+        def test_b_fails(self):
+            self.fail('Boom')
+
+        def test_c_errors(self):
+            raise RuntimeError('Bang')
+
+        @skipIf(True, 'Not today')
+        def test_d_skipped(self):
+            pass
+
+        @expectedFailure
+        def test_e_expected_failure(self):
+            self.fail('Expected')
+
+        @expectedFailure
+        def test_f_unexpected_success(self):
+            pass
+
+    return ObservedTestCase
+
+
+class ObservableTestResultMixInTestCase(TestCase):
+
+    def _run(self, *observers):
+        suite = TestLoader().loadTestsFromTestCase(_get_observed_test_case())
+        runner = TextTestRunner(stream=six.StringIO(), verbosity=0, observers=observers)
+        return runner.run(suite)
+
+    def test_outcomes(self):
+        observer = _RecordingObserver()
+        self._run(observer)
+        self.assertEqual(observer.calls[0], ('start_test_run',))
+        self.assertEqual(observer.calls[-1], ('stop_test_run',))
+        stops = [call for call in observer.calls if call[0] == 'stop_test']
+        self.assertEqual(
+            [(call[1], call[2]) for call in stops],
+            [('test_a_passes', 'passed'),
+             ('test_b_fails', 'failure'),
+             ('test_c_errors', 'error'),
+             ('test_d_skipped', 'skipped'),
+             ('test_e_expected_failure', 'expected-failure'),
+             ('test_f_unexpected_success', 'unexpected-success')]
+        )
+        self.assertIsNone(stops[0][3])
+        self.assertIn('Boom', stops[1][3])
+        self.assertIn('Bang', stops[2][3])
+        self.assertEqual(stops[3][3], 'Not today')
+
+    def test_start_and_stop_test_are_paired(self):
+        observer = _RecordingObserver()
+        self._run(observer)
+        names = [call[1] for call in observer.calls[1:-1]]
+        self.assertEqual(names[::2], names[1::2])
+        self.assertEqual([call[0] for call in observer.calls[1:-1:2]], ['start_test'] * 6)
+
+    def test_broken_observer_does_not_break_the_run(self):
+        observer = _RecordingObserver()
+        logging.getLogger('salttesting.unit').disabled = True
+        try:
+            result = self._run(_BrokenObserver(), observer)
+        finally:
+            logging.getLogger('salttesting.unit').disabled = False
+        self.assertEqual(result.testsRun, 6)
+        self.assertEqual(len([call for call in observer.calls if call[0] == 'stop_test']), 6)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+'''
+    :codeauthor: :email:`Pedro Algarvio (pedro@algarvio.me)`
+    :copyright: © 2017 by the SaltStack Team, see AUTHORS for more details.
+    :license: Apache 2.0, see LICENSE for more details.
+
+
+    tests.test_xmlunit
+    ~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+from __future__ import absolute_import
+
+# Import salt testing libs
+from salttesting import TestCase, skipIf
+from salttesting import xmlunit
+
+
+class _LegacyTestInfo(object):
+    '''
+    Mimics the ``_TestInfo`` class of the xmlrunner releases which don't
+    define ``OUTCOME_ELEMENTS``
+    '''
+    (SUCCESS, FAILURE, ERROR, SKIP) = range(4)
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+
+@skipIf(xmlunit.HAS_XMLRUNNER is False, 'xmlrunner is not installed')
+class OutcomeElementTestCase(TestCase):
+
+    def test_outcome_elements(self):
+        info_class = xmlunit.xmlrunner.result._TestInfo
+        get_outcome_element = xmlunit._XMLTestResult._get_outcome_element
+        for test_info_class in (info_class, _LegacyTestInfo):
+            expected = {
+                test_info_class.SUCCESS: None,
+                test_info_class.FAILURE: 'failure',
+                test_info_class.ERROR: 'error',
+                test_info_class.SKIP: 'skipped'
+            }
+            for outcome, element in expected.items():
+                test_info = test_info_class.__new__(test_info_class)
+                test_info.outcome = outcome
+                self.assertEqual(get_outcome_element(test_info), element)
+
+
+class _RecordingStream(object):
+
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+@skipIf(xmlunit.HAS_XMLRUNNER is False, 'xmlrunner is not installed')
+class DelegateIOTestCase(TestCase):
+
+    def test_writes_are_batched(self):
+        delegate = _RecordingStream()
+        stream = xmlunit._DelegateIO(delegate)
+        stream.write('first line\n')
+        stream.write('partial')
+        # Neither complete lines nor the tests flushing force a batch out
+        stream.flush()
+        self.assertEqual(delegate.writes, [])
+        self.assertEqual(delegate.flushes, 0)
+        stream.write_batch()
+        self.assertEqual(delegate.writes, ['first line\npartial'])
+        self.assertEqual(delegate.flushes, 1)
+        self.assertEqual(stream.getvalue(), 'first line\npartial')
+        # Nothing buffered, nothing to flush
+        stream.write_batch()
+        self.assertEqual(delegate.flushes, 1)
+
+    def test_batch_size(self):
+        delegate = _RecordingStream()
+        stream = xmlunit._DelegateIO(delegate)
+        stream.batch_size = 10
+        stream.write('12345\n')
+        self.assertEqual(delegate.writes, [])
+        stream.write('67890\n')
+        self.assertEqual(delegate.writes, ['12345\n67890\n'])
+        self.assertEqual(delegate.flushes, 1)
+
+    def test_batch_interval(self):
+        delegate = _RecordingStream()
+        stream = xmlunit._DelegateIO(delegate)
+        stream.batch_interval = 0
+        stream.write('out')
+        self.assertEqual(delegate.writes, ['out'])
+        self.assertEqual(delegate.flushes, 1)
+
+    def test_sibling_writes_keep_the_order(self):
+        stdout, stderr = _RecordingStream(), _RecordingStream()
+        stderr_stream = xmlunit._DelegateIO(stderr)
+        stdout_stream = xmlunit._DelegateIO(stdout, sibling=stderr_stream)
+        stdout_stream.write('out')
+        stderr_stream.write('err')
+        self.assertEqual(stdout.writes, ['out'])
+        self.assertEqual(stderr.writes, [])